@@ -1,6 +1,6 @@
 "use client"
 
-import { useState, useEffect } from "react"
+import { useState, useEffect, useRef } from "react"
 import { Users as UsersIcon, Activity, Database, Users } from "lucide-react"
 
 interface AdminPanelProps {
@@ -13,8 +13,40 @@ interface ServerStats {
   conexiones_activas: number
 }
 
+interface LoadTestProgress {
+  job_id: string
+  segundo: number
+  throughput_rps: number
+  completadas: number
+  rechazadas: number
+  fallos: number
+  p50_us: number
+  p99_us: number
+}
+
+interface LoadTestReport {
+  throughput_rps: number
+  completadas: number
+  rechazadas: number
+  fallos: number
+  latencia_us: { p50: number; p99: number; max: number }
+}
+
+interface LoadTestJob {
+  job_id: string
+  estado: string
+  reporte: LoadTestReport | null
+  error: string | null
+}
+
+// Escenario de la demostración: mezcla por defecto sobre las cuentas de ejemplo
+const DEMO_SCENARIO = { tasa: 100, duracion: 15, conexiones: 8 }
+
 export default function AdminPanel({ cedula }: AdminPanelProps) {
   const [isRunningSimulation, setIsRunningSimulation] = useState(false)
+  const [progress, setProgress] = useState<LoadTestProgress | null>(null)
+  const [finishedJob, setFinishedJob] = useState<LoadTestJob | null>(null)
+  const jobIdRef = useRef<string | null>(null)
   const [stats, setStats] = useState<ServerStats>({
     clientes_activos: 0,
     operaciones_simultaneas: 0,
@@ -63,26 +95,60 @@ export default function AdminPanel({ cedula }: AdminPanelProps) {
     }
   }, [])
 
+  // Progreso y reporte de la prueba de carga lanzada desde este panel
+  useEffect(() => {
+    const handleProgress = (event: CustomEvent) => {
+      const data = event.detail as LoadTestProgress
+      if (data.job_id === jobIdRef.current) {
+        setProgress(data)
+      }
+    }
+
+    const handleFinished = (event: CustomEvent) => {
+      const data = event.detail as LoadTestJob
+      if (data.job_id === jobIdRef.current) {
+        setFinishedJob(data)
+        setIsRunningSimulation(false)
+        jobIdRef.current = null
+      }
+    }
+
+    window.addEventListener("loadtestProgress", handleProgress as EventListener)
+    window.addEventListener("loadtestFinished", handleFinished as EventListener)
+
+    return () => {
+      window.removeEventListener("loadtestProgress", handleProgress as EventListener)
+      window.removeEventListener("loadtestFinished", handleFinished as EventListener)
+    }
+  }, [])
+
   const handleRunSimulation = async () => {
     setIsRunningSimulation(true)
+    setProgress(null)
+    setFinishedJob(null)
     try {
-      // Call API endpoint that will execute socket_client.py
+      // El bridge ejecuta la prueba en segundo plano y emite el progreso por WebSocket
       const response = await fetch("http://localhost:5001/api/simulate", {
         method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(DEMO_SCENARIO),
       })
-      if (response.ok) {
-        alert("Simulación iniciada correctamente. Revisa la consola del servidor.")
+      const data = await response.json()
+      if (response.ok && data.success) {
+        jobIdRef.current = data.job.job_id
       } else {
-        alert("Error al iniciar la simulación")
+        alert(data.error || "Error al iniciar la simulación")
+        setIsRunningSimulation(false)
       }
     } catch (error) {
       console.error("Error running simulation:", error)
       alert("Error al conectar con el servidor")
-    } finally {
       setIsRunningSimulation(false)
     }
   }
 
+  const ms = (us: number) => (us / 1000).toFixed(2)
+
   return (
     <div className="mt-8 space-y-4">
       {/* Admin Title */}
@@ -140,6 +206,44 @@ export default function AdminPanel({ cedula }: AdminPanelProps) {
         </div>
         <span className="text-white text-lg">▶</span>
       </button>
+
+      {/* Live load-test progress */}
+      {isRunningSimulation && progress && (
+        <div className="bg-slate-800/50 backdrop-blur-sm rounded-xl p-5 border border-slate-700 shadow-lg grid grid-cols-4 gap-4 text-center">
+          <div>
+            <p className="text-xs text-slate-400 uppercase tracking-wide">Segundo</p>
+            <p className="text-xl font-bold text-white mt-1">{progress.segundo}</p>
+          </div>
+          <div>
+            <p className="text-xs text-slate-400 uppercase tracking-wide">Ops/s</p>
+            <p className="text-xl font-bold text-white mt-1">{progress.throughput_rps}</p>
+          </div>
+          <div>
+            <p className="text-xs text-slate-400 uppercase tracking-wide">p50</p>
+            <p className="text-xl font-bold text-white mt-1">{ms(progress.p50_us)} ms</p>
+          </div>
+          <div>
+            <p className="text-xs text-slate-400 uppercase tracking-wide">p99</p>
+            <p className="text-xl font-bold text-white mt-1">{ms(progress.p99_us)} ms</p>
+          </div>
+        </div>
+      )}
+
+      {/* Final report */}
+      {finishedJob && (
+        <div className="bg-slate-800/50 backdrop-blur-sm rounded-xl p-5 border border-slate-700 shadow-lg text-sm text-slate-300">
+          {finishedJob.reporte ? (
+            <p>
+              Prueba {finishedJob.estado}: {finishedJob.reporte.completadas} operaciones a{" "}
+              {finishedJob.reporte.throughput_rps} ops/s · p50 {ms(finishedJob.reporte.latencia_us.p50)} ms · p99{" "}
+              {ms(finishedJob.reporte.latencia_us.p99)} ms · rechazadas {finishedJob.reporte.rechazadas} · fallos{" "}
+              {finishedJob.reporte.fallos}
+            </p>
+          ) : (
+            <p>Prueba {finishedJob.estado}: {finishedJob.error}</p>
+          )}
+        </div>
+      )}
     </div>
   )
 }
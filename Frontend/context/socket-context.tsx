@@ -14,11 +14,28 @@ interface SocketContextType {
 
 const SocketContext = createContext<SocketContextType | undefined>(undefined)
 
+// Historial por cédula armado a partir de transactions_resync / transactions_delta
+const HISTORY_LIMIT = 10
+
+interface HistoryTransaction {
+  id: number
+  tipo: string
+  monto: number
+  saldo_final: number
+  fecha: string
+}
+
+interface HistoryState {
+  lastId: number
+  transactions: HistoryTransaction[]
+}
+
 export function SocketProvider({ children }: { children: React.ReactNode }) {
   const [isLoading, setIsLoading] = useState(false)
   const [isConnected, setIsConnected] = useState(false)
   const [isMounted, setIsMounted] = useState(false)
   const socketRef = useRef<Socket | null>(null)
+  const historyRef = useRef<Map<string, HistoryState>>(new Map())
 
   // Evitar hidratación mismatch - solo inicializar después del montaje
   useEffect(() => {
@@ -54,9 +71,33 @@ export function SocketProvider({ children }: { children: React.ReactNode }) {
       window.dispatchEvent(new CustomEvent("balanceUpdate", { detail: data }))
     })
 
-    newSocket.on("transactions_updated", (data: { cedula: string; transactions: unknown[] }) => {
-      console.log("📜 Transacciones actualizadas:", data)
-      window.dispatchEvent(new CustomEvent("transactionsUpdate", { detail: data }))
+    const publishHistory = (cedula: string, state: HistoryState) => {
+      historyRef.current.set(cedula, state)
+      window.dispatchEvent(new CustomEvent("transactionsUpdate", {
+        detail: { cedula, transactions: state.transactions }
+      }))
+    }
+
+    newSocket.on("transactions_resync", (data: { cedula: string; ultimo_id: number; transactions: HistoryTransaction[] }) => {
+      console.log("📜 Historial completo:", data.cedula, data.transactions.length)
+      publishHistory(data.cedula, { lastId: data.ultimo_id, transactions: data.transactions })
+    })
+
+    newSocket.on("transactions_delta", (data: { cedula: string; desde_id: number; ultimo_id: number; transactions: HistoryTransaction[] }) => {
+      const current = historyRef.current.get(data.cedula)
+      if (current && data.ultimo_id <= current.lastId) {
+        return // Ya recibido
+      }
+      if (!current || current.lastId !== data.desde_id) {
+        // Falta un tramo: pedir la lista completa
+        newSocket.emit("resync_transactions", { cedula: data.cedula })
+        return
+      }
+      console.log("📜 Transacciones nuevas:", data.cedula, data.transactions.length)
+      publishHistory(data.cedula, {
+        lastId: data.ultimo_id,
+        transactions: [...data.transactions, ...current.transactions].slice(0, HISTORY_LIMIT)
+      })
     })
 
     newSocket.on("stats_updated", (data: unknown) => {
@@ -64,6 +105,16 @@ export function SocketProvider({ children }: { children: React.ReactNode }) {
       window.dispatchEvent(new CustomEvent("statsUpdate", { detail: data }))
     })
 
+    // Pruebas de carga lanzadas desde el panel de administración
+    newSocket.on("loadtest_progress", (data: unknown) => {
+      window.dispatchEvent(new CustomEvent("loadtestProgress", { detail: data }))
+    })
+
+    newSocket.on("loadtest_finished", (data: unknown) => {
+      console.log("🏁 Prueba de carga terminada:", data)
+      window.dispatchEvent(new CustomEvent("loadtestFinished", { detail: data }))
+    })
+
     socketRef.current = newSocket
 
     return () => {
@@ -74,7 +125,9 @@ export function SocketProvider({ children }: { children: React.ReactNode }) {
   const subscribeToBalance = useCallback((cedula: string) => {
     if (socketRef.current && socketRef.current.connected) {
       console.log("📡 Suscribiéndose a actualizaciones para:", cedula)
-      socketRef.current.emit('subscribe_balance', { cedula })
+      // Al re-suscribirse basta con lo que falte desde la última transacción conocida
+      const known = historyRef.current.get(cedula)
+      socketRef.current.emit('subscribe_balance', known ? { cedula, ultimo_id: known.lastId } : { cedula })
     }
   }, [])
 
@@ -0,0 +1,508 @@
+"""
+Generador de Carga de Lazo Abierto - Sistema Bancario Distribuido
+Mide latencia del protocolo socket sin omisión coordinada
+
+- Tasa objetivo fija: las peticiones se programan en el tiempo, no esperan a la anterior
+- Latencia medida desde el instante programado (incluye el tiempo en cola)
+- Conexiones persistentes (un BIENVENIDO por conexión, no por comando)
+- Mezcla de comandos configurable y sesgo de cuentas Zipf
+- Histogramas tipo HDR con p50/p90/p99/p99.9 y salida JSON
+"""
+
+import bisect
+import json
+import logging
+import queue
+import random
+import socket
+import threading
+import time
+from datetime import datetime
+
+
+# Cuentas de ejemplo creadas por db_setup.py
+CUENTAS_EJEMPLO = ['1315151515', '1720304050', '0987654321', '1104567890', '0912345678', '1350509525']
+
+MEZCLA_POR_DEFECTO = 'CONSULTA:70,AUMENTAR:15,DISMINUIR:10,TRANSFERIR:5'
+
+
+class LatencyHistogram:
+    """
+    Histograma log-lineal de latencias en microsegundos (estilo HDR)
+
+    Cada potencia de 2 se divide en SUB_BUCKETS/2 sub-buckets, lo que da un
+    error relativo máximo de ~1.6% con memoria acotada por el rango de valores.
+    """
+
+    SUB_BITS = 7
+    SUB_BUCKETS = 1 << SUB_BITS
+    MEDIO = SUB_BUCKETS // 2
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self.suma = 0
+        self.minimo = None
+        self.maximo = 0
+
+    @classmethod
+    def _indice(cls, valor):
+        magnitud = max(valor.bit_length() - cls.SUB_BITS, 0)
+        return magnitud * cls.MEDIO + (valor >> magnitud)
+
+    @classmethod
+    def _valor(cls, indice):
+        """Mayor valor equivalente del bucket (estimación conservadora)"""
+        if indice < cls.SUB_BUCKETS:
+            return indice
+        magnitud = indice // cls.MEDIO - 1
+        sub = indice - magnitud * cls.MEDIO
+        return ((sub + 1) << magnitud) - 1
+
+    def record(self, valor_us):
+        """Registra una latencia en microsegundos"""
+        valor = max(int(valor_us), 0)
+        indice = self._indice(valor)
+        self.counts[indice] = self.counts.get(indice, 0) + 1
+        self.total += 1
+        self.suma += valor
+        if self.minimo is None or valor < self.minimo:
+            self.minimo = valor
+        if valor > self.maximo:
+            self.maximo = valor
+
+    def merge(self, otro):
+        """Acumula otro histograma en este"""
+        for indice, n in otro.counts.items():
+            self.counts[indice] = self.counts.get(indice, 0) + n
+        self.total += otro.total
+        self.suma += otro.suma
+        if otro.minimo is not None and (self.minimo is None or otro.minimo < self.minimo):
+            self.minimo = otro.minimo
+        self.maximo = max(self.maximo, otro.maximo)
+
+    def percentile(self, p):
+        """Valor en el percentil p (0-100)"""
+        if not self.total:
+            return 0
+        objetivo = max(int(round(p / 100.0 * self.total)), 1)
+        acumulado = 0
+        for indice in sorted(self.counts):
+            acumulado += self.counts[indice]
+            if acumulado >= objetivo:
+                return min(self._valor(indice), self.maximo)
+        return self.maximo
+
+    def summary(self):
+        """Resumen serializable a JSON (valores en microsegundos)"""
+        return {
+            'count': self.total,
+            'min': self.minimo or 0,
+            'mean': round(self.suma / self.total, 1) if self.total else 0,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'p99_9': self.percentile(99.9),
+            'max': self.maximo,
+        }
+
+    def to_dict(self):
+        """Histograma completo (para guardar y combinar después)"""
+        return {'counts': {str(k): v for k, v in self.counts.items()}, 'suma': self.suma, **self.summary()}
+
+    @classmethod
+    def from_dict(cls, data):
+        hist = cls()
+        for indice, n in data.get('counts', {}).items():
+            hist.counts[int(indice)] = n
+        hist.total = data.get('count', 0)
+        # Reportes sin 'suma' (anteriores): se aproxima con la media redondeada
+        hist.suma = data['suma'] if 'suma' in data else int(data.get('mean', 0) * hist.total)
+        hist.minimo = data.get('min') if hist.total else None
+        hist.maximo = data.get('max', 0)
+        return hist
+
+
+class ZipfSampler:
+    """Elige índices 0..n-1 con distribución Zipf de exponente s (s=0 es uniforme)"""
+
+    def __init__(self, n, s=0.0, rnd=None):
+        self.n = n
+        self.s = s
+        self.rnd = rnd or random.Random()
+        self.cdf = None
+        if s > 0:
+            acumulado = 0.0
+            self.cdf = []
+            for rango in range(1, n + 1):
+                acumulado += 1.0 / (rango ** s)
+                self.cdf.append(acumulado)
+
+    def sample(self):
+        if self.cdf is None:
+            return self.rnd.randrange(self.n)
+        return min(bisect.bisect_left(self.cdf, self.rnd.random() * self.cdf[-1]), self.n - 1)
+
+
+def parsear_mezcla(texto):
+    """Convierte 'CONSULTA:70,AUMENTAR:30' en [('CONSULTA', 70.0), ('AUMENTAR', 30.0)]"""
+    mezcla = []
+    for parte in texto.split(','):
+        if not parte.strip():
+            continue
+        comando, _, peso = parte.partition(':')
+        mezcla.append((comando.strip().upper(), float(peso or 1)))
+    if not mezcla:
+        raise ValueError("La mezcla de comandos está vacía")
+    return mezcla
+
+
+class CommandGenerator:
+    """Genera comandos del protocolo socket según una mezcla y un muestreador de cuentas"""
+
+    def __init__(self, mezcla, cuentas, zipf_s=0.0, semilla=None, monto_min=1.0, monto_max=100.0):
+        self.rnd = random.Random(semilla)
+        self.comandos = [c for c, _ in mezcla]
+        self.pesos_acumulados = []
+        acumulado = 0.0
+        for _, peso in mezcla:
+            acumulado += peso
+            self.pesos_acumulados.append(acumulado)
+        self.cuentas = cuentas
+        self.sampler = ZipfSampler(len(cuentas), zipf_s, self.rnd)
+        self.monto_min = monto_min
+        self.monto_max = monto_max
+
+    def _cuenta(self):
+        return self.cuentas[self.sampler.sample()]
+
+    def _monto(self):
+        return round(self.rnd.uniform(self.monto_min, self.monto_max), 2)
+
+    def next(self):
+        """Retorna (nombre_comando, texto_comando)"""
+        i = bisect.bisect_left(self.pesos_acumulados, self.rnd.random() * self.pesos_acumulados[-1])
+        comando = self.comandos[min(i, len(self.comandos) - 1)]
+
+        if comando in ('AUMENTAR', 'DISMINUIR'):
+            return comando, f"{comando} {self._cuenta()} {self._monto():.2f}"
+        if comando == 'TRANSFERIR':
+            origen = self._cuenta()
+            destino = self._cuenta()
+            if destino == origen and len(self.cuentas) > 1:
+                destino = self.cuentas[(self.cuentas.index(origen) + 1) % len(self.cuentas)]
+            return comando, f"TRANSFERIR {origen} {destino} {self._monto():.2f}"
+        if comando in ('STATS', 'PING'):
+            return comando, comando
+        return comando, f"{comando} {self._cuenta()}"
+
+
+class SocketConnection:
+    """Conexión persistente al servidor socket (lee el BIENVENIDO una sola vez)"""
+
+    def __init__(self, host, port, timeout=10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.lector = None
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.lector = self.sock.makefile('rb')
+        self.lector.readline()  # BIENVENIDO
+
+    def send_command(self, comando):
+        """Envía un comando y retorna la respuesta; reconecta si la conexión no existe"""
+        if self.sock is None:
+            self.connect()
+        try:
+            self.sock.sendall(comando.encode('utf-8'))
+            respuesta = self.lector.readline()  # Una línea por respuesta
+            if not respuesta:
+                raise ConnectionError("Conexión cerrada por el servidor")
+            return respuesta.decode('utf-8').rstrip('\n')
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        if self.sock:
+            try:
+                self.lector.close()
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+
+class ResultRecorder:
+    """Acumula latencias y contadores por comando (thread-safe)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total = LatencyHistogram()
+        self.por_comando = {}
+        self.intervalo = LatencyHistogram()
+        self.completadas = 0
+        self.rechazadas = 0  # ERROR|... del servidor (saldo insuficiente, etc.)
+        self.fallos = 0      # Errores de red / timeout
+
+    def record(self, comando, latencia_us, respuesta=None, fallo=False):
+        with self.lock:
+            if fallo:
+                self.fallos += 1
+                return
+            self.completadas += 1
+            if respuesta is not None and respuesta.startswith('ERROR'):
+                self.rechazadas += 1
+            self.total.record(latencia_us)
+            self.intervalo.record(latencia_us)
+            hist = self.por_comando.get(comando)
+            if hist is None:
+                hist = self.por_comando[comando] = LatencyHistogram()
+            hist.record(latencia_us)
+
+    def tomar_intervalo(self):
+        """Retorna y reinicia el histograma del intervalo actual"""
+        with self.lock:
+            intervalo = self.intervalo
+            self.intervalo = LatencyHistogram()
+            return intervalo
+
+
+class OpenLoopLoadGenerator:
+    """
+    Generador de carga de lazo abierto sobre el protocolo socket
+
+    Un hilo despachador programa la petición i en inicio + i/tasa y la deja en
+    una cola; los workers (uno por conexión persistente) la envían en cuanto
+    pueden. La latencia se mide desde el instante programado, de modo que si el
+    servidor se atrasa la espera en cola aparece en los percentiles.
+    """
+
+    def __init__(self, host='localhost', port=5000, tasa=100, duracion=10, conexiones=8,
+                 mezcla=MEZCLA_POR_DEFECTO, cuentas=None, zipf_s=0.0, semilla=None,
+                 calentamiento=0, max_pendientes=100_000, on_progress=None, stop_event=None,
+                 on_response=None):
+        """
+        Args:
+            tasa: peticiones por segundo objetivo
+            duracion: segundos de medición (sin contar calentamiento)
+            conexiones: conexiones persistentes / workers
+            mezcla: texto 'CMD:peso,...' o lista de tuplas
+            cuentas: lista de cédulas sobre las que operar
+            zipf_s: exponente Zipf del sesgo de cuentas (0 = uniforme)
+            calentamiento: segundos iniciales que no se registran
+            max_pendientes: peticiones en cola antes de descartar (memoria acotada)
+            on_progress: callback(dict) llamado cada segundo con métricas del intervalo
+            stop_event: threading.Event para cancelar la ejecución
+            on_response: callback(comando, respuesta) por cada respuesta recibida
+        """
+        self.host = host
+        self.port = port
+        self.tasa = tasa
+        self.duracion = duracion
+        self.conexiones = conexiones
+        self.mezcla = parsear_mezcla(mezcla) if isinstance(mezcla, str) else list(mezcla)
+        self.cuentas = cuentas or CUENTAS_EJEMPLO
+        self.zipf_s = zipf_s
+        self.semilla = semilla
+        self.calentamiento = calentamiento
+        self.max_pendientes = max_pendientes
+        self.on_progress = on_progress
+        self.stop_event = stop_event or threading.Event()
+        self.on_response = on_response
+
+        self.recorder = ResultRecorder()
+        self.enviadas = 0
+        self.descartadas = 0
+
+    def _worker(self, cola, medir_desde):
+        conexion = SocketConnection(self.host, self.port)
+        try:
+            while True:
+                item = cola.get()
+                if item is None:
+                    break
+                programado, nombre, comando = item
+                try:
+                    respuesta = conexion.send_command(comando)
+                    fin = time.perf_counter()
+                    if programado >= medir_desde:
+                        self.recorder.record(nombre, (fin - programado) * 1e6, respuesta)
+                    if self.on_response:
+                        self.on_response(comando, respuesta)
+                except Exception as e:
+                    logging.debug(f"Fallo enviando '{comando}': {e}")
+                    if programado >= medir_desde:
+                        self.recorder.record(nombre, 0, fallo=True)
+                    if self.on_response:
+                        self.on_response(comando, None)
+        finally:
+            conexion.close()
+
+    def _reportar(self, segundo, ultimo_completadas):
+        intervalo = self.recorder.tomar_intervalo()
+        completadas = self.recorder.completadas
+        progreso = {
+            'segundo': segundo,
+            'enviadas': self.enviadas,
+            'completadas': completadas,
+            'throughput_rps': completadas - ultimo_completadas,
+            'rechazadas': self.recorder.rechazadas,
+            'fallos': self.recorder.fallos,
+            'descartadas': self.descartadas,
+            'p50_us': intervalo.percentile(50),
+            'p99_us': intervalo.percentile(99),
+        }
+        if self.on_progress:
+            try:
+                self.on_progress(progreso)
+            except Exception as e:
+                logging.warning(f"Error en callback de progreso: {e}")
+        return completadas
+
+    def run(self):
+        """Ejecuta la prueba y retorna el reporte (dict serializable a JSON)"""
+        generador = CommandGenerator(self.mezcla, self.cuentas, self.zipf_s, self.semilla)
+        cola = queue.Queue(maxsize=self.max_pendientes)
+        total_peticiones = int(self.tasa * (self.duracion + self.calentamiento))
+        intervalo = 1.0 / self.tasa
+
+        inicio = time.perf_counter()
+        medir_desde = inicio + self.calentamiento
+        workers = [
+            threading.Thread(target=self._worker, args=(cola, medir_desde), daemon=True)
+            for _ in range(self.conexiones)
+        ]
+        for w in workers:
+            w.start()
+
+        proximo_reporte = inicio + 1
+        segundo = 0
+        ultimo_completadas = 0
+        for i in range(total_peticiones):
+            if self.stop_event.is_set():
+                break
+            programado = inicio + i * intervalo
+            ahora = time.perf_counter()
+            if programado > ahora:
+                time.sleep(programado - ahora)
+
+            nombre, comando = generador.next()
+            try:
+                cola.put_nowait((programado, nombre, comando))
+                self.enviadas += 1
+            except queue.Full:
+                self.descartadas += 1
+
+            if time.perf_counter() >= proximo_reporte:
+                segundo += 1
+                proximo_reporte += 1
+                ultimo_completadas = self._reportar(segundo, ultimo_completadas)
+
+        for _ in workers:
+            cola.put(None)
+        for w in workers:
+            w.join()
+
+        fin = time.perf_counter()
+        self._reportar(segundo + 1, ultimo_completadas)
+        return self.reporte(fin - medir_desde)
+
+    def reporte(self, duracion_medida):
+        """Construye el reporte final"""
+        r = self.recorder
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'config': {
+                'host': self.host,
+                'port': self.port,
+                'tasa_objetivo_rps': self.tasa,
+                'duracion_s': self.duracion,
+                'calentamiento_s': self.calentamiento,
+                'conexiones': self.conexiones,
+                'mezcla': dict(self.mezcla),
+                'num_cuentas': len(self.cuentas),
+                'zipf_s': self.zipf_s,
+            },
+            'duracion_medida_s': round(duracion_medida, 3),
+            'enviadas': self.enviadas,
+            'completadas': r.completadas,
+            'rechazadas': r.rechazadas,
+            'fallos': r.fallos,
+            'descartadas': self.descartadas,
+            'throughput_rps': round(r.completadas / duracion_medida, 1) if duracion_medida > 0 else 0,
+            'latencia_us': r.total.summary(),
+            'por_comando': {c: h.summary() for c, h in sorted(r.por_comando.items())},
+        }
+
+
+def cargar_cuentas(args):
+    """Lista de cédulas según los argumentos de la CLI"""
+    if args.archivo_cuentas:
+        with open(args.archivo_cuentas, encoding='utf-8') as f:
+            return [linea.strip() for linea in f if linea.strip()]
+    if args.num_cuentas:
+        # Mismo esquema de cédulas que bulk_loader.py
+        return [f"{args.prefijo}{i:09d}" for i in range(args.num_cuentas)]
+    return list(CUENTAS_EJEMPLO)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Benchmark de lazo abierto del servidor socket')
+    parser.add_argument('--host', default='localhost', help='Host del servidor')
+    parser.add_argument('--port', type=int, default=5000, help='Puerto del servidor')
+    parser.add_argument('--tasa', type=float, default=200, help='Peticiones por segundo objetivo')
+    parser.add_argument('--duracion', type=float, default=30, help='Segundos de medición')
+    parser.add_argument('--calentamiento', type=float, default=5, help='Segundos de calentamiento')
+    parser.add_argument('--conexiones', type=int, default=16, help='Conexiones persistentes')
+    parser.add_argument('--mezcla', default=MEZCLA_POR_DEFECTO, help='Mezcla de comandos CMD:peso,...')
+    parser.add_argument('--zipf', type=float, default=0.0, help='Exponente Zipf del sesgo de cuentas (0 = uniforme)')
+    parser.add_argument('--archivo-cuentas', help='Archivo con una cédula por línea')
+    parser.add_argument('--num-cuentas', type=int, help='Usar cédulas sintéticas de bulk_loader.py')
+    parser.add_argument('--prefijo', default='2', help='Prefijo de las cédulas sintéticas')
+    parser.add_argument('--semilla', type=int, help='Semilla del generador de comandos')
+    parser.add_argument('--salida', help='Archivo JSON donde guardar el reporte (por defecto stdout)')
+    args = parser.parse_args()
+
+    def mostrar_progreso(p):
+        logging.info(
+            f"⏱️ t={p['segundo']}s | {p['throughput_rps']} rps | "
+            f"p50={p['p50_us'] / 1000:.2f}ms p99={p['p99_us'] / 1000:.2f}ms | "
+            f"rechazadas={p['rechazadas']} fallos={p['fallos']} descartadas={p['descartadas']}"
+        )
+
+    generador = OpenLoopLoadGenerator(
+        host=args.host,
+        port=args.port,
+        tasa=args.tasa,
+        duracion=args.duracion,
+        conexiones=args.conexiones,
+        mezcla=args.mezcla,
+        cuentas=cargar_cuentas(args),
+        zipf_s=args.zipf,
+        semilla=args.semilla,
+        calentamiento=args.calentamiento,
+        on_progress=mostrar_progreso
+    )
+
+    try:
+        reporte = generador.run()
+    except KeyboardInterrupt:
+        generador.stop_event.set()
+        raise SystemExit(1)
+
+    salida = json.dumps(reporte, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            f.write(salida)
+        logging.info(f"✅ Reporte guardado en {args.salida}")
+    else:
+        print(salida)
@@ -0,0 +1,345 @@
+"""
+Seguimiento de Regresiones de Rendimiento - Sistema Bancario Distribuido
+Ejecuta escenarios fijos contra un SocketServer local con BD en memoria,
+guarda líneas base y compara ejecuciones nuevas con umbrales estadísticos
+
+Escenarios:
+- depositos_cuenta_caliente: todos los AUMENTAR sobre una sola cédula (contención de lock)
+- consulta_uniforme: CONSULTA repartida uniformemente sobre muchas cuentas
+- transferencias: TRANSFERIR entre cuentas aleatorias (dos locks por operación)
+- historial_intensivo: mayoría de HISTORIAL sobre cuentas con historial creciente
+- capacidad_mixta: lazo cerrado (cada conexión envía apenas recibe respuesta)
+  con la mezcla por defecto; mide el throughput máximo
+
+Los escenarios de tasa fija son de lazo abierto: su throughput es la tasa
+pedida mientras el servidor no se sature, así que solo su p99 decide una
+regresión. El throughput se compara en los de lazo cerrado (tasa None).
+"""
+
+import json
+import logging
+import math
+import os
+import platform
+import socket
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime
+from benchmark import (OpenLoopLoadGenerator, CommandGenerator, ResultRecorder, SocketConnection,
+                       MEZCLA_POR_DEFECTO, parsear_mezcla)
+from db_memory import InMemoryDatabaseManager
+from socket_server import SocketServer
+
+
+DIRECTORIO_BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'baselines')
+
+ESCENARIOS = {
+    'depositos_cuenta_caliente': {
+        'mezcla': 'AUMENTAR:100',
+        'num_cuentas': 1,
+        'tasa': 400,
+        'conexiones': 16,
+    },
+    'consulta_uniforme': {
+        'mezcla': 'CONSULTA:100',
+        'num_cuentas': 1000,
+        'tasa': 1000,
+        'conexiones': 16,
+    },
+    'transferencias': {
+        'mezcla': 'TRANSFERIR:100',
+        'num_cuentas': 1000,
+        'tasa': 400,
+        'conexiones': 16,
+    },
+    'historial_intensivo': {
+        'mezcla': 'HISTORIAL:80,AUMENTAR:20',
+        'num_cuentas': 100,
+        'tasa': 600,
+        'conexiones': 16,
+    },
+    'capacidad_mixta': {
+        'mezcla': MEZCLA_POR_DEFECTO,
+        'num_cuentas': 1000,
+        'tasa': None,  # Lazo cerrado
+        'conexiones': 8,
+    },
+}
+
+# Valor crítico aproximado de t (dos colas, ~95%) para pocas repeticiones
+T_CRITICO = 2.0
+
+
+class LocalServer:
+    """SocketServer en un hilo, sobre InMemoryDatabaseManager y un puerto libre"""
+
+    def __init__(self, num_cuentas, saldo_inicial=1_000_000.0, latencia_db_s=0.0):
+        self.cuentas = [f"2{i:09d}" for i in range(num_cuentas)]
+        self.db = InMemoryDatabaseManager(
+            ((c, 'Cliente', f'Prueba {i}', saldo_inicial) for i, c in enumerate(self.cuentas)),
+            latencia_s=latencia_db_s
+        )
+        self.server = None
+        self.thread = None
+
+    @staticmethod
+    def _puerto_libre():
+        """Pide al sistema operativo un puerto TCP libre"""
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.bind(('127.0.0.1', 0))
+            return s.getsockname()[1]
+
+    def __enter__(self):
+        self.server = SocketServer('127.0.0.1', self._puerto_libre())
+        self.server.db_manager = self.db
+        self.thread = threading.Thread(target=self.server.start, daemon=True)
+        self.thread.start()
+
+        limite = time.time() + 5
+        while time.time() < limite:
+            try:
+                socket.create_connection((self.server.host, self.server.port), timeout=0.5).close()
+                return self
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError("El servidor local no arrancó a tiempo")
+
+    def __exit__(self, *exc):
+        self.server.stop()
+        self.thread.join(timeout=5)
+
+
+def ejecutar_lazo_cerrado(host, port, escenario, duracion, calentamiento, semilla=1):
+    """
+    Cada conexión envía su siguiente comando apenas recibe la respuesta
+
+    Returns:
+        reporte con throughput_rps, latencia_us y fallos (mismas claves que
+        OpenLoopLoadGenerator.run)
+    """
+    recorder = ResultRecorder()
+    mezcla = parsear_mezcla(escenario['mezcla'])
+    inicio = time.perf_counter()
+    medir_desde = inicio + calentamiento
+    fin = medir_desde + duracion
+
+    def worker(i):
+        generador = CommandGenerator(mezcla, escenario['cuentas'], semilla=semilla + i)
+        conexion = SocketConnection(host, port)
+        try:
+            while True:
+                antes = time.perf_counter()
+                if antes >= fin:
+                    return
+                nombre, comando = generador.next()
+                try:
+                    respuesta = conexion.send_command(comando)
+                except Exception:
+                    if antes >= medir_desde:
+                        recorder.record(nombre, 0, fallo=True)
+                    continue
+                if antes >= medir_desde:
+                    recorder.record(nombre, (time.perf_counter() - antes) * 1e6, respuesta)
+        finally:
+            conexion.close()
+
+    hilos = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(escenario['conexiones'])]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    medido = time.perf_counter() - medir_desde
+    return {
+        'completadas': recorder.completadas,
+        'fallos': recorder.fallos,
+        'throughput_rps': round(recorder.completadas / medido, 1) if medido > 0 else 0,
+        'latencia_us': recorder.total.summary(),
+    }
+
+
+def ejecutar_escenario(nombre, duracion, calentamiento, latencia_db_s=0.0):
+    """Ejecuta un escenario sobre un servidor nuevo y retorna el reporte del benchmark"""
+    escenario = ESCENARIOS[nombre]
+    with LocalServer(escenario['num_cuentas'], latencia_db_s=latencia_db_s) as local:
+        if escenario['tasa'] is None:
+            return ejecutar_lazo_cerrado(
+                local.server.host, local.server.port, {**escenario, 'cuentas': local.cuentas},
+                duracion, calentamiento
+            )
+        generador = OpenLoopLoadGenerator(
+            host=local.server.host,
+            port=local.server.port,
+            tasa=escenario['tasa'],
+            duracion=duracion,
+            calentamiento=calentamiento,
+            conexiones=escenario['conexiones'],
+            mezcla=escenario['mezcla'],
+            cuentas=local.cuentas,
+            semilla=1
+        )
+        return generador.run()
+
+
+def _resumir(valores):
+    """Media y desviación de una métrica a lo largo de las repeticiones"""
+    return {
+        'valores': valores,
+        'media': statistics.mean(valores),
+        'desv': statistics.stdev(valores) if len(valores) > 1 else 0.0,
+    }
+
+
+def medir(nombres, repeticiones, duracion, calentamiento, latencia_db_s=0.0):
+    """Ejecuta cada escenario varias veces y resume throughput y p99"""
+    resultados = {}
+    for nombre in nombres:
+        throughputs, p99s = [], []
+        for i in range(repeticiones):
+            reporte = ejecutar_escenario(nombre, duracion, calentamiento, latencia_db_s)
+            throughputs.append(reporte['throughput_rps'])
+            p99s.append(reporte['latencia_us']['p99'])
+            print(
+                f"▶️ {nombre} [{i + 1}/{repeticiones}] "
+                f"{reporte['throughput_rps']:.1f} rps, p99={reporte['latencia_us']['p99'] / 1000:.2f}ms, "
+                f"fallos={reporte['fallos']}"
+            )
+        resultados[nombre] = {
+            'config': ESCENARIOS[nombre],
+            'throughput_rps': _resumir(throughputs),
+            'p99_us': _resumir(p99s),
+        }
+    return resultados
+
+
+def _t_welch(base, nuevo):
+    """Estadístico t de Welch entre dos resúmenes (nuevo - base)"""
+    nb, nn = len(base['valores']), len(nuevo['valores'])
+    varianza = (base['desv'] ** 2) / nb + (nuevo['desv'] ** 2) / nn
+    diferencia = nuevo['media'] - base['media']
+    if varianza == 0:
+        return math.inf if diferencia > 0 else -math.inf if diferencia < 0 else 0.0
+    return diferencia / math.sqrt(varianza)
+
+
+def comparar(baseline, actual, umbral_throughput=0.10, umbral_p99=0.20):
+    """
+    Compara resultados contra la línea base
+
+    Una métrica es regresión solo si empeora más que el umbral relativo Y la
+    diferencia es estadísticamente significativa (|t de Welch| > T_CRITICO).
+    El throughput de un escenario de tasa fija se informa pero no decide:
+    queda en la tasa pedida aunque el servidor sea más lento.
+
+    Returns:
+        lista de dicts, uno por escenario y métrica
+    """
+    hallazgos = []
+    for nombre, nuevo in actual.items():
+        base = baseline.get(nombre)
+        if base is None:
+            continue
+
+        for metrica, umbral, peor_si_sube in (('throughput_rps', umbral_throughput, False),
+                                              ('p99_us', umbral_p99, True)):
+            b, n = base[metrica], nuevo[metrica]
+            cambio = (n['media'] - b['media']) / b['media'] if b['media'] else 0.0
+            t = _t_welch(b, n)
+            empeora = cambio > umbral if peor_si_sube else cambio < -umbral
+            significativo = (t > T_CRITICO) if peor_si_sube else (t < -T_CRITICO)
+            informativa = metrica == 'throughput_rps' and nuevo['config'].get('tasa') is not None
+            hallazgos.append({
+                'escenario': nombre,
+                'metrica': metrica,
+                'base': round(b['media'], 1),
+                'actual': round(n['media'], 1),
+                'cambio_pct': round(cambio * 100, 1),
+                't': round(t, 2) if math.isfinite(t) else t,
+                'informativa': informativa,
+                'regresion': empeora and significativo and not informativa,
+            })
+    return hallazgos
+
+
+def ruta_baseline(nombre, directorio=DIRECTORIO_BASELINES):
+    """Archivo de línea base de un escenario"""
+    return os.path.join(directorio, f"{nombre}.json")
+
+
+def guardar_baselines(resultados, directorio=DIRECTORIO_BASELINES):
+    """Guarda un archivo JSON por escenario junto con datos del entorno"""
+    os.makedirs(directorio, exist_ok=True)
+    entorno = {
+        'python': sys.version.split()[0],
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+    for nombre, datos in resultados.items():
+        with open(ruta_baseline(nombre, directorio), 'w', encoding='utf-8') as f:
+            json.dump({'timestamp': datetime.now().isoformat(), 'entorno': entorno, **datos},
+                      f, indent=2, ensure_ascii=False)
+
+
+def cargar_baselines(nombres, directorio=DIRECTORIO_BASELINES):
+    """Carga las líneas base existentes de los escenarios pedidos"""
+    baselines = {}
+    for nombre in nombres:
+        ruta = ruta_baseline(nombre, directorio)
+        if os.path.exists(ruta):
+            with open(ruta, encoding='utf-8') as f:
+                baselines[nombre] = json.load(f)
+    return baselines
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Detección de regresiones de rendimiento del servidor socket')
+    parser.add_argument('--guardar', action='store_true', help='Guardar los resultados como nueva línea base')
+    parser.add_argument('--escenarios', default=','.join(ESCENARIOS), help='Escenarios separados por coma')
+    parser.add_argument('--repeticiones', type=int, default=3, help='Ejecuciones por escenario')
+    parser.add_argument('--duracion', type=float, default=10, help='Segundos de medición por ejecución')
+    parser.add_argument('--calentamiento', type=float, default=2, help='Segundos de calentamiento por ejecución')
+    parser.add_argument('--latencia-db-ms', type=float, default=0.0, help='Latencia simulada por operación de BD')
+    parser.add_argument('--umbral-throughput', type=float, default=0.10, help='Caída relativa tolerada de throughput')
+    parser.add_argument('--umbral-p99', type=float, default=0.20, help='Subida relativa tolerada de p99')
+    parser.add_argument('--directorio', default=DIRECTORIO_BASELINES, help='Directorio de líneas base')
+    parser.add_argument('--salida', help='Archivo JSON con resultados y comparación')
+    args = parser.parse_args()
+
+    # El servidor registra cada comando a nivel INFO; eso distorsiona la medición
+    logging.getLogger().setLevel(logging.WARNING)
+
+    nombres = [n.strip() for n in args.escenarios.split(',') if n.strip()]
+    desconocidos = [n for n in nombres if n not in ESCENARIOS]
+    if desconocidos:
+        parser.error(f"Escenarios desconocidos: {', '.join(desconocidos)}")
+
+    resultados = medir(nombres, args.repeticiones, args.duracion, args.calentamiento,
+                       args.latencia_db_ms / 1000)
+
+    if args.guardar:
+        guardar_baselines(resultados, args.directorio)
+        print(f"✅ Líneas base guardadas en {args.directorio}")
+        hallazgos = []
+    else:
+        baselines = cargar_baselines(nombres, args.directorio)
+        faltantes = [n for n in nombres if n not in baselines]
+        if faltantes:
+            print(f"⚠️ Sin línea base para: {', '.join(faltantes)} (usa --guardar)")
+        hallazgos = comparar(baselines, resultados, args.umbral_throughput, args.umbral_p99)
+
+        print(f"\n{'Escenario':<28} {'Métrica':<16} {'Base':>12} {'Actual':>12} {'Cambio':>9} {'t':>8}")
+        print("-" * 90)
+        for h in hallazgos:
+            marca = "❌ REGRESIÓN" if h['regresion'] else "ℹ️ (tasa fija)" if h['informativa'] else "✅"
+            print(f"{h['escenario']:<28} {h['metrica']:<16} {h['base']:>12} {h['actual']:>12} "
+                  f"{h['cambio_pct']:>8}% {h['t']:>8} {marca}")
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump({'resultados': resultados, 'comparacion': hallazgos}, f, indent=2, ensure_ascii=False, default=str)
+
+    sys.exit(1 if any(h['regresion'] for h in hallazgos) else 0)
@@ -0,0 +1,195 @@
+"""
+Caché de Respuestas del Bridge - Sistema Bancario
+Caché acotada (LRU) con TTL corto para lecturas repetidas de los dashboards
+
+- Claves (ruta, cédula); solo se guardan respuestas exitosas
+- Invalidación inmediata por cédula (escrituras del bridge y eventos MQTT)
+- Versión por cédula: una lectura que empezó antes de una invalidación no
+  puede dejar en caché un valor anterior a la escritura
+- Entradas vencidas se conservan un tiempo para servirlas si el servidor
+  socket no responde (stale)
+- Métricas: aciertos, fallos, stale servidas, invalidaciones, desalojos
+- SingleFlight: lecturas idénticas concurrentes comparten una sola llamada
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """Caché LRU con TTL por entrada e invalidación por cédula"""
+
+    def __init__(self, max_entradas=10000, stale_max_s=30):
+        """
+        Args:
+            max_entradas: entradas como máximo; se desaloja la menos usada
+            stale_max_s: segundos tras el vencimiento en que una entrada aún
+                puede servirse si el servidor socket falla
+        """
+        self.max_entradas = max_entradas
+        self.stale_max_s = stale_max_s
+        self.lock = threading.Lock()
+        self.entradas = OrderedDict()  # {(ruta, cedula): (valor, expira)}
+        self.por_cedula = {}  # {cedula: {claves}}
+        self.versiones = {}  # {cedula: int}
+        self.epoca = 0  # cambia al vaciar versiones, así ninguna versión vieja coincide
+
+        self.metricas = {
+            'aciertos': 0,
+            'fallos': 0,
+            'vencidas': 0,
+            'stale_servidas': 0,
+            'invalidaciones': 0,
+            'desalojos': 0,
+            'descartadas_por_version': 0,
+        }
+
+    def obtener(self, ruta, cedula=None):
+        """Valor fresco en caché, o None"""
+        clave = (ruta, cedula)
+        with self.lock:
+            entrada = self.entradas.get(clave)
+            if entrada is None:
+                self.metricas['fallos'] += 1
+                return None
+            valor, expira = entrada
+            if time.monotonic() >= expira:
+                # Se conserva para un posible stale-serve
+                self.metricas['vencidas'] += 1
+                self.metricas['fallos'] += 1
+                return None
+            self.entradas.move_to_end(clave)
+            self.metricas['aciertos'] += 1
+            return valor
+
+    def obtener_stale(self, ruta, cedula=None):
+        """Valor vencido pero dentro de la ventana stale, o None"""
+        with self.lock:
+            entrada = self.entradas.get((ruta, cedula))
+            if entrada is None or time.monotonic() >= entrada[1] + self.stale_max_s:
+                return None
+            self.metricas['stale_servidas'] += 1
+            return entrada[0]
+
+    def version(self, cedula):
+        """Versión actual de una cédula; tomarla antes de consultar al servidor"""
+        with self.lock:
+            return (self.epoca, self.versiones.get(cedula, 0))
+
+    def guardar(self, ruta, cedula, valor, ttl, version=None):
+        """
+        Guarda un valor por `ttl` segundos
+
+        Si se indica `version` y la cédula se invalidó desde entonces, el valor
+        ya es viejo y se descarta.
+        """
+        if ttl <= 0:
+            return
+        clave = (ruta, cedula)
+        with self.lock:
+            if version is not None and (self.epoca, self.versiones.get(cedula, 0)) != version:
+                self.metricas['descartadas_por_version'] += 1
+                return
+            self.entradas[clave] = (valor, time.monotonic() + ttl)
+            self.entradas.move_to_end(clave)
+            self.por_cedula.setdefault(cedula, set()).add(clave)
+
+            while len(self.entradas) > self.max_entradas:
+                vieja, _ = self.entradas.popitem(last=False)
+                self._desindexar(vieja)
+                self.metricas['desalojos'] += 1
+
+    def _desindexar(self, clave):
+        claves = self.por_cedula.get(clave[1])
+        if claves is not None:
+            claves.discard(clave)
+            if not claves:
+                del self.por_cedula[clave[1]]
+
+    def invalidar_cedula(self, cedula):
+        """Elimina todas las entradas de una cédula (su estado cambió)"""
+        with self.lock:
+            self.versiones[cedula] = self.versiones.get(cedula, 0) + 1
+            for clave in self.por_cedula.pop(cedula, ()):
+                self.entradas.pop(clave, None)
+            self.metricas['invalidaciones'] += 1
+
+            # Las versiones solo importan mientras hay lecturas en vuelo
+            if len(self.versiones) > self.max_entradas * 2:
+                self.versiones.clear()
+                self.epoca += 1
+
+    def stats(self):
+        """Métricas de la caché"""
+        with self.lock:
+            consultas = self.metricas['aciertos'] + self.metricas['fallos']
+            return {
+                **self.metricas,
+                'entradas': len(self.entradas),
+                'max_entradas': self.max_entradas,
+                'hit_ratio': round(self.metricas['aciertos'] / consultas, 4) if consultas else 0.0,
+            }
+
+
+class _Vuelo:
+    """Llamada en curso compartida por varios solicitantes"""
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Deduplicación de llamadas idénticas concurrentes
+
+    La primera llamada con una clave ejecuta la función; las que llegan mientras
+    está en curso esperan y reciben el mismo resultado (o la misma excepción).
+    Nada se guarda después de terminar: eso le corresponde a ResponseCache.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.vuelos = {}
+        self.metricas = {'ejecutadas': 0, 'compartidas': 0}
+
+    def do(self, clave, funcion):
+        """Ejecuta funcion() una sola vez por clave entre los llamadores concurrentes"""
+        with self.lock:
+            vuelo = self.vuelos.get(clave)
+            if vuelo is not None:
+                self.metricas['compartidas'] += 1
+                lider = False
+            else:
+                vuelo = self.vuelos[clave] = _Vuelo()
+                self.metricas['ejecutadas'] += 1
+                lider = True
+
+        if not lider:
+            vuelo.listo.wait()
+            if vuelo.error is not None:
+                raise vuelo.error
+            return vuelo.resultado
+
+        try:
+            vuelo.resultado = funcion()
+            return vuelo.resultado
+        except Exception as e:
+            vuelo.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.vuelos[clave]
+            vuelo.listo.set()
+
+    def stats(self):
+        """Métricas de deduplicación"""
+        with self.lock:
+            total = self.metricas['ejecutadas'] + self.metricas['compartidas']
+            return {
+                **self.metricas,
+                'en_vuelo': len(self.vuelos),
+                'ratio_compartidas': round(self.metricas['compartidas'] / total, 4) if total else 0.0,
+            }
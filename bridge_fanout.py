@@ -0,0 +1,93 @@
+"""
+Fan-out de Notificaciones del Bridge - Sistema Bancario
+Saca del camino HTTP el trabajo posterior a una escritura (emitir saldo,
+consultar HISTORIAL y emitirlo) y lo agrupa por cédula
+
+- Cola con una entrada por cédula: una ráfaga de escrituras a la misma cuenta
+  produce un solo refresco, con el saldo más reciente notificado
+- Workers en segundo plano (hilos, o greenlets si el bridge corre con gevent)
+- Una cédula nunca se procesa en dos workers a la vez
+- Métricas de notificaciones, coalescencias y errores
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+
+class CoalescingFanout:
+    """Cola de notificaciones coalescidas por cédula con workers en segundo plano"""
+
+    def __init__(self, procesar, workers=2):
+        """
+        Args:
+            procesar: función(cedula, saldo) que hace el trabajo; saldo puede ser None
+            workers: cédulas que se procesan en paralelo
+        """
+        self.procesar = procesar
+        self.workers = workers
+        self.condicion = threading.Condition()
+        self.pendientes = OrderedDict()  # {cedula: saldo}, en orden de llegada
+        self.en_proceso = set()
+        self.iniciado = False
+
+        self.metricas = {
+            'notificaciones': 0,
+            'coalescidas': 0,
+            'procesadas': 0,
+            'errores': 0,
+        }
+
+    def notificar(self, cedula, saldo=None):
+        """Encola un refresco de la cédula; no bloquea al llamador"""
+        with self.condicion:
+            self.metricas['notificaciones'] += 1
+            if cedula in self.pendientes:
+                self.metricas['coalescidas'] += 1
+                if saldo is not None:
+                    self.pendientes[cedula] = saldo
+            else:
+                self.pendientes[cedula] = saldo
+            self.condicion.notify()
+
+            if not self.iniciado:
+                self.iniciado = True
+                for i in range(self.workers):
+                    threading.Thread(target=self._worker, name=f"fanout-{i}", daemon=True).start()
+
+    def _tomar(self):
+        """Espera la cédula pendiente más antigua que no esté en proceso"""
+        with self.condicion:
+            while True:
+                for cedula in self.pendientes:
+                    if cedula not in self.en_proceso:
+                        saldo = self.pendientes.pop(cedula)
+                        self.en_proceso.add(cedula)
+                        return cedula, saldo
+                self.condicion.wait()
+
+    def _worker(self):
+        while True:
+            cedula, saldo = self._tomar()
+            try:
+                self.procesar(cedula, saldo)
+                exito = True
+            except Exception as e:
+                exito = False
+                logging.error(f"❌ Error en fan-out de {cedula}: {e}")
+            finally:
+                with self.condicion:
+                    self.en_proceso.discard(cedula)
+                    self.metricas['procesadas' if exito else 'errores'] += 1
+                    # Lo que llegó para esta cédula mientras se procesaba ya es tomable
+                    self.condicion.notify()
+
+    def stats(self):
+        """Métricas del fan-out"""
+        with self.condicion:
+            return {
+                **self.metricas,
+                'pendientes': len(self.pendientes),
+                'en_proceso': len(self.en_proceso),
+                'workers': self.workers,
+            }
@@ -0,0 +1,252 @@
+"""
+Pruebas de Carga desde el Bridge - Sistema Bancario
+Ejecuta escenarios de OpenLoopLoadGenerator como trabajos en segundo plano
+
+- Escenario configurable: tasa, duración, conexiones, mezcla de comandos,
+  cuentas (lista o sintéticas de bulk_loader.py) y sesgo Zipf
+- Progreso por segundo (throughput, p50/p99) y reporte final a un callback
+  (el bridge los emite por WebSocket)
+- Reportes consultables por id de trabajo; se conservan los últimos
+- Límite de trabajos simultáneos y de la carga que uno puede pedir
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from benchmark import OpenLoopLoadGenerator, CUENTAS_EJEMPLO, MEZCLA_POR_DEFECTO, parsear_mezcla
+
+
+# Comandos que un escenario puede mezclar
+COMANDOS_PERMITIDOS = {'CONSULTA', 'AUMENTAR', 'DISMINUIR', 'TRANSFERIR', 'HISTORIAL', 'STATS', 'PING'}
+
+
+class LoadTestLimitError(Exception):
+    """Ya hay tantos trabajos en ejecución como permite el límite"""
+
+
+class LoadTestRunner:
+    """Trabajos de prueba de carga con límite de concurrencia"""
+
+    def __init__(self, max_simultaneos=1, max_tasa=2000, max_duracion=300, max_conexiones=64,
+                 max_cuentas=100_000, max_reportes=20, emitir=None, iniciar_tarea=None):
+        """
+        Args:
+            max_simultaneos: trabajos ejecutándose a la vez como máximo
+            max_tasa, max_duracion, max_conexiones: límites por escenario
+            max_cuentas: cédulas por escenario como máximo (la lista se arma
+                y se reparte por dueño en el hilo de la petición)
+            max_reportes: trabajos terminados que se conservan
+            emitir: función(evento, datos) para progreso y fin de cada trabajo
+            iniciar_tarea: función(objetivo) que lanza el trabajo en segundo
+                plano (por defecto un hilo)
+        """
+        self.max_simultaneos = max_simultaneos
+        self.max_tasa = max_tasa
+        self.max_duracion = max_duracion
+        self.max_conexiones = max_conexiones
+        self.max_cuentas = max_cuentas
+        self.max_reportes = max_reportes
+        self.emitir = emitir
+        self.iniciar_tarea = iniciar_tarea or (
+            lambda objetivo: threading.Thread(target=objetivo, daemon=True).start()
+        )
+
+        self.lock = threading.Lock()
+        self.trabajos = OrderedDict()  # {job_id: dict}
+        self.detener = {}  # {job_id: threading.Event} de los que están corriendo
+
+    def validar(self, config):
+        """
+        Normaliza un escenario pedido por HTTP
+
+        Returns:
+            dict con tasa, duracion, calentamiento, conexiones, mezcla, cuentas,
+            zipf_s y semilla
+
+        Raises:
+            ValueError con el motivo si el escenario no es válido
+        """
+        try:
+            tasa = float(config.get('tasa', 50))
+            duracion = float(config.get('duracion', 10))
+            calentamiento = float(config.get('calentamiento', 0))
+            conexiones = int(config.get('conexiones', 8))
+            zipf_s = float(config.get('zipf', 0.0))
+            semilla = config.get('semilla')
+            semilla = int(semilla) if semilla is not None else None
+        except (TypeError, ValueError):
+            raise ValueError("Parámetros numéricos inválidos")
+
+        if not 0 < tasa <= self.max_tasa:
+            raise ValueError(f"La tasa debe estar entre 0 y {self.max_tasa} peticiones/s")
+        if not 0 < duracion <= self.max_duracion or not 0 <= calentamiento <= self.max_duracion:
+            raise ValueError(f"La duración debe estar entre 0 y {self.max_duracion} segundos")
+        if not 1 <= conexiones <= self.max_conexiones:
+            raise ValueError(f"Las conexiones deben estar entre 1 y {self.max_conexiones}")
+        if zipf_s < 0:
+            raise ValueError("El exponente Zipf no puede ser negativo")
+
+        mezcla = config.get('mezcla', MEZCLA_POR_DEFECTO)
+        if isinstance(mezcla, dict):
+            mezcla = ','.join(f"{c}:{p}" for c, p in mezcla.items())
+        try:
+            mezcla = parsear_mezcla(str(mezcla))
+        except ValueError:
+            raise ValueError("Mezcla de comandos inválida")
+        desconocidos = {c for c, _ in mezcla} - COMANDOS_PERMITIDOS
+        if desconocidos:
+            raise ValueError(f"Comandos no permitidos en la mezcla: {', '.join(sorted(desconocidos))}")
+        if any(peso < 0 for _, peso in mezcla) or sum(peso for _, peso in mezcla) <= 0:
+            raise ValueError("Los pesos de la mezcla deben ser positivos")
+
+        cuentas = config.get('cuentas')
+        if cuentas is not None:
+            if not isinstance(cuentas, list) or not cuentas or not all(isinstance(c, str) for c in cuentas):
+                raise ValueError("Se requiere una lista de cédulas")
+            if len(cuentas) > self.max_cuentas:
+                raise ValueError(f"Máximo {self.max_cuentas} cédulas por escenario")
+        elif config.get('num_cuentas'):
+            try:
+                num_cuentas = int(config['num_cuentas'])
+            except (TypeError, ValueError):
+                raise ValueError("num_cuentas inválido")
+            if not 1 <= num_cuentas <= self.max_cuentas:
+                raise ValueError(f"num_cuentas debe estar entre 1 y {self.max_cuentas}")
+            # Mismo esquema de cédulas que bulk_loader.py
+            prefijo = str(config.get('prefijo', '2'))
+            cuentas = [f"{prefijo}{i:09d}" for i in range(num_cuentas)]
+        else:
+            cuentas = list(CUENTAS_EJEMPLO)
+
+        return {
+            'tasa': tasa,
+            'duracion': duracion,
+            'calentamiento': calentamiento,
+            'conexiones': conexiones,
+            'mezcla': mezcla,
+            'cuentas': cuentas,
+            'zipf_s': zipf_s,
+            'semilla': semilla,
+        }
+
+    def lanzar(self, escenario, host, port, on_response=None):
+        """
+        Inicia un escenario ya validado contra un servidor socket
+
+        Returns:
+            id del trabajo
+
+        Raises:
+            LoadTestLimitError si ya se alcanzó el límite de trabajos simultáneos
+        """
+        job_id = uuid.uuid4().hex[:12]
+        detener = threading.Event()
+        with self.lock:
+            if len(self.detener) >= self.max_simultaneos:
+                raise LoadTestLimitError(
+                    f"Ya hay {len(self.detener)} prueba(s) en ejecución (máximo {self.max_simultaneos})"
+                )
+            self.detener[job_id] = detener
+            self.trabajos[job_id] = {
+                'job_id': job_id,
+                'estado': 'ejecutando',
+                'creado': datetime.now().isoformat(),
+                'servidor': f"{host}:{port}",
+                'config': {
+                    **{k: v for k, v in escenario.items() if k not in ('cuentas', 'mezcla')},
+                    'mezcla': dict(escenario['mezcla']),
+                    'num_cuentas': len(escenario['cuentas']),
+                },
+                'progreso': None,
+                'reporte': None,
+                'error': None,
+            }
+            self._podar()
+
+        generador = OpenLoopLoadGenerator(
+            host=host,
+            port=port,
+            tasa=escenario['tasa'],
+            duracion=escenario['duracion'],
+            conexiones=escenario['conexiones'],
+            mezcla=escenario['mezcla'],
+            cuentas=escenario['cuentas'],
+            zipf_s=escenario['zipf_s'],
+            semilla=escenario['semilla'],
+            calentamiento=escenario['calentamiento'],
+            on_progress=lambda progreso: self._progreso(job_id, progreso),
+            stop_event=detener,
+            on_response=on_response,
+        )
+        self.iniciar_tarea(lambda: self._ejecutar(job_id, generador))
+        logging.info(
+            f"🎯 Prueba de carga {job_id}: {escenario['tasa']} rps x {escenario['duracion']}s "
+            f"contra {host}:{port}"
+        )
+        return job_id
+
+    def _podar(self):
+        """Con el lock tomado: olvida los trabajos terminados más viejos"""
+        terminados = [j for j in self.trabajos if j not in self.detener]
+        for job_id in terminados[:max(0, len(terminados) - self.max_reportes)]:
+            del self.trabajos[job_id]
+
+    def _emitir(self, evento, datos):
+        if self.emitir:
+            try:
+                self.emitir(evento, datos)
+            except Exception as e:
+                logging.warning(f"⚠️ No se pudo emitir {evento}: {e}")
+
+    def _progreso(self, job_id, progreso):
+        with self.lock:
+            trabajo = self.trabajos.get(job_id)
+            if trabajo is not None:
+                trabajo['progreso'] = progreso
+        self._emitir('loadtest_progress', {'job_id': job_id, **progreso})
+
+    def _ejecutar(self, job_id, generador):
+        inicio = time.monotonic()
+        try:
+            reporte = generador.run()
+            estado, error = ('cancelado' if generador.stop_event.is_set() else 'completado'), None
+        except Exception as e:
+            logging.error(f"❌ Prueba de carga {job_id} falló: {e}")
+            reporte, estado, error = None, 'error', str(e)
+
+        with self.lock:
+            self.detener.pop(job_id, None)
+            trabajo = self.trabajos[job_id]
+            trabajo.update(estado=estado, reporte=reporte, error=error,
+                           terminado=datetime.now().isoformat())
+            resumen = dict(trabajo)
+
+        logging.info(f"🏁 Prueba de carga {job_id} {estado} en {time.monotonic() - inicio:.1f}s")
+        self._emitir('loadtest_finished', resumen)
+
+    def cancelar(self, job_id):
+        """Pide detener un trabajo; False si no existe o ya terminó"""
+        with self.lock:
+            detener = self.detener.get(job_id)
+        if detener is None:
+            return False
+        detener.set()
+        return True
+
+    def obtener(self, job_id):
+        """Estado, último progreso y reporte de un trabajo, o None"""
+        with self.lock:
+            trabajo = self.trabajos.get(job_id)
+            return dict(trabajo) if trabajo is not None else None
+
+    def listar(self):
+        """Resumen de los trabajos conservados, más recientes primero"""
+        with self.lock:
+            return [
+                {k: t[k] for k in ('job_id', 'estado', 'creado', 'servidor', 'config')}
+                for t in reversed(self.trabajos.values())
+            ]
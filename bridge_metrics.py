@@ -0,0 +1,197 @@
+"""
+Métricas de Peticiones del Bridge - Sistema Bancario
+Latencia por ruta dividida en fases, peticiones en curso y tasas de error
+
+- Histograma de duración total por ruta y por fase: socket (viaje al
+  servidor socket), parse (respuesta -> JSON) y emit (eventos WebSocket)
+- Trabajo fuera de una petición HTTP (fan-out, broadcasts, eventos MQTT y
+  handlers WebSocket) se registra bajo la ruta 'segundo_plano'
+- Peticiones en curso por ruta y conteo por código de estado
+- Exposición en formato de texto de Prometheus y resumen JSON compacto
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+
+# Límites superiores de los buckets, en segundos
+BUCKETS_S = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+FASES = ('socket', 'parse', 'emit')
+
+
+class Histogram:
+    """Histograma de buckets fijos (acumulable a formato Prometheus)"""
+
+    __slots__ = ('conteos', 'total', 'suma')
+
+    def __init__(self):
+        self.conteos = [0] * (len(BUCKETS_S) + 1)  # el último es +Inf
+        self.total = 0
+        self.suma = 0.0
+
+    def observar(self, segundos):
+        self.conteos[bisect_left(BUCKETS_S, segundos)] += 1
+        self.total += 1
+        self.suma += segundos
+
+    def percentil(self, p):
+        """Estimación por interpolación lineal dentro del bucket (segundos)"""
+        if not self.total:
+            return 0.0
+        objetivo = p / 100.0 * self.total
+        acumulado = 0
+        for i, n in enumerate(self.conteos):
+            if n and acumulado + n >= objetivo:
+                inferior = BUCKETS_S[i - 1] if i > 0 else 0.0
+                superior = BUCKETS_S[i] if i < len(BUCKETS_S) else BUCKETS_S[-1]
+                return inferior + (superior - inferior) * (objetivo - acumulado) / n
+            acumulado += n
+        return BUCKETS_S[-1]
+
+    def lineas_prometheus(self, nombre, etiquetas):
+        acumulado = 0
+        for limite, n in zip(BUCKETS_S, self.conteos):
+            acumulado += n
+            yield f'{nombre}_bucket{{{etiquetas},le="{limite}"}} {acumulado}'
+        yield f'{nombre}_bucket{{{etiquetas},le="+Inf"}} {self.total}'
+        yield f'{nombre}_sum{{{etiquetas}}} {self.suma:.6f}'
+        yield f'{nombre}_count{{{etiquetas}}} {self.total}'
+
+
+class Medicion:
+    """Tiempos de una petición en curso; las fases se acumulan"""
+
+    __slots__ = ('ruta', 'inicio', 'fases')
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.inicio = time.perf_counter()
+        self.fases = {}
+
+    def sumar(self, fase, segundos):
+        self.fases[fase] = self.fases.get(fase, 0.0) + segundos
+
+
+class RequestMetrics:
+    """Registro de métricas de las rutas del bridge (thread-safe)"""
+
+    RUTA_SEGUNDO_PLANO = 'segundo_plano'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.duracion = {}  # {ruta: Histogram}
+        self.fases = {}  # {(ruta, fase): Histogram}
+        self.estados = {}  # {(ruta, metodo, codigo): n}
+        self.en_curso = {}  # {ruta: n}
+
+    def iniciar(self, ruta):
+        """Marca el inicio de una petición y la cuenta como en curso"""
+        with self.lock:
+            self.en_curso[ruta] = self.en_curso.get(ruta, 0) + 1
+        return Medicion(ruta)
+
+    def terminar(self, medicion, metodo, codigo):
+        """Registra duración total, fases y código de estado de una petición"""
+        duracion = time.perf_counter() - medicion.inicio
+        with self.lock:
+            self.en_curso[medicion.ruta] -= 1
+            clave = (medicion.ruta, metodo, codigo)
+            self.estados[clave] = self.estados.get(clave, 0) + 1
+            self._histograma(self.duracion, medicion.ruta).observar(duracion)
+            for fase, segundos in medicion.fases.items():
+                self._histograma(self.fases, (medicion.ruta, fase)).observar(segundos)
+
+    def observar_fase(self, fase, segundos, ruta=RUTA_SEGUNDO_PLANO):
+        """Fase medida fuera de una petición HTTP"""
+        with self.lock:
+            self._histograma(self.fases, (ruta, fase)).observar(segundos)
+
+    @staticmethod
+    def _histograma(tabla, clave):
+        histograma = tabla.get(clave)
+        if histograma is None:
+            histograma = tabla[clave] = Histogram()
+        return histograma
+
+    def resumen(self):
+        """Resumen JSON por ruta: peticiones, errores, en curso y percentiles en ms"""
+        with self.lock:
+            rutas = {}
+            for (ruta, _, codigo), n in self.estados.items():
+                datos = rutas.setdefault(ruta, {'peticiones': 0, 'errores_4xx': 0, 'errores_5xx': 0})
+                datos['peticiones'] += n
+                if 400 <= codigo < 500:
+                    datos['errores_4xx'] += n
+                elif codigo >= 500:
+                    datos['errores_5xx'] += n
+
+            for ruta in set(self.duracion) | {r for r, _ in self.fases} | set(self.en_curso):
+                datos = rutas.setdefault(ruta, {'peticiones': 0, 'errores_4xx': 0, 'errores_5xx': 0})
+                datos['en_curso'] = self.en_curso.get(ruta, 0)
+                peticiones = datos['peticiones']
+                datos['tasa_error'] = (
+                    round((datos['errores_4xx'] + datos['errores_5xx']) / peticiones, 4) if peticiones else 0.0
+                )
+                if ruta in self.duracion:
+                    datos['latencia_ms'] = _percentiles_ms(self.duracion[ruta])
+                fases = {f: _percentiles_ms(h) for (r, f), h in self.fases.items() if r == ruta}
+                if fases:
+                    datos['fases_ms'] = fases
+            return rutas
+
+    def prometheus(self):
+        """Texto en formato de exposición de Prometheus"""
+        lineas = []
+        with self.lock:
+            lineas.append('# HELP bridge_http_requests_total Peticiones HTTP atendidas por el bridge')
+            lineas.append('# TYPE bridge_http_requests_total counter')
+            for (ruta, metodo, codigo), n in sorted(self.estados.items()):
+                lineas.append(
+                    f'bridge_http_requests_total{{route="{ruta}",method="{metodo}",status="{codigo}"}} {n}'
+                )
+
+            lineas.append('# HELP bridge_http_requests_in_flight Peticiones HTTP en curso')
+            lineas.append('# TYPE bridge_http_requests_in_flight gauge')
+            for ruta, n in sorted(self.en_curso.items()):
+                lineas.append(f'bridge_http_requests_in_flight{{route="{ruta}"}} {n}')
+
+            lineas.append('# HELP bridge_http_request_duration_seconds Duración total de las peticiones HTTP')
+            lineas.append('# TYPE bridge_http_request_duration_seconds histogram')
+            for ruta, histograma in sorted(self.duracion.items()):
+                lineas.extend(histograma.lineas_prometheus(
+                    'bridge_http_request_duration_seconds', f'route="{ruta}"'
+                ))
+
+            lineas.append('# HELP bridge_phase_duration_seconds Tiempo por fase (socket, parse, emit)')
+            lineas.append('# TYPE bridge_phase_duration_seconds histogram')
+            for (ruta, fase), histograma in sorted(self.fases.items()):
+                lineas.extend(histograma.lineas_prometheus(
+                    'bridge_phase_duration_seconds', f'route="{ruta}",phase="{fase}"'
+                ))
+        return '\n'.join(lineas) + '\n'
+
+
+def _percentiles_ms(histograma):
+    return {
+        'count': histograma.total,
+        'p50': round(histograma.percentil(50) * 1000, 3),
+        'p95': round(histograma.percentil(95) * 1000, 3),
+        'p99': round(histograma.percentil(99) * 1000, 3),
+        'mean': round(histograma.suma / histograma.total * 1000, 3) if histograma.total else 0.0,
+    }
+
+
+def gauges_prometheus(nombre, ayuda, valores, tipo='gauge'):
+    """
+    Líneas de Prometheus para métricas simples ya calculadas
+
+    Args:
+        valores: lista de (etiquetas dict, valor)
+    """
+    lineas = [f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} {tipo}']
+    for etiquetas, valor in valores:
+        texto = ','.join(f'{k}="{v}"' for k, v in etiquetas.items())
+        lineas.append(f'{nombre}{{{texto}}} {valor}' if texto else f'{nombre} {valor}')
+    return lineas
@@ -0,0 +1,151 @@
+"""
+Listener MQTT del Bridge - Sistema Bancario
+Consume los eventos que publica MQTTPublisher y los entrega al bridge para
+que empuje por WebSocket solo los cambios reales, sin sondear con
+HISTORIAL ni STATS
+
+Los eventos con `traceparent` continúan la traza de la petición que los
+originó (span CONSUMER alrededor del callback)
+
+Entiende también los lotes binarios de banco/lote (MQTT_BATCH=1 en el
+publicador): cada registro se despacha como el evento JSON equivalente
+"""
+
+import paho.mqtt.client as mqtt
+import json
+import logging
+import os
+from dotenv import load_dotenv
+import mqtt_codec
+import tracing
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class BridgeMQTTListener:
+    """
+    Suscriptor MQTT que traduce eventos bancarios en callbacks del bridge
+
+    Callbacks (todos opcionales):
+        on_balance(cedula, saldo_nuevo)
+        on_transaction(cedula, payload)
+        on_transfer(payload)
+        on_stats(payload)
+    """
+
+    TOPICS = [
+        ("banco/transacciones", 1),
+        ("banco/transferencias", 1),
+        ("banco/saldo/+", 1),
+        ("banco/estadisticas", 0),
+        (mqtt_codec.TOPIC_LOTE, 1),
+    ]
+
+    def __init__(self, on_balance=None, on_transaction=None, on_transfer=None, on_stats=None):
+        self.broker_host = os.getenv('MQTT_BROKER_HOST', 'localhost')
+        self.broker_port = int(os.getenv('MQTT_BROKER_PORT', 1883))
+        self.username = os.getenv('MQTT_USERNAME')
+        self.password = os.getenv('MQTT_PASSWORD')
+        self.client_id = f"banco_bridge_{os.getpid()}"
+        self.client = None
+        self.connected = False
+
+        self.on_balance = on_balance
+        self.on_transaction = on_transaction
+        self.on_transfer = on_transfer
+        self.on_stats = on_stats
+
+        self.metricas = {'mensajes': 0, 'lotes': 0, 'retenidos_ignorados': 0, 'errores': 0}
+
+    def start(self):
+        """Conecta al broker y procesa mensajes en un hilo de paho"""
+        try:
+            self.client = mqtt.Client(
+                client_id=self.client_id,
+                callback_api_version=mqtt.CallbackAPIVersion.VERSION2
+            )
+            self.client.on_connect = self._on_connect
+            self.client.on_disconnect = self._on_disconnect
+            self.client.on_message = self._on_message
+
+            if self.username and self.password:
+                self.client.username_pw_set(self.username, self.password)
+
+            if self.broker_port == 8883:
+                import ssl
+                self.client.tls_set(cert_reqs=ssl.CERT_REQUIRED, tls_version=ssl.PROTOCOL_TLS)
+
+            self.client.connect(self.broker_host, self.broker_port, keepalive=60)
+            self.client.loop_start()
+            logger.info(f"🔗 Bridge escuchando MQTT en {self.broker_host}:{self.broker_port}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error conectando listener MQTT del bridge: {e}")
+            return False
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        """Se (re)suscribe en cada conexión para sobrevivir reconexiones"""
+        if reason_code == 0:
+            self.connected = True
+            for topic, qos in self.TOPICS:
+                client.subscribe(topic, qos)
+            logger.info("✅ Listener MQTT del bridge suscrito")
+        else:
+            logger.error(f"❌ Falló conexión MQTT del bridge. Code: {reason_code}")
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        self.connected = False
+        if reason_code != 0:
+            logger.warning(f"⚠️ Listener MQTT del bridge desconectado. Code: {reason_code}")
+
+    def _on_message(self, client, userdata, msg):
+        """Despacha cada evento a su callback"""
+        try:
+            if msg.topic == mqtt_codec.TOPIC_LOTE:
+                eventos = mqtt_codec.decodificar_lote(msg.payload)
+                self.metricas['lotes'] += 1
+                for topic, payload in eventos:
+                    self._procesar(topic, payload, False)
+            else:
+                self._procesar(msg.topic, json.loads(msg.payload.decode('utf-8')), msg.retain)
+
+        except Exception as e:
+            self.metricas['errores'] += 1
+            logger.error(f"❌ Error procesando evento MQTT en {msg.topic}: {e}")
+
+    def _procesar(self, topic, payload, retenido):
+        self.metricas['mensajes'] += 1
+        traceparent = payload.get('traceparent')
+        if traceparent:
+            with tracing.continuar(traceparent), tracing.span('mqtt.evento', 'CONSUMER', topic=topic):
+                self._despachar(topic, payload, retenido)
+        else:
+            self._despachar(topic, payload, retenido)
+
+    def _despachar(self, topic, payload, retenido):
+        """Entrega el evento al callback de su tópico"""
+        if topic.startswith("banco/saldo/"):
+            # Los saldos retenidos son estado viejo de todas las cuentas, no cambios
+            if retenido:
+                self.metricas['retenidos_ignorados'] += 1
+                return
+            if self.on_balance:
+                self.on_balance(topic.split('/')[-1], payload['saldo_nuevo'])
+        elif topic == "banco/transacciones":
+            if self.on_transaction:
+                self.on_transaction(payload['cedula'], payload)
+        elif topic == "banco/transferencias":
+            if self.on_transfer:
+                self.on_transfer(payload)
+        elif topic == "banco/estadisticas":
+            if self.on_stats:
+                self.on_stats(payload)
+
+    def stop(self):
+        """Detiene el listener"""
+        if self.client:
+            self.client.loop_stop()
+            self.client.disconnect()
+            logger.info("🔌 Listener MQTT del bridge desconectado")
@@ -0,0 +1,160 @@
+"""
+Limitación de Tasa y Descarte de Carga del Bridge - Sistema Bancario
+Protege al servidor socket (y su pool de BD) de clientes que lo saturan
+
+- Token bucket por (IP del cliente, clase de ruta): lecturas y escrituras
+  con tasa y ráfaga propias; al agotarse, 429 con Retry-After
+- Descarte adaptativo: EWMA de la latencia del servidor socket; por encima
+  del objetivo se rechaza (503) una fracción creciente de peticiones,
+  primero lecturas y con la mitad de probabilidad escrituras
+- Contadores para el endpoint de métricas
+"""
+
+import random
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucket:
+    """Cubeta de fichas: `tasa` fichas por segundo hasta `rafaga` acumuladas"""
+
+    __slots__ = ('tasa', 'rafaga', 'fichas', 'ultimo')
+
+    def __init__(self, tasa, rafaga):
+        self.tasa = tasa
+        self.rafaga = rafaga
+        self.fichas = float(rafaga)
+        self.ultimo = time.monotonic()
+
+    def tomar(self, costo=1):
+        """
+        Intenta consumir `costo` fichas
+
+        Returns:
+            0.0 si se permitió; si no, segundos hasta que haya fichas suficientes
+        """
+        ahora = time.monotonic()
+        self.fichas = min(self.rafaga, self.fichas + (ahora - self.ultimo) * self.tasa)
+        self.ultimo = ahora
+        if self.fichas >= costo:
+            self.fichas -= costo
+            return 0.0
+        return (costo - self.fichas) / self.tasa
+
+
+class RateLimiter:
+    """Token buckets por (cliente, clase), con número de clientes acotado (LRU)"""
+
+    def __init__(self, limites, max_clientes=10000):
+        """
+        Args:
+            limites: {clase: (tasa por segundo, ráfaga)}
+            max_clientes: cubetas como máximo; se olvida la menos usada
+        """
+        self.limites = limites
+        self.max_clientes = max_clientes
+        self.lock = threading.Lock()
+        self.cubetas = OrderedDict()
+        self.permitidas = {clase: 0 for clase in limites}
+        self.rechazadas = {clase: 0 for clase in limites}
+
+    def permitir(self, cliente, clase, costo=1):
+        """
+        Returns:
+            0.0 si se permite; si no, segundos sugeridos para Retry-After
+        """
+        tasa, rafaga = self.limites[clase]
+        # Una petición más cara que la ráfaga nunca pasaría: se cobra la ráfaga
+        costo = min(costo, rafaga)
+        clave = (cliente, clase)
+        with self.lock:
+            cubeta = self.cubetas.get(clave)
+            if cubeta is None:
+                cubeta = self.cubetas[clave] = TokenBucket(tasa, rafaga)
+                if len(self.cubetas) > self.max_clientes:
+                    self.cubetas.popitem(last=False)
+            else:
+                self.cubetas.move_to_end(clave)
+
+            espera = cubeta.tomar(costo)
+            if espera:
+                self.rechazadas[clase] += 1
+            else:
+                self.permitidas[clase] += 1
+            return espera
+
+    def stats(self):
+        with self.lock:
+            return {
+                'limites': {c: {'tasa': t, 'rafaga': r} for c, (t, r) in self.limites.items()},
+                'clientes': len(self.cubetas),
+                'permitidas': dict(self.permitidas),
+                'rechazadas_429': dict(self.rechazadas),
+            }
+
+
+class LoadShedder:
+    """
+    Descarte adaptativo según la latencia del servidor socket
+
+    Con la EWMA de latencia en `objetivo_ms` no se descarta nada; la
+    probabilidad crece linealmente hasta `max_descarte` cuando llega al doble.
+    Nunca se descarta todo: las peticiones admitidas siguen midiendo la
+    latencia y permiten detectar la recuperación. Hacen falta `min_muestras`
+    para empezar, y una medición sin renovar en `ventana_s` se considera
+    vieja (sin tráfico no hay saturación que proteger).
+    """
+
+    def __init__(self, objetivo_ms=200, alfa=0.2, max_descarte=0.9, min_muestras=5, ventana_s=10):
+        self.objetivo_ms = objetivo_ms
+        self.alfa = alfa
+        self.max_descarte = max_descarte
+        self.min_muestras = min_muestras
+        self.ventana_s = ventana_s
+        self.lock = threading.Lock()
+        self.ewma_ms = 0.0
+        self.muestras = 0
+        self.ultima_muestra = 0.0
+        self.descartadas = {}
+
+    def registrar(self, latencia_s):
+        """Agrega una medición de latencia de un viaje al servidor socket"""
+        latencia_ms = latencia_s * 1000
+        with self.lock:
+            if self.muestras == 0:
+                self.ewma_ms = latencia_ms
+            else:
+                self.ewma_ms += self.alfa * (latencia_ms - self.ewma_ms)
+            self.muestras += 1
+            self.ultima_muestra = time.monotonic()
+
+    def probabilidad(self, clase):
+        """Fracción de peticiones de la clase que se descartan ahora"""
+        if (self.muestras < self.min_muestras
+                or time.monotonic() - self.ultima_muestra > self.ventana_s):
+            return 0.0
+        exceso = (self.ewma_ms - self.objetivo_ms) / self.objetivo_ms
+        p = min(max(exceso, 0.0), 1.0) * self.max_descarte
+        return p if clase == 'lectura' else p / 2
+
+    def descartar(self, clase):
+        """True si esta petición debe rechazarse con 503"""
+        if random.random() < self.probabilidad(clase):
+            with self.lock:
+                self.descartadas[clase] = self.descartadas.get(clase, 0) + 1
+            return True
+        return False
+
+    def stats(self):
+        with self.lock:
+            return {
+                'objetivo_ms': self.objetivo_ms,
+                'latencia_ewma_ms': round(self.ewma_ms, 2),
+                'muestras': self.muestras,
+                'probabilidad_descarte': {
+                    'lectura': round(self.probabilidad('lectura'), 3),
+                    'escritura': round(self.probabilidad('escritura'), 3),
+                },
+                'descartadas_503': dict(self.descartadas),
+            }
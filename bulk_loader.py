@@ -0,0 +1,326 @@
+"""
+Cargador Masivo de Datos - Sistema Bancario
+Genera cuentas y transacciones sintéticas para pruebas de escala
+(millones de cuentas, cientos de millones de transacciones)
+
+- Historiales con saldos acumulados consistentes (saldo_final encadenado)
+- Transferencias generadas en pares de cuentas (ENVIADA + RECIBIDA)
+- INSERT multi-fila por lotes grandes
+- Índices secundarios eliminados durante la carga y reconstruidos al final
+- Workers en paralelo (multiprocessing) con reporte de progreso y throughput
+"""
+
+import logging
+import multiprocessing
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from db_setup import DatabaseSetup
+
+
+NOMBRES = [
+    'Juan', 'María', 'Pedro', 'Ana', 'Luis', 'Carmen', 'José', 'Rosa', 'Carlos', 'Lucía',
+    'Jorge', 'Elena', 'Miguel', 'Sofía', 'Andrés', 'Valeria', 'Diego', 'Camila', 'Fernando', 'Paula'
+]
+APELLIDOS = [
+    'Pérez', 'García', 'Rodríguez', 'López', 'Martínez', 'González', 'Torres', 'Silva', 'Ruiz',
+    'Fernández', 'Aguilar', 'Sánchez', 'Ramírez', 'Flores', 'Vera', 'Mendoza', 'Castro', 'Ortiz'
+]
+
+# Índices secundarios que se eliminan durante la carga (idx_cedula se conserva: lo usa la FK)
+INDICES_DIFERIDOS = {
+    'clientes': [('idx_saldo', '(saldo)')],
+    'transacciones': [('idx_fecha', '(fecha DESC)'), ('idx_tipo', '(tipo)')],
+}
+
+INSERT_CLIENTES = """
+    INSERT INTO clientes (cedula, nombres, apellidos, saldo, fecha_registro)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+INSERT_TRANSACCIONES = """
+    INSERT INTO transacciones (cedula, tipo, monto, saldo_final, fecha)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+
+def _centavos(valor):
+    """Formatea centavos enteros como DECIMAL(10,2) sin pasar por float"""
+    return f"{valor // 100}.{valor % 100:02d}"
+
+
+def generar_par(indice_par, tx_por_cuenta, prefijo, dias, semilla, ahora):
+    """
+    Genera dos cuentas vecinas y sus historiales entrelazados
+
+    Cada par es independiente del resto, de modo que los workers no necesitan
+    coordinarse. Las transferencias siempre ocurren dentro del par, así ambas
+    cuentas reciben su fila ENVIADA/RECIBIDA con el mismo monto y fecha.
+
+    Returns:
+        (clientes, transacciones) como listas de tuplas listas para INSERT
+    """
+    rnd = random.Random(semilla * 1_000_003 + indice_par)
+    cedulas = [f"{prefijo}{indice_par * 2 + k:09d}" for k in (0, 1)]
+    saldos = [0, 0]  # en centavos
+
+    # Las transferencias (20% de eventos) generan dos filas: ~1.2 filas por evento
+    num_eventos = rnd.randint(0, int(2 * (2 * tx_por_cuenta / 1.2)))
+    fecha = ahora - timedelta(days=dias)
+    paso_medio = (dias * 86400) / max(num_eventos + 1, 1)
+
+    transacciones = []
+    for _ in range(num_eventos):
+        fecha += timedelta(seconds=rnd.expovariate(1 / paso_medio) if paso_medio else 0)
+        fecha_tx = min(fecha, ahora).strftime('%Y-%m-%d %H:%M:%S')
+        k = rnd.randint(0, 1)
+        monto = rnd.randint(100, 50_000)  # entre $1 y $500
+        operacion = rnd.random()
+
+        if operacion < 0.45 or saldos[k] < monto:
+            saldos[k] += monto
+            transacciones.append((cedulas[k], 'DEPOSITO', _centavos(monto), _centavos(saldos[k]), fecha_tx))
+        elif operacion < 0.80:
+            saldos[k] -= monto
+            transacciones.append((cedulas[k], 'RETIRO', _centavos(monto), _centavos(saldos[k]), fecha_tx))
+        else:
+            otro = 1 - k
+            saldos[k] -= monto
+            saldos[otro] += monto
+            transacciones.append((cedulas[k], 'TRANSFERENCIA_ENVIADA', _centavos(monto), _centavos(saldos[k]), fecha_tx))
+            transacciones.append((cedulas[otro], 'TRANSFERENCIA_RECIBIDA', _centavos(monto), _centavos(saldos[otro]), fecha_tx))
+
+    registro = (ahora - timedelta(days=dias)).strftime('%Y-%m-%d %H:%M:%S')
+    clientes = [
+        (cedulas[k], f"{rnd.choice(NOMBRES)} {rnd.choice(NOMBRES)}",
+         f"{rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}", _centavos(saldos[k]), registro)
+        for k in (0, 1)
+    ]
+    return clientes, transacciones
+
+
+# Estado por proceso worker (una conexión reutilizada para todas sus tareas)
+_worker = {}
+
+
+def _init_worker(config, opciones):
+    """Inicializa la conexión del proceso worker"""
+    db_name = config.pop('db_name')
+    setup = DatabaseSetup(**config)
+    conn = setup.get_connection(db_name)
+    cursor = conn.cursor()
+    cursor.execute("SET unique_checks = 0")
+    cursor.execute("SET foreign_key_checks = 0")
+    _worker.update(conn=conn, cursor=cursor, opciones=opciones)
+
+
+def _cargar_tarea(rango_pares):
+    """Genera e inserta un rango de pares de cuentas. Retorna (cuentas, transacciones)"""
+    conn, cursor, opciones = _worker['conn'], _worker['cursor'], _worker['opciones']
+    lote = opciones['lote']
+    ahora = opciones['ahora']
+
+    clientes, transacciones = [], []
+    for indice_par in range(*rango_pares):
+        c, t = generar_par(indice_par, opciones['tx_por_cuenta'], opciones['prefijo'],
+                           opciones['dias'], opciones['semilla'], ahora)
+        clientes.extend(c)
+        transacciones.extend(t)
+
+    # mysql-connector reescribe executemany de INSERT ... VALUES como INSERT multi-fila
+    for i in range(0, len(clientes), lote):
+        cursor.executemany(INSERT_CLIENTES, clientes[i:i + lote])
+    for i in range(0, len(transacciones), lote):
+        cursor.executemany(INSERT_TRANSACCIONES, transacciones[i:i + lote])
+    conn.commit()
+
+    return len(clientes), len(transacciones)
+
+
+class BulkLoader:
+    """Carga masiva de cuentas y transacciones sintéticas sobre DatabaseSetup"""
+
+    def __init__(self, setup, num_cuentas, tx_por_cuenta=50, lote=5000, workers=4,
+                 cuentas_por_tarea=2000, prefijo='2', dias=365, semilla=42):
+        """
+        Args:
+            setup: DatabaseSetup con la configuración de conexión
+            num_cuentas: número de cuentas a generar (se redondea a par)
+            tx_por_cuenta: promedio de transacciones por cuenta
+            lote: filas por INSERT multi-fila
+            workers: procesos en paralelo
+            cuentas_por_tarea: cuentas generadas por cada tarea de un worker
+            prefijo: primer dígito de las cédulas sintéticas (evita choques con cédulas reales)
+            dias: antigüedad máxima de las transacciones generadas
+            semilla: semilla para que la carga sea reproducible
+        """
+        self.setup = setup
+        self.num_pares = (num_cuentas + 1) // 2
+        self.tx_por_cuenta = tx_por_cuenta
+        self.lote = lote
+        self.workers = workers
+        self.pares_por_tarea = max(cuentas_por_tarea // 2, 1)
+        self.prefijo = prefijo
+        self.dias = dias
+        self.semilla = semilla
+
+    def _ejecutar(self, sentencias):
+        """Ejecuta sentencias DDL en una conexión propia"""
+        conn = self.setup.get_connection(self.setup.db_name)
+        cursor = conn.cursor()
+        for sentencia in sentencias:
+            cursor.execute(sentencia)
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+    def _indices_existentes(self, tabla):
+        """Nombres de índices presentes en una tabla"""
+        conn = self.setup.get_connection(self.setup.db_name)
+        cursor = conn.cursor()
+        cursor.execute(f"SHOW INDEX FROM {tabla}")
+        nombres = {fila[2] for fila in cursor.fetchall()}
+        cursor.close()
+        conn.close()
+        return nombres
+
+    def desactivar_indices(self):
+        """Elimina los índices secundarios para acelerar la carga"""
+        for tabla, indices in INDICES_DIFERIDOS.items():
+            existentes = self._indices_existentes(tabla)
+            drops = [f"DROP INDEX {nombre}" for nombre, _ in indices if nombre in existentes]
+            if drops:
+                self._ejecutar([f"ALTER TABLE {tabla} {', '.join(drops)}"])
+                logging.info(f"🔧 Índices eliminados en '{tabla}': {len(drops)}")
+
+    def reconstruir_indices(self):
+        """Vuelve a crear los índices secundarios en una sola pasada por tabla"""
+        for tabla, indices in INDICES_DIFERIDOS.items():
+            existentes = self._indices_existentes(tabla)
+            adds = [f"ADD INDEX {nombre} {columnas}" for nombre, columnas in indices if nombre not in existentes]
+            if adds:
+                inicio = time.time()
+                self._ejecutar([f"ALTER TABLE {tabla} {', '.join(adds)}"])
+                logging.info(f"🔧 Índices reconstruidos en '{tabla}' en {time.time() - inicio:.1f}s")
+
+    def _tareas(self):
+        """Divide los pares de cuentas en rangos por tarea"""
+        for inicio in range(0, self.num_pares, self.pares_por_tarea):
+            yield (inicio, min(inicio + self.pares_por_tarea, self.num_pares))
+
+    def cargar(self, diferir_indices=True):
+        """
+        Ejecuta la carga completa
+
+        Returns:
+            dict con totales, duración y throughput
+        """
+        self.setup.create_database()
+        self.setup.create_tables()
+
+        if diferir_indices:
+            self.desactivar_indices()
+
+        config = {
+            'host': self.setup.host,
+            'port': self.setup.port,
+            'user': self.setup.user,
+            'password': self.setup.password,
+            'db_name': self.setup.db_name,
+        }
+        opciones = {
+            'lote': self.lote,
+            'tx_por_cuenta': self.tx_por_cuenta,
+            'prefijo': self.prefijo,
+            'dias': self.dias,
+            'semilla': self.semilla,
+            'ahora': datetime.now(),
+        }
+
+        total_tareas = (self.num_pares + self.pares_por_tarea - 1) // self.pares_por_tarea
+        cuentas = transacciones = 0
+        inicio = time.time()
+        ultimo_reporte = inicio
+
+        logging.info(
+            f"🚀 Cargando {self.num_pares * 2:,} cuentas (~{self.tx_por_cuenta} tx/cuenta) "
+            f"con {self.workers} workers, {total_tareas} tareas"
+        )
+
+        try:
+            with multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=(config, opciones)) as pool:
+                for completadas, (c, t) in enumerate(pool.imap_unordered(_cargar_tarea, self._tareas()), 1):
+                    cuentas += c
+                    transacciones += t
+
+                    ahora = time.time()
+                    if ahora - ultimo_reporte >= 5 or completadas == total_tareas:
+                        transcurrido = ahora - inicio
+                        eta = transcurrido / completadas * (total_tareas - completadas)
+                        logging.info(
+                            f"📊 {completadas}/{total_tareas} tareas | "
+                            f"{cuentas:,} cuentas ({cuentas / transcurrido:,.0f}/s) | "
+                            f"{transacciones:,} tx ({transacciones / transcurrido:,.0f}/s) | "
+                            f"ETA {eta:,.0f}s"
+                        )
+                        ultimo_reporte = ahora
+        finally:
+            if diferir_indices:
+                self.reconstruir_indices()
+
+        duracion_carga = time.time() - inicio
+        self.setup.rebuild_summaries()
+        duracion = time.time() - inicio
+
+        resultado = {
+            'cuentas': cuentas,
+            'transacciones': transacciones,
+            'duracion_carga_s': round(duracion_carga, 2),
+            'duracion_total_s': round(duracion, 2),
+            'cuentas_por_s': round(cuentas / duracion_carga, 1) if duracion_carga else 0,
+            'transacciones_por_s': round(transacciones / duracion_carga, 1) if duracion_carga else 0,
+        }
+        logging.info(f"✅ Carga completada: {resultado}")
+        return resultado
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Carga masiva de datos sintéticos')
+    parser.add_argument('--cuentas', type=int, default=100_000, help='Número de cuentas a generar')
+    parser.add_argument('--tx-por-cuenta', type=int, default=50, help='Promedio de transacciones por cuenta')
+    parser.add_argument('--lote', type=int, default=5000, help='Filas por INSERT multi-fila')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help='Procesos en paralelo')
+    parser.add_argument('--cuentas-por-tarea', type=int, default=2000, help='Cuentas por tarea de worker')
+    parser.add_argument('--prefijo', default='2', help='Primer dígito de las cédulas sintéticas')
+    parser.add_argument('--dias', type=int, default=365, help='Antigüedad máxima de las transacciones')
+    parser.add_argument('--semilla', type=int, default=42, help='Semilla del generador')
+    parser.add_argument('--conservar-indices', action='store_true',
+                        help='No eliminar índices secundarios durante la carga')
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    setup = DatabaseSetup(
+        host=os.getenv('DB_HOST', 'localhost'),
+        port=int(os.getenv('DB_PORT', 3306)),
+        user=os.getenv('DB_USER', 'root'),
+        password=os.getenv('DB_PASSWORD', '')
+    )
+    setup.db_name = os.getenv('DB_NAME', setup.db_name)
+
+    loader = BulkLoader(
+        setup,
+        num_cuentas=args.cuentas,
+        tx_por_cuenta=args.tx_por_cuenta,
+        lote=args.lote,
+        workers=args.workers,
+        cuentas_por_tarea=args.cuentas_por_tarea,
+        prefijo=args.prefijo,
+        dias=args.dias,
+        semilla=args.semilla
+    )
+    loader.cargar(diferir_indices=not args.conservar_indices)
@@ -1,13 +1,39 @@
 """
 Módulo de Conexión a Base de Datos
 Gestiona todas las operaciones con MySQL/MariaDB
-Incluye tabla de transacciones para historial
+Incluye tabla de transacciones para historial,
+outbox de eventos MQTT (outbox_mqtt + outbox_cursor) y fases de las
+transferencias entre servidores (transferencias_fases)
 """
 
+import json
 import mysql.connector
-from mysql.connector import pooling
+from mysql.connector import errorcode, pooling
 import logging
 from contextlib import contextmanager
+import tracing
+
+
+# Columna de las tablas de resumen que acumula cada tipo de transacción
+COLUMNAS_RESUMEN = {
+    'DEPOSITO': 'total_depositos',
+    'RETIRO': 'total_retiros',
+    'TRANSFERENCIA_ENVIADA': 'total_transferencias_enviadas',
+    'TRANSFERENCIA_RECIBIDA': 'total_transferencias_recibidas',
+}
+
+
+class SaldoModificadoError(Exception):
+    """El saldo leído antes de un movimiento ya no es el de la BD: otro proceso escribió entre medio"""
+
+    def __init__(self, cedula):
+        super().__init__(f"Saldo de {cedula} modificado por otra operación; reintente")
+        self.cedula = cedula
+
+
+def _trazado_bd(funcion):
+    """Cada operación de BD en un span hijo del comando en curso"""
+    return tracing.trazado(f"db.{funcion.__name__}", 'CLIENT', **{'db.system': 'mysql'})(funcion)
 
 
 class DatabaseManager:
@@ -47,6 +73,7 @@ class DatabaseManager:
         finally:
             conn.close()
 
+    @_trazado_bd
     def consultar_cliente(self, cedula):
         """
         Consulta un cliente por cédula
@@ -72,6 +99,7 @@ class DatabaseManager:
 
             return result
 
+    @_trazado_bd
     def actualizar_saldo(self, cedula, nuevo_saldo):
         """
         Actualiza el saldo de un cliente
@@ -92,15 +120,20 @@ class DatabaseManager:
             conn.commit()
             cursor.close()
 
-    def insertar_transaccion(self, cedula, tipo, monto, saldo_final):
+    @_trazado_bd
+    def insertar_transaccion(self, cedula, tipo, monto, saldo_final, eventos=()):
         """
         Registra una transacción en el historial
 
+        Los resúmenes diario y mensual y los eventos del outbox se escriben
+        en la misma transacción de BD que el registro del historial.
+
         Args:
             cedula: cédula del cliente
-            tipo: 'DEPOSITO' o 'RETIRO'
+            tipo: 'DEPOSITO', 'RETIRO', 'TRANSFERENCIA_ENVIADA' o 'TRANSFERENCIA_RECIBIDA'
             monto: monto de la transacción
             saldo_final: saldo después de la transacción
+            eventos: lista de (tipo, datos) para el outbox MQTT
         """
         with self.get_connection() as conn:
             cursor = conn.cursor()
@@ -110,9 +143,202 @@ class DatabaseManager:
                 VALUES (%s, %s, %s, %s)
             """
             cursor.execute(query, (cedula, tipo, monto, saldo_final))
+            self._acumular_resumenes(cursor, tipo, monto)
+            if eventos:
+                self._encolar_eventos(cursor, eventos)
+            conn.commit()
+            cursor.close()
+
+    @_trazado_bd
+    def registrar_movimientos(self, movimientos, eventos=()):
+        """
+        Aplica movimientos de saldo con su historial, resúmenes y outbox en una transacción
+
+        Cada saldo se escribe solo si sigue siendo el leído antes (compare
+        and set sobre clientes.saldo): el lock por cédula del servidor no
+        protege de otro proceso que escriba la misma cuenta (otro servidor
+        tras un cambio de dueño, un cliente que no pasa por el bridge).
+
+        Args:
+            movimientos: lista de (cedula, tipo, monto, saldo_anterior, saldo_final)
+            eventos: lista de (tipo, datos) para el outbox MQTT
+
+        Raises:
+            SaldoModificadoError: algún saldo cambió; no se aplicó nada
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                for movimiento in movimientos:
+                    self._aplicar_movimiento(cursor, *movimiento)
+                if eventos:
+                    self._encolar_eventos(cursor, eventos)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def _aplicar_movimiento(self, cursor, cedula, tipo, monto, saldo_anterior, saldo_final):
+        """Escribe el saldo si sigue en saldo_anterior y registra la transacción"""
+        cursor.execute(
+            "UPDATE clientes SET saldo = %s WHERE cedula = %s AND saldo = %s",
+            (saldo_final, cedula, saldo_anterior)
+        )
+        if cursor.rowcount != 1:
+            raise SaldoModificadoError(cedula)
+        cursor.execute("""
+            INSERT INTO transacciones (cedula, tipo, monto, saldo_final)
+            VALUES (%s, %s, %s, %s)
+        """, (cedula, tipo, monto, saldo_final))
+        self._acumular_resumenes(cursor, tipo, monto)
+
+    def _acumular_resumenes(self, cursor, tipo, monto):
+        """
+        Suma la transacción recién insertada a los resúmenes de su día y su mes
+
+        El periodo sale de transacciones.fecha de esa misma fila (no de
+        CURRENT_DATE): cerca de medianoche ambos pueden diferir, y
+        rebuild_summaries agrupa por DATE(fecha).
+        """
+        columna = COLUMNAS_RESUMEN[tipo]
+        id_transaccion = cursor.lastrowid
+
+        query_diario = f"""
+            INSERT INTO resumen_diario (cedula, fecha, {columna}, num_transacciones)
+            SELECT cedula, DATE(fecha), monto, 1
+            FROM transacciones
+            WHERE id = %s
+            ON DUPLICATE KEY UPDATE
+                {columna} = {columna} + %s,
+                num_transacciones = num_transacciones + 1
+        """
+        cursor.execute(query_diario, (id_transaccion, monto))
+
+        query_mensual = f"""
+            INSERT INTO resumen_mensual (cedula, mes, {columna}, num_transacciones)
+            SELECT cedula, DATE_FORMAT(fecha, '%Y-%m'), monto, 1
+            FROM transacciones
+            WHERE id = %s
+            ON DUPLICATE KEY UPDATE
+                {columna} = {columna} + %s,
+                num_transacciones = num_transacciones + 1
+        """
+        cursor.execute(query_mensual, (id_transaccion, monto))
+
+    def _encolar_eventos(self, cursor, eventos):
+        """Agrega eventos al outbox; el relay los publica después del commit"""
+        traceparent = tracing.traceparent_actual(solo_muestreado=True)
+        query = """
+            INSERT INTO outbox_mqtt (tipo, datos, traceparent)
+            VALUES (%s, %s, %s)
+        """
+        cursor.executemany(query, [(tipo, json.dumps(datos), traceparent) for tipo, datos in eventos])
+
+    @_trazado_bd
+    def fase_transferencia(self, id_transferencia, fase):
+        """Respuesta registrada para una fase de transferencia (None si no se registró)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            query = """
+                SELECT respuesta FROM transferencias_fases
+                WHERE id_transferencia = %s AND fase = %s
+            """
+            cursor.execute(query, (id_transferencia, fase))
+            row = cursor.fetchone()
+            cursor.close()
+            conn.commit()
+            return row[0] if row else None
+
+    @_trazado_bd
+    def registrar_fase_transferencia(self, id_transferencia, fases, movimiento=None, eventos=()):
+        """
+        Registra fases de una transferencia entre servidores con su movimiento
+
+        (id_transferencia, fase) es clave primaria: si otro servidor ya
+        registró alguna de las fases, la transacción se revierte completa y
+        no se aplica el movimiento.
+
+        Args:
+            id_transferencia: id compartido por las fases de la transferencia
+            fases: lista de (fase, respuesta) a registrar
+            movimiento: (cedula, tipo, monto, saldo_anterior, saldo_final) a aplicar
+                en la misma transacción (como en registrar_movimientos), o None
+            eventos: lista de (tipo, datos) para el outbox MQTT
+
+        Returns:
+            None si se registró todo; si no, (fase, respuesta) de la fase ya registrada
+
+        Raises:
+            SaldoModificadoError: el saldo cambió; no se registró nada
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            query = """
+                INSERT INTO transferencias_fases (id_transferencia, fase, respuesta)
+                VALUES (%s, %s, %s)
+            """
+            try:
+                for fase, respuesta in fases:
+                    try:
+                        cursor.execute(query, (id_transferencia, fase, respuesta))
+                    except mysql.connector.IntegrityError as e:
+                        if e.errno != errorcode.ER_DUP_ENTRY:
+                            raise
+                        # Ya registrada (aquí o en otro servidor): responder lo mismo
+                        conn.rollback()
+                        cursor.execute(
+                            "SELECT respuesta FROM transferencias_fases WHERE id_transferencia = %s AND fase = %s",
+                            (id_transferencia, fase)
+                        )
+                        (previa,) = cursor.fetchone()
+                        conn.commit()
+                        return fase, previa
+
+                if movimiento:
+                    self._aplicar_movimiento(cursor, *movimiento)
+                    if eventos:
+                        self._encolar_eventos(cursor, eventos)
+                conn.commit()
+                return None
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    @_trazado_bd
+    def purgar_fases_transferencia(self, retencion_s, limite=10000):
+        """
+        Borra las fases de transferencias terminadas hace más de retencion_s
+
+        Terminada = tiene CREDITO o REVERSO; un DEBITO sin ninguno de los dos
+        se conserva para conciliar. La búsqueda usa idx_creado.
+
+        Returns:
+            cantidad de filas borradas
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT DISTINCT id_transferencia FROM transferencias_fases
+                WHERE creado < NOW() - INTERVAL %s SECOND AND fase IN ('CREDITO', 'REVERSO')
+                LIMIT %s
+            """, (int(retencion_s), limite))
+            ids = [row[0] for row in cursor.fetchall()]
+            borradas = 0
+            if ids:
+                marcadores = ', '.join(['%s'] * len(ids))
+                cursor.execute(
+                    f"DELETE FROM transferencias_fases WHERE id_transferencia IN ({marcadores})", ids
+                )
+                borradas = cursor.rowcount
             conn.commit()
             cursor.close()
+            return borradas
 
+    @_trazado_bd
     def crear_cliente(self, cedula, nombres, apellidos, saldo_inicial):
         """
         Crea un nuevo cliente en la base de datos
@@ -134,29 +360,32 @@ class DatabaseManager:
             conn.commit()
             cursor.close()
 
-    def obtener_historial(self, cedula, limite=10):
+    @_trazado_bd
+    def obtener_historial(self, cedula, limite=10, desde_id=None):
         """
         Obtiene el historial de transacciones de un cliente
 
         Args:
             cedula: cédula del cliente
             limite: número máximo de transacciones a retornar
+            desde_id: si se indica, solo transacciones con id mayor
 
         Returns:
-            lista de diccionarios con las transacciones
+            lista de diccionarios con las transacciones, de la más reciente a la más antigua
         """
         with self.get_connection() as conn:
             cursor = conn.cursor(dictionary=True)
 
+            # Orden por id: fecha tiene resolución de segundos y empata
             query = """
-                SELECT tipo, monto, saldo_final, 
+                SELECT id, tipo, monto, saldo_final, 
                        DATE_FORMAT(fecha, '%Y-%m-%d %H:%i:%S') as fecha
                 FROM transacciones
-                WHERE cedula = %s
-                ORDER BY fecha DESC
+                WHERE cedula = %s AND id > %s
+                ORDER BY id DESC
                 LIMIT %s
             """
-            cursor.execute(query, (cedula, limite))
+            cursor.execute(query, (cedula, desde_id or 0, limite))
             results = cursor.fetchall()
             cursor.close()
 
@@ -169,6 +398,188 @@ class DatabaseManager:
 
             return results
 
+    @_trazado_bd
+    def obtener_resumen(self, cedula, periodo='DIARIO', limite=30):
+        """
+        Obtiene los totales por periodo desde las tablas de resumen
+
+        Args:
+            cedula: cédula del cliente
+            periodo: 'DIARIO' o 'MENSUAL'
+            limite: número máximo de periodos a retornar (los más recientes)
+
+        Returns:
+            lista de diccionarios con periodo, totales por tipo y num_transacciones
+        """
+        if periodo == 'MENSUAL':
+            tabla, columna_orden, columna_periodo = 'resumen_mensual', 'mes', 'mes'
+        else:
+            tabla, columna_orden = 'resumen_diario', 'fecha'
+            columna_periodo = "DATE_FORMAT(fecha, '%Y-%m-%d')"
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+
+            query = f"""
+                SELECT {columna_periodo} as periodo,
+                       total_depositos, total_retiros,
+                       total_transferencias_enviadas, total_transferencias_recibidas,
+                       num_transacciones
+                FROM {tabla}
+                WHERE cedula = %s
+                ORDER BY {columna_orden} DESC
+                LIMIT %s
+            """
+            cursor.execute(query, (cedula, limite))
+            results = cursor.fetchall()
+            cursor.close()
+
+            # Convertir Decimal a float para JSON serialización
+            for row in results:
+                for columna in COLUMNAS_RESUMEN.values():
+                    row[columna] = float(row[columna])
+
+            return results
+
+    @_trazado_bd
+    def ultimo_id_transaccion(self):
+        """Retorna el mayor id de transacciones (0 si la tabla está vacía)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM transacciones")
+            (ultimo,) = cursor.fetchone()
+            cursor.close()
+            return int(ultimo)
+
+    @_trazado_bd
+    def obtener_transacciones_desde(self, desde_id, limite=100000):
+        """
+        Obtiene las transacciones con id mayor a desde_id, en orden de inserción
+
+        Args:
+            desde_id: id de la última transacción ya conocida
+            limite: número máximo de filas
+
+        Returns:
+            lista de diccionarios con id, cedula, tipo, monto y saldo_final (Decimal)
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+
+            query = """
+                SELECT id, cedula, tipo, monto, saldo_final
+                FROM transacciones
+                WHERE id > %s
+                ORDER BY id
+                LIMIT %s
+            """
+            cursor.execute(query, (desde_id, limite))
+            results = cursor.fetchall()
+            cursor.close()
+            return results
+
+    @_trazado_bd
+    def leer_outbox(self, desde_id, limite=500):
+        """
+        Eventos del outbox con id mayor a desde_id, en orden de id
+
+        Returns:
+            lista de diccionarios con id, tipo, datos (dict), traceparent y creado
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+
+            query = """
+                SELECT id, tipo, datos, traceparent, creado
+                FROM outbox_mqtt
+                WHERE id > %s
+                ORDER BY id
+                LIMIT %s
+            """
+            cursor.execute(query, (desde_id, limite))
+            results = cursor.fetchall()
+            cursor.close()
+            # Sin commit, REPEATABLE READ dejaría ver siempre la misma foto
+            conn.commit()
+
+            for row in results:
+                row['datos'] = json.loads(row['datos'])
+            return results
+
+    @_trazado_bd
+    def leer_outbox_ids(self, ids):
+        """Eventos del outbox con los ids indicados (los que existan), en orden de id"""
+        if not ids:
+            return []
+        with self.get_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+
+            query = f"""
+                SELECT id, tipo, datos, traceparent, creado
+                FROM outbox_mqtt
+                WHERE id IN ({', '.join(['%s'] * len(ids))})
+                ORDER BY id
+            """
+            cursor.execute(query, tuple(ids))
+            results = cursor.fetchall()
+            cursor.close()
+            conn.commit()
+
+            for row in results:
+                row['datos'] = json.loads(row['datos'])
+            return results
+
+    def cursor_outbox(self, relay):
+        """Último id del outbox ya publicado por un relay (0 si nunca publicó)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT ultimo_id FROM outbox_cursor WHERE relay = %s", (relay,))
+            row = cursor.fetchone()
+            cursor.close()
+            conn.commit()
+            return int(row[0]) if row else 0
+
+    @_trazado_bd
+    def guardar_cursor_outbox(self, relay, ultimo_id):
+        """Guarda hasta dónde publicó un relay (para retomar tras reiniciar)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+
+            query = """
+                INSERT INTO outbox_cursor (relay, ultimo_id)
+                VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE ultimo_id = VALUES(ultimo_id)
+            """
+            cursor.execute(query, (relay, ultimo_id))
+            conn.commit()
+            cursor.close()
+
+    @_trazado_bd
+    def purgar_outbox(self, limite=10000, hasta_id=None):
+        """
+        Borra eventos ya publicados por todos los relays
+
+        Args:
+            limite: filas a borrar como máximo
+            hasta_id: tope adicional (el relay no purga sus ids saltados en revisión)
+
+        Returns:
+            cantidad de filas borradas
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COALESCE(MIN(ultimo_id), 0) FROM outbox_cursor")
+            (minimo,) = cursor.fetchone()
+            hasta_id = minimo if hasta_id is None else min(minimo, hasta_id)
+            cursor.execute(
+                "DELETE FROM outbox_mqtt WHERE id <= %s ORDER BY id LIMIT %s",
+                (hasta_id, limite)
+            )
+            borradas = cursor.rowcount
+            conn.commit()
+            cursor.close()
+            return borradas
+
     def close(self):
         """Cierra todas las conexiones del pool"""
         if self.connection_pool:
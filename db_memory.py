@@ -0,0 +1,257 @@
+"""
+Base de Datos en Memoria - Sistema Bancario
+Sustituto local de DatabaseManager para benchmarks y pruebas sin MySQL
+Implementa la misma interfaz pública que db_connection.DatabaseManager
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from db_connection import COLUMNAS_RESUMEN, SaldoModificadoError
+import tracing
+
+
+class InMemoryDatabaseManager:
+    """Implementación en memoria de la interfaz de DatabaseManager"""
+
+    def __init__(self, clientes=None, latencia_s=0.0):
+        """
+        Args:
+            clientes: iterable de (cedula, nombres, apellidos, saldo) iniciales
+            latencia_s: demora artificial por operación para simular el viaje a la BD
+        """
+        self.latencia_s = latencia_s
+        self.lock = threading.Lock()
+        self.clientes = {}
+        self.transacciones = []
+        self.historial_por_cedula = {}
+        self.resumen_diario = {}
+        self.resumen_mensual = {}
+        self.outbox = []
+        self.outbox_ultimo_id = 0
+        self.outbox_cursores = {}
+        self.fases_transferencia = {}  # (id_transferencia, fase) -> respuesta
+        self.fases_creadas = {}  # (id_transferencia, fase) -> datetime
+        for cedula, nombres, apellidos, saldo in clientes or []:
+            self.crear_cliente(cedula, nombres, apellidos, saldo)
+
+    def _esperar(self):
+        """Simula la latencia de la BD"""
+        if self.latencia_s:
+            time.sleep(self.latencia_s)
+
+    def consultar_cliente(self, cedula):
+        """Consulta un cliente por cédula (dict o None)"""
+        self._esperar()
+        with self.lock:
+            cliente = self.clientes.get(cedula)
+            if cliente is None:
+                return None
+            return {**cliente, 'saldo': float(cliente['saldo'])}
+
+    def actualizar_saldo(self, cedula, nuevo_saldo):
+        """Actualiza el saldo de un cliente"""
+        self._esperar()
+        with self.lock:
+            if cedula in self.clientes:
+                self.clientes[cedula]['saldo'] = Decimal(str(nuevo_saldo)).quantize(Decimal('0.01'))
+
+    def insertar_transaccion(self, cedula, tipo, monto, saldo_final, eventos=()):
+        """Registra una transacción, la suma a los resúmenes y agrega sus eventos al outbox"""
+        self._esperar()
+        with self.lock:
+            self._insertar_transaccion(cedula, tipo, monto, saldo_final, eventos)
+
+    def registrar_movimientos(self, movimientos, eventos=()):
+        """Aplica movimientos (cedula, tipo, monto, saldo_anterior, saldo_final) si ningún saldo cambió"""
+        self._esperar()
+        with self.lock:
+            self._verificar_saldos(movimientos)
+            for i, (cedula, tipo, monto, _, saldo_final) in enumerate(movimientos):
+                self.clientes[cedula]['saldo'] = Decimal(str(saldo_final)).quantize(Decimal('0.01'))
+                # Los eventos van con el último movimiento, como en la misma transacción
+                self._insertar_transaccion(
+                    cedula, tipo, monto, saldo_final, eventos if i == len(movimientos) - 1 else ()
+                )
+
+    def _verificar_saldos(self, movimientos):
+        """Con self.lock tomado: SaldoModificadoError si algún saldo ya no es el leído"""
+        for cedula, _, _, saldo_anterior, _ in movimientos:
+            cliente = self.clientes.get(cedula)
+            if cliente is None or cliente['saldo'] != Decimal(str(saldo_anterior)).quantize(Decimal('0.01')):
+                raise SaldoModificadoError(cedula)
+
+    def _insertar_transaccion(self, cedula, tipo, monto, saldo_final, eventos):
+        """insertar_transaccion con self.lock ya tomado"""
+        ahora = datetime.now()
+        monto = Decimal(str(monto)).quantize(Decimal('0.01'))
+        tx = {
+            'id': len(self.transacciones) + 1,
+            'cedula': cedula,
+            'tipo': tipo,
+            'monto': monto,
+            'saldo_final': Decimal(str(saldo_final)).quantize(Decimal('0.01')),
+            'fecha': ahora.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        self.transacciones.append(tx)
+        self.historial_por_cedula.setdefault(cedula, []).append(tx)
+
+        columna = COLUMNAS_RESUMEN[tipo]
+        for tabla, periodo in ((self.resumen_diario, ahora.strftime('%Y-%m-%d')),
+                               (self.resumen_mensual, ahora.strftime('%Y-%m'))):
+            fila = tabla.setdefault((cedula, periodo), {c: Decimal('0.00') for c in COLUMNAS_RESUMEN.values()})
+            fila[columna] += monto
+            fila['num_transacciones'] = fila.get('num_transacciones', 0) + 1
+
+        traceparent = tracing.traceparent_actual(solo_muestreado=True)
+        for tipo_evento, datos in eventos:
+            self.outbox_ultimo_id += 1
+            self.outbox.append({
+                'id': self.outbox_ultimo_id,
+                'tipo': tipo_evento,
+                'datos': datos,
+                'traceparent': traceparent,
+                'creado': ahora,
+            })
+
+    def fase_transferencia(self, id_transferencia, fase):
+        """Respuesta registrada para una fase de transferencia (None si no se registró)"""
+        self._esperar()
+        with self.lock:
+            return self.fases_transferencia.get((id_transferencia, fase))
+
+    def registrar_fase_transferencia(self, id_transferencia, fases, movimiento=None, eventos=()):
+        """Registra fases y su movimiento de forma atómica; (fase, respuesta) si alguna ya existía"""
+        self._esperar()
+        with self.lock:
+            for fase, _ in fases:
+                previa = self.fases_transferencia.get((id_transferencia, fase))
+                if previa is not None:
+                    return fase, previa
+            if movimiento:
+                self._verificar_saldos([movimiento])
+            ahora = datetime.now()
+            for fase, respuesta in fases:
+                self.fases_transferencia[(id_transferencia, fase)] = respuesta
+                self.fases_creadas[(id_transferencia, fase)] = ahora
+            if movimiento:
+                cedula, tipo, monto, _, saldo_final = movimiento
+                self.clientes[cedula]['saldo'] = Decimal(str(saldo_final)).quantize(Decimal('0.01'))
+                self._insertar_transaccion(cedula, tipo, monto, saldo_final, eventos)
+            return None
+
+    def purgar_fases_transferencia(self, retencion_s, limite=10000):
+        """Borra las fases de transferencias con CREDITO o REVERSO de hace más de retencion_s"""
+        with self.lock:
+            corte = datetime.now() - timedelta(seconds=retencion_s)
+            terminadas = set()
+            for (id_transferencia, fase), creado in self.fases_creadas.items():
+                if len(terminadas) >= limite:
+                    break
+                if creado < corte and fase in ('CREDITO', 'REVERSO'):
+                    terminadas.add(id_transferencia)
+            claves = [clave for clave in self.fases_transferencia if clave[0] in terminadas]
+            for clave in claves:
+                del self.fases_transferencia[clave]
+                del self.fases_creadas[clave]
+            return len(claves)
+
+    def crear_cliente(self, cedula, nombres, apellidos, saldo_inicial):
+        """Crea un cliente; falla como la BD si la cédula ya existe"""
+        self._esperar()
+        with self.lock:
+            if cedula in self.clientes:
+                raise ValueError(f"Duplicate entry '{cedula}' for key 'PRIMARY'")
+            self.clientes[cedula] = {
+                'cedula': cedula,
+                'nombres': nombres,
+                'apellidos': apellidos,
+                'saldo': Decimal(str(saldo_inicial)).quantize(Decimal('0.01')),
+                'fecha_registro': datetime.now(),
+            }
+
+    def obtener_historial(self, cedula, limite=10, desde_id=None):
+        """Últimas transacciones de un cliente (con id > desde_id), de la más reciente a la más antigua"""
+        self._esperar()
+        with self.lock:
+            historial = self.historial_por_cedula.get(cedula, [])
+            if desde_id:
+                historial = [tx for tx in historial if tx['id'] > desde_id]
+            ultimas = historial[-limite:]
+            return [
+                {
+                    'id': tx['id'],
+                    'tipo': tx['tipo'],
+                    'monto': float(tx['monto']),
+                    'saldo_final': float(tx['saldo_final']),
+                    'fecha': tx['fecha'],
+                }
+                for tx in reversed(ultimas)
+            ]
+
+    def obtener_resumen(self, cedula, periodo='DIARIO', limite=30):
+        """Totales por periodo de un cliente, del más reciente al más antiguo"""
+        self._esperar()
+        tabla = self.resumen_mensual if periodo == 'MENSUAL' else self.resumen_diario
+        with self.lock:
+            filas = sorted(
+                ((p, fila) for (c, p), fila in tabla.items() if c == cedula),
+                reverse=True
+            )[:limite]
+            return [
+                {
+                    'periodo': p,
+                    **{c: float(fila[c]) for c in COLUMNAS_RESUMEN.values()},
+                    'num_transacciones': fila['num_transacciones'],
+                }
+                for p, fila in filas
+            ]
+
+    def ultimo_id_transaccion(self):
+        """Mayor id de transacción registrado (0 si no hay)"""
+        with self.lock:
+            return len(self.transacciones)
+
+    def obtener_transacciones_desde(self, desde_id, limite=100000):
+        """Transacciones con id mayor a desde_id, en orden de inserción"""
+        with self.lock:
+            return [
+                {k: tx[k] for k in ('id', 'cedula', 'tipo', 'monto', 'saldo_final')}
+                for tx in self.transacciones[desde_id:desde_id + limite]
+            ]
+
+    def leer_outbox(self, desde_id, limite=500):
+        """Eventos del outbox con id mayor a desde_id, en orden de id"""
+        with self.lock:
+            # Ids consecutivos: la posición sale del primero que queda tras purgar
+            inicio = max(desde_id - self.outbox[0]['id'] + 1, 0) if self.outbox else 0
+            return [dict(ev) for ev in self.outbox[inicio:inicio + limite]]
+
+    def leer_outbox_ids(self, ids):
+        """Eventos del outbox con los ids indicados (los que existan), en orden de id"""
+        buscados = set(ids)
+        with self.lock:
+            return [dict(ev) for ev in self.outbox if ev['id'] in buscados]
+
+    def cursor_outbox(self, relay):
+        """Último id del outbox ya publicado por un relay"""
+        with self.lock:
+            return self.outbox_cursores.get(relay, 0)
+
+    def guardar_cursor_outbox(self, relay, ultimo_id):
+        """Guarda hasta dónde publicó un relay"""
+        with self.lock:
+            self.outbox_cursores[relay] = ultimo_id
+
+    def purgar_outbox(self, limite=10000, hasta_id=None):
+        """Borra eventos ya publicados por todos los relays (cantidad borrada)"""
+        with self.lock:
+            minimo = min(self.outbox_cursores.values(), default=0)
+            hasta_id = minimo if hasta_id is None else min(minimo, hasta_id)
+            borrar = sum(1 for ev in self.outbox[:limite] if ev['id'] <= hasta_id)
+            del self.outbox[:borrar]
+            return borrar
+
+    def close(self):
+        """Nada que liberar"""
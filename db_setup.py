@@ -1,6 +1,6 @@
 """
 Script de Configuración de Base de Datos
-Crea BD, tablas (clientes + transacciones), índices y datos de ejemplo
+Crea BD, tablas (clientes + transacciones + resúmenes + outbox MQTT), índices y datos de ejemplo
 Soporta MySQL 8.0+ y MariaDB 10.5+
 """
 
@@ -71,7 +71,7 @@ class DatabaseSetup:
             raise
 
     def create_tables(self):
-        """Crea tablas clientes y transacciones con sus relaciones"""
+        """Crea tablas clientes, transacciones, resúmenes y outbox con sus relaciones"""
         try:
             conn = self.get_connection(self.db_name)
             cursor = conn.cursor()
@@ -106,12 +106,87 @@ class DatabaseSetup:
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
             """
 
+            # Resúmenes por cuenta, mantenidos en cada escritura del historial
+            create_resumen_diario = """
+            CREATE TABLE IF NOT EXISTS resumen_diario (
+                cedula VARCHAR(15) NOT NULL,
+                fecha DATE NOT NULL,
+                total_depositos DECIMAL(14, 2) NOT NULL DEFAULT 0.00,
+                total_retiros DECIMAL(14, 2) NOT NULL DEFAULT 0.00,
+                total_transferencias_enviadas DECIMAL(14, 2) NOT NULL DEFAULT 0.00,
+                total_transferencias_recibidas DECIMAL(14, 2) NOT NULL DEFAULT 0.00,
+                num_transacciones INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (cedula, fecha),
+                FOREIGN KEY (cedula) REFERENCES clientes(cedula) ON DELETE CASCADE
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+            """
+
+            create_resumen_mensual = """
+            CREATE TABLE IF NOT EXISTS resumen_mensual (
+                cedula VARCHAR(15) NOT NULL,
+                mes CHAR(7) NOT NULL,
+                total_depositos DECIMAL(14, 2) NOT NULL DEFAULT 0.00,
+                total_retiros DECIMAL(14, 2) NOT NULL DEFAULT 0.00,
+                total_transferencias_enviadas DECIMAL(14, 2) NOT NULL DEFAULT 0.00,
+                total_transferencias_recibidas DECIMAL(14, 2) NOT NULL DEFAULT 0.00,
+                num_transacciones INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (cedula, mes),
+                FOREIGN KEY (cedula) REFERENCES clientes(cedula) ON DELETE CASCADE
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+            """
+
+            # Eventos MQTT escritos en la misma transacción que el historial;
+            # mqtt_outbox_relay.py los publica y guarda su avance en outbox_cursor
+            create_outbox = """
+            CREATE TABLE IF NOT EXISTS outbox_mqtt (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                tipo VARCHAR(20) NOT NULL,
+                datos TEXT NOT NULL,
+                traceparent VARCHAR(55) NULL,
+                creado TIMESTAMP(3) DEFAULT CURRENT_TIMESTAMP(3)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+            """
+
+            create_outbox_cursor = """
+            CREATE TABLE IF NOT EXISTS outbox_cursor (
+                relay VARCHAR(50) PRIMARY KEY,
+                ultimo_id BIGINT NOT NULL DEFAULT 0,
+                actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+            """
+
+            # Fases de las transferencias entre servidores: la clave primaria
+            # hace que cada (id, fase) se aplique una sola vez en todo el clúster
+            create_transferencias_fases = """
+            CREATE TABLE IF NOT EXISTS transferencias_fases (
+                id_transferencia VARCHAR(64) NOT NULL,
+                fase VARCHAR(10) NOT NULL,
+                respuesta VARCHAR(255) NOT NULL,
+                creado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (id_transferencia, fase),
+                INDEX idx_creado (creado)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+            """
+
             cursor.execute(create_clientes)
             logging.info("✅ Tabla 'clientes' creada")
 
             cursor.execute(create_transacciones)
             logging.info("✅ Tabla 'transacciones' creada")
 
+            cursor.execute(create_resumen_diario)
+            logging.info("✅ Tabla 'resumen_diario' creada")
+
+            cursor.execute(create_resumen_mensual)
+            logging.info("✅ Tabla 'resumen_mensual' creada")
+
+            cursor.execute(create_outbox)
+            cursor.execute(create_outbox_cursor)
+            logging.info("✅ Tablas 'outbox_mqtt' y 'outbox_cursor' creadas")
+
+            cursor.execute(create_transferencias_fases)
+            logging.info("✅ Tabla 'transferencias_fases' creada")
+
             conn.commit()
             cursor.close()
             conn.close()
@@ -172,6 +247,58 @@ class DatabaseSetup:
             logging.error(f"❌ Error insertando datos de ejemplo: {e}")
             raise
 
+    def rebuild_summaries(self):
+        """
+        Reconstruye resumen_diario y resumen_mensual a partir de transacciones
+
+        Necesario para bases existentes y tras cargas masivas que escriben
+        directamente en transacciones sin pasar por DatabaseManager.
+        """
+        try:
+            conn = self.get_connection(self.db_name)
+            cursor = conn.cursor()
+
+            totales = """
+                SUM(CASE WHEN tipo = 'DEPOSITO' THEN monto ELSE 0 END),
+                SUM(CASE WHEN tipo = 'RETIRO' THEN monto ELSE 0 END),
+                SUM(CASE WHEN tipo = 'TRANSFERENCIA_ENVIADA' THEN monto ELSE 0 END),
+                SUM(CASE WHEN tipo = 'TRANSFERENCIA_RECIBIDA' THEN monto ELSE 0 END),
+                COUNT(*)
+            """
+            columnas = """
+                total_depositos, total_retiros,
+                total_transferencias_enviadas, total_transferencias_recibidas,
+                num_transacciones
+            """
+
+            cursor.execute("DELETE FROM resumen_diario")
+            cursor.execute(f"""
+                INSERT INTO resumen_diario (cedula, fecha, {columnas})
+                SELECT cedula, DATE(fecha), {totales}
+                FROM transacciones
+                GROUP BY cedula, DATE(fecha)
+            """)
+            dias = cursor.rowcount
+
+            cursor.execute("DELETE FROM resumen_mensual")
+            cursor.execute(f"""
+                INSERT INTO resumen_mensual (cedula, mes, {columnas})
+                SELECT cedula, DATE_FORMAT(fecha, '%Y-%m'), {totales}
+                FROM transacciones
+                GROUP BY cedula, DATE_FORMAT(fecha, '%Y-%m')
+            """)
+            meses = cursor.rowcount
+
+            conn.commit()
+            logging.info(f"✅ Resúmenes reconstruidos: {dias} días, {meses} meses")
+
+            cursor.close()
+            conn.close()
+
+        except Error as e:
+            logging.error(f"❌ Error reconstruyendo resúmenes: {e}")
+            raise
+
     def show_sample_data(self):
         """Muestra los datos de ejemplo creados"""
         try:
@@ -264,6 +391,7 @@ class DatabaseSetup:
         if insert_samples:
             print("📝 Insertando datos de ejemplo...")
             self.insert_sample_data()
+            self.rebuild_summaries()
             self.show_sample_data()
 
         print("\n" + "=" * 80)
@@ -272,6 +400,13 @@ class DatabaseSetup:
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Configuración de la base de datos')
+    parser.add_argument('--solo-resumenes', action='store_true',
+                        help='Solo crear tablas faltantes y reconstruir los resúmenes diarios/mensuales')
+    args = parser.parse_args()
+
     # Cargar configuración desde .env si existe
     load_dotenv()
 
@@ -297,6 +432,11 @@ if __name__ == "__main__":
         password=DB_PASSWORD
     )
 
+    if args.solo_resumenes:
+        setup.create_tables()
+        setup.rebuild_summaries()
+        raise SystemExit(0)
+
     try:
         # Ejecutar setup completo
         setup.setup(insert_samples=True)
@@ -311,6 +451,7 @@ if __name__ == "__main__":
             print("   • DISMINUIR <cedula> <monto>")
             print("   • CREAR <cedula> <nombres> <apellidos> <saldo>")
             print("   • HISTORIAL <cedula>")
+            print("   • SUMMARY <cedula> [DIARIO|MENSUAL] [limite]")
             print("   • STATS")
             print("   • SALIR\n")
 
@@ -0,0 +1,190 @@
+"""
+Anillo de Hash Consistente - Sistema Bancario
+Asigna cada cédula a un único servidor socket (su dueño) para que los locks
+en memoria de SocketServer sigan siendo correctos con varios servidores
+
+- Nodos virtuales por servidor para repartir las cédulas de forma pareja
+- Al entrar o salir un servidor solo cambian de dueño las cédulas de su tramo
+- Transferencias entre cédulas con dueños distintos: débito en el dueño de
+  la origen, crédito en el de la destino y reverso del débito si el crédito
+  falla (comandos TRANSFERIR_DEBITO / TRANSFERIR_CREDITO / TRANSFERIR_REVERSO,
+  idempotentes por id de transferencia en todo el clúster)
+
+Lo usan SocketBalancer en el bridge y SocketClient con varios servidores.
+"""
+
+import bisect
+import hashlib
+import logging
+import uuid
+
+
+# Comandos cuyo primer argumento es la cédula afectada
+COMANDOS_CON_CEDULA = {
+    'CONSULTA', 'AUMENTAR', 'DISMINUIR', 'CREAR', 'HISTORIAL', 'SUMMARY',
+    'TRANSFERIR_DEBITO', 'TRANSFERIR_CREDITO', 'TRANSFERIR_REVERSO',
+}
+
+# Comandos que modifican saldos y necesitan el lock del dueño
+COMANDOS_ESCRITURA = {
+    'AUMENTAR', 'DISMINUIR', 'CREAR', 'TRANSFERIR',
+    'TRANSFERIR_DEBITO', 'TRANSFERIR_CREDITO', 'TRANSFERIR_REVERSO',
+}
+
+
+def _hash(clave):
+    return int.from_bytes(hashlib.md5(clave.encode('utf-8')).digest()[:8], 'big')
+
+
+def cedulas_de_comando(comando):
+    """Cédulas que toca un comando del protocolo (vacío si no es de una cuenta)"""
+    partes = comando.split()
+    if len(partes) < 2:
+        return ()
+    nombre = partes[0].upper()
+    if nombre == 'TRANSFERIR' and len(partes) >= 3:
+        return (partes[1], partes[2])
+    if nombre in COMANDOS_CON_CEDULA:
+        return (partes[1],)
+    return ()
+
+
+def es_escritura(comando):
+    partes = comando.split(None, 1)
+    return bool(partes) and partes[0].upper() in COMANDOS_ESCRITURA
+
+
+class HashRing:
+    """Anillo de hash consistente con nodos virtuales"""
+
+    def __init__(self, nodos=(), replicas=128):
+        """
+        Args:
+            nodos: identificadores de servidor ("host:puerto")
+            replicas: nodos virtuales por servidor
+        """
+        self.replicas = replicas
+        self.puntos = []  # hashes ordenados
+        self.duenos = {}  # {hash: nodo}
+        self.nodos = set()
+        for nodo in nodos:
+            self.agregar(nodo)
+
+    def agregar(self, nodo):
+        if nodo in self.nodos:
+            return
+        self.nodos.add(nodo)
+        for i in range(self.replicas):
+            punto = _hash(f"{nodo}#{i}")
+            if punto not in self.duenos:
+                self.duenos[punto] = nodo
+                bisect.insort(self.puntos, punto)
+
+    def quitar(self, nodo):
+        if nodo not in self.nodos:
+            return
+        self.nodos.discard(nodo)
+        for i in range(self.replicas):
+            punto = _hash(f"{nodo}#{i}")
+            if self.duenos.get(punto) == nodo:
+                del self.duenos[punto]
+                self.puntos.pop(bisect.bisect_left(self.puntos, punto))
+
+    def copiar(self):
+        """Copia independiente (para consultar muchas claves sin tomar el lock del dueño)"""
+        copia = HashRing(replicas=self.replicas)
+        copia.puntos = list(self.puntos)
+        copia.duenos = dict(self.duenos)
+        copia.nodos = set(self.nodos)
+        return copia
+
+    def nodo_de(self, clave):
+        """Servidor dueño de la clave, o None si el anillo está vacío"""
+        if not self.puntos:
+            return None
+        indice = bisect.bisect(self.puntos, _hash(clave)) % len(self.puntos)
+        return self.duenos[self.puntos[indice]]
+
+    def distribucion(self):
+        """Fracción del anillo que le corresponde a cada nodo"""
+        if not self.puntos:
+            return {}
+        espacio = 1 << 64
+        fracciones = dict.fromkeys(self.nodos, 0.0)
+        anterior = self.puntos[-1] - espacio
+        for punto in self.puntos:
+            fracciones[self.duenos[punto]] += (punto - anterior) / espacio
+            anterior = punto
+        return {nodo: round(f, 4) for nodo, f in fracciones.items()}
+
+    def __len__(self):
+        return len(self.nodos)
+
+
+def _enviar_con_reintentos(enviar, comando, intentos):
+    """Repite un comando idempotente por id ante errores de transporte"""
+    ultimo_error = None
+    for _ in range(intentos):
+        try:
+            return enviar(comando)
+        except Exception as e:
+            ultimo_error = e
+            logging.warning(f"⚠️ Reintentando '{comando}': {e}")
+    return f"ERROR|Error de conexión: {ultimo_error}"
+
+
+def transferir_con_handoff(enviar, cedula_origen, cedula_destino, monto, intentos=3):
+    """
+    Transferencia entre cédulas de dueños distintos
+
+    Args:
+        enviar: función(comando) -> respuesta que enruta cada comando a su dueño
+            (puede lanzar excepción ante errores de transporte)
+
+    Returns:
+        respuesta con el mismo formato que TRANSFERIR
+    """
+    id_transferencia = uuid.uuid4().hex[:16]
+    argumentos = f"{monto} {id_transferencia}"
+
+    debito = _enviar_con_reintentos(
+        enviar, f"TRANSFERIR_DEBITO {cedula_origen} {cedula_destino} {argumentos}", intentos
+    )
+    if not debito.startswith('OK'):
+        if debito.startswith('ERROR|Error de conexión'):
+            # No se sabe si el débito se aplicó: el reverso lo anula en ambos casos
+            return _revertir(enviar, cedula_origen, cedula_destino, argumentos,
+                             id_transferencia, intentos, debito)
+        return debito
+
+    # El saldo de la origen tras el débito va al crédito para su evento TRANSFERENCIA
+    credito = _enviar_con_reintentos(
+        enviar, f"TRANSFERIR_CREDITO {cedula_destino} {cedula_origen} {argumentos} {debito.split('|')[2]}",
+        intentos
+    )
+    if credito.startswith('OK'):
+        return f"OK|Transferencia exitosa|{debito.split('|')[2]}|{credito.split('|')[2]}"
+
+    if credito.startswith('ERROR|Error de conexión'):
+        # El crédito pudo haberse aplicado: revertir el débito duplicaría dinero
+        logging.critical(
+            f"🚨 Transferencia {id_transferencia} de {cedula_origen} a {cedula_destino} "
+            f"por ${monto} sin confirmar crédito: requiere conciliación"
+        )
+        return f"ERROR|Transferencia {id_transferencia} pendiente de conciliación"
+
+    return _revertir(enviar, cedula_origen, cedula_destino, argumentos,
+                     id_transferencia, intentos, credito)
+
+
+def _revertir(enviar, cedula_origen, cedula_destino, argumentos, id_transferencia, intentos, error):
+    reverso = _enviar_con_reintentos(
+        enviar, f"TRANSFERIR_REVERSO {cedula_origen} {cedula_destino} {argumentos}", intentos
+    )
+    if reverso.startswith('OK'):
+        return error
+    logging.critical(
+        f"🚨 No se pudo revertir el débito de la transferencia {id_transferencia} "
+        f"({cedula_origen} -> {cedula_destino}): {reverso}"
+    )
+    return f"ERROR|Transferencia {id_transferencia} pendiente de conciliación"
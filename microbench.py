@@ -0,0 +1,178 @@
+"""
+Microbenchmarks en Proceso - Sistema Bancario Distribuido
+Mide el costo de parseo y formateo del protocolo sin sockets ni MySQL
+
+- SocketServer.procesar_comando (parseo + cmd_* + formateo de la respuesta)
+  sobre InMemoryDatabaseManager
+- SocketBridge.parsear_respuesta para cada tipo de respuesta
+
+Reporta ns/op y memoria por operación (bytes pico vía tracemalloc y bloques
+retenidos vía sys.getallocatedblocks) para optimizar parser y formateadores
+de forma aislada.
+"""
+
+import gc
+import json
+import logging
+import statistics
+import sys
+import time
+import tracemalloc
+from db_memory import InMemoryDatabaseManager
+from socket_server import SocketServer
+
+
+CEDULA = '0912345678'
+CEDULA_DESTINO = '1104567890'
+
+
+def crear_servidor(transacciones_previas=20):
+    """SocketServer sin arrancar, con BD en memoria y algo de historial"""
+    db = InMemoryDatabaseManager([
+        (CEDULA, 'Luis Alberto', 'Fernández Ruiz', 1_000_000.0),
+        (CEDULA_DESTINO, 'Ana María', 'González Torres', 1_000_000.0),
+    ])
+    server = SocketServer()
+    server.db_manager = db
+    for i in range(transacciones_previas):
+        server.procesar_comando(f"AUMENTAR {CEDULA} {i + 1}.50", 'bench')
+    return server
+
+
+def casos_servidor(server):
+    """Casos de procesar_comando: (nombre, función sin argumentos)"""
+    comandos = {
+        'CONSULTA': f"CONSULTA {CEDULA}",
+        'AUMENTAR': f"AUMENTAR {CEDULA} 10.25",
+        'DISMINUIR': f"DISMINUIR {CEDULA} 0.25",
+        'TRANSFERIR': f"TRANSFERIR {CEDULA} {CEDULA_DESTINO} 0.10",
+        'HISTORIAL': f"HISTORIAL {CEDULA}",
+        'SUMMARY': f"SUMMARY {CEDULA} MENSUAL 12",
+        'STATS': "STATS",
+        'INVALIDO': "FOO BAR",
+    }
+    return [
+        (f"procesar_comando {nombre}", lambda c=comando: server.procesar_comando(c, 'bench'))
+        for nombre, comando in comandos.items()
+    ]
+
+
+def casos_bridge(server):
+    """Casos de parsear_respuesta con respuestas reales del servidor"""
+    from socket_bridge import SocketBridge
+
+    respuestas = {
+        'consulta': server.procesar_comando(f"CONSULTA {CEDULA}", 'bench'),
+        'deposito': server.procesar_comando(f"AUMENTAR {CEDULA} 1.00", 'bench'),
+        'transferir': server.procesar_comando(f"TRANSFERIR {CEDULA} {CEDULA_DESTINO} 0.10", 'bench'),
+        'historial': server.procesar_comando(f"HISTORIAL {CEDULA}", 'bench'),
+        'resumen': server.procesar_comando(f"SUMMARY {CEDULA} DIARIO 30", 'bench'),
+        'stats': server.procesar_comando("STATS", 'bench'),
+        'error': server.procesar_comando("CONSULTA 0000000000", 'bench'),
+    }
+    return [
+        (f"parsear_respuesta {nombre}", lambda r=respuesta: SocketBridge.parsear_respuesta(r))
+        for nombre, respuesta in respuestas.items()
+    ]
+
+
+def _calibrar(funcion, objetivo_s):
+    """Iteraciones necesarias para que una repetición dure ~objetivo_s"""
+    n = 1
+    while True:
+        inicio = time.perf_counter()
+        for _ in range(n):
+            funcion()
+        if time.perf_counter() - inicio >= objetivo_s / 10 or n >= 10_000_000:
+            return max(int(n * objetivo_s / max(time.perf_counter() - inicio, 1e-9)), 1)
+        n *= 2
+
+
+def medir_tiempo(funcion, repeticiones=5, objetivo_s=0.2):
+    """ns/op: mediana de varias repeticiones de un bucle calibrado"""
+    n = _calibrar(funcion, objetivo_s)
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter_ns()
+        for _ in range(n):
+            funcion()
+        tiempos.append((time.perf_counter_ns() - inicio) / n)
+    return {
+        'iteraciones': n,
+        'ns_op': round(statistics.median(tiempos), 1),
+        'ns_op_min': round(min(tiempos), 1),
+    }
+
+
+def medir_memoria(funcion, muestras=200):
+    """
+    Memoria por operación
+
+    bytes_pico_op: memoria transitoria máxima de una llamada (tracemalloc)
+    bloques_retenidos_op: bloques que siguen vivos después de la llamada
+    """
+    gc.collect()
+    bloques_antes = sys.getallocatedblocks()
+    for _ in range(muestras):
+        funcion()
+    gc.collect()
+    bloques_retenidos = (sys.getallocatedblocks() - bloques_antes) / muestras
+
+    picos = []
+    tracemalloc.start()
+    try:
+        for _ in range(muestras):
+            actual, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            funcion()
+            _, pico = tracemalloc.get_traced_memory()
+            picos.append(pico - actual)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'bytes_pico_op': int(statistics.median(picos)),
+        'bloques_retenidos_op': round(bloques_retenidos, 2),
+    }
+
+
+def ejecutar(filtro=None, repeticiones=5, objetivo_s=0.2):
+    """Ejecuta todos los casos (o los que contengan `filtro`) y retorna resultados"""
+    server = crear_servidor()
+    casos = casos_servidor(server) + casos_bridge(server)
+    resultados = []
+    for nombre, funcion in casos:
+        if filtro and filtro not in nombre:
+            continue
+        resultado = {'caso': nombre}
+        resultado.update(medir_tiempo(funcion, repeticiones, objetivo_s))
+        resultado.update(medir_memoria(funcion))
+        resultados.append(resultado)
+    return resultados
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Microbenchmarks de parseo y formateo del protocolo')
+    parser.add_argument('--filtro', help='Solo casos cuyo nombre contenga este texto')
+    parser.add_argument('--repeticiones', type=int, default=5, help='Repeticiones por caso')
+    parser.add_argument('--objetivo', type=float, default=0.2, help='Segundos por repetición')
+    parser.add_argument('--con-logging', action='store_true',
+                        help='Incluir el costo del logging INFO de cada comando')
+    parser.add_argument('--json', action='store_true', help='Salida en JSON')
+    args = parser.parse_args()
+
+    if not args.con_logging:
+        logging.disable(logging.CRITICAL)
+
+    resultados = ejecutar(args.filtro, args.repeticiones, args.objetivo)
+
+    if args.json:
+        print(json.dumps(resultados, indent=2, ensure_ascii=False))
+    else:
+        print(f"\n{'Caso':<36} {'ns/op':>12} {'min ns/op':>12} {'B/op pico':>12} {'bloques/op':>12}")
+        print("-" * 88)
+        for r in resultados:
+            print(f"{r['caso']:<36} {r['ns_op']:>12,.1f} {r['ns_op_min']:>12,.1f} "
+                  f"{r['bytes_pico_op']:>12,} {r['bloques_retenidos_op']:>12}")
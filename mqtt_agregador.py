@@ -0,0 +1,159 @@
+"""
+Agregación en Tiempo Real de Eventos MQTT - Sistema Bancario
+Métricas de ventana deslizante calculadas a medida que llegan los eventos
+
+- Ventana de `ventana_s` segundos partida en cubetas fijas de `cubeta_s`
+  (anillo de tamaño constante): al avanzar el reloj, la cubeta que sale de
+  la ventana se resta de los totales y se reutiliza
+- Totales incrementales: transacciones por segundo, volumen por tipo,
+  relación depósitos/retiros y volumen por cuenta
+- Cuentas por cubeta acotadas (Space-Saving): con más de `max_cuentas`
+  cuentas distintas en un segundo, la de menor volumen cede su lugar y la
+  nueva hereda ese volumen; el top de cuentas puede sobrestimar cuentas
+  chicas, nunca omitir una cuenta grande
+- resumen() produce el payload compacto que MQTTSubscriber publica
+  retenido en banco/agregados
+"""
+
+import heapq
+import threading
+import time
+from datetime import datetime
+
+
+TOPIC_AGREGADOS = "banco/agregados"
+
+TIPOS = ('DEPOSITO', 'RETIRO', 'TRANSFERENCIA')
+
+
+class _Cubeta:
+    __slots__ = ('indice', 'conteo', 'volumen', 'cuentas')
+
+    def __init__(self):
+        self.indice = None  # Número de cubeta absoluto (tiempo // cubeta_s)
+        self.conteo = 0
+        self.volumen = dict.fromkeys(TIPOS, 0.0)
+        self.cuentas = {}
+
+
+class AgregadorVentana:
+    """Agregados de una ventana deslizante con memoria constante"""
+
+    def __init__(self, ventana_s=60, cubeta_s=1, top=10, max_cuentas=500, reloj=time.time):
+        """
+        Args:
+            ventana_s: largo de la ventana en segundos
+            cubeta_s: resolución de la ventana (segundos por cubeta)
+            top: cantidad de cuentas en el top por volumen
+            max_cuentas: cuentas distintas que recuerda cada cubeta
+            reloj: fuente de tiempo (segundos)
+        """
+        self.cubeta_s = cubeta_s
+        self.cubetas = [_Cubeta() for _ in range(max(int(ventana_s / cubeta_s), 1))]
+        ventana = len(self.cubetas) * cubeta_s
+        self.ventana_s = int(ventana) if float(ventana).is_integer() else ventana
+        self.top = top
+        self.max_cuentas = max_cuentas
+        self.reloj = reloj
+        self.inicio = reloj()
+        self.lock = threading.Lock()
+
+        # Totales de la ventana, mantenidos al entrar y salir cada cubeta
+        self.conteo = 0
+        self.volumen = dict.fromkeys(TIPOS, 0.0)
+        self.cuentas = {}
+        self.metricas = {'eventos': 0, 'ignorados': 0, 'cuentas_desplazadas': 0}
+
+    def _cubeta(self, ahora):
+        """Cubeta del instante actual, vaciando la que ocupaba su lugar en el anillo"""
+        indice = int(ahora // self.cubeta_s)
+        cubeta = self.cubetas[indice % len(self.cubetas)]
+        if cubeta.indice != indice:
+            self._retirar(cubeta)
+            cubeta.indice = indice
+        return cubeta
+
+    def _retirar(self, cubeta):
+        self.conteo -= cubeta.conteo
+        for tipo, monto in cubeta.volumen.items():
+            self.volumen[tipo] -= monto
+        for cedula, monto in cubeta.cuentas.items():
+            restante = self.cuentas[cedula] - monto
+            if restante <= 1e-9:
+                del self.cuentas[cedula]
+            else:
+                self.cuentas[cedula] = restante
+        cubeta.conteo = 0
+        cubeta.volumen = dict.fromkeys(TIPOS, 0.0)
+        cubeta.cuentas = {}
+
+    def _sumar_cuenta(self, cubeta, cedula, monto):
+        cuentas = cubeta.cuentas
+        if cedula not in cuentas and len(cuentas) >= self.max_cuentas:
+            # Space-Saving: la cuenta más chica de la cubeta deja su lugar
+            menor = min(cuentas, key=cuentas.get)
+            heredado = cuentas.pop(menor)
+            restante = self.cuentas[menor] - heredado
+            if restante <= 1e-9:
+                del self.cuentas[menor]
+            else:
+                self.cuentas[menor] = restante
+            cuentas[cedula] = heredado
+            self.cuentas[cedula] = self.cuentas.get(cedula, 0.0) + heredado
+            self.metricas['cuentas_desplazadas'] += 1
+        cuentas[cedula] = cuentas.get(cedula, 0.0) + monto
+        self.cuentas[cedula] = self.cuentas.get(cedula, 0.0) + monto
+
+    def registrar(self, topic, payload):
+        """Suma un evento de banco/transacciones o banco/transferencias; ignora el resto"""
+        if topic == "banco/transacciones":
+            tipo, cedulas = payload.get('tipo'), (payload.get('cedula'),)
+        elif topic == "banco/transferencias":
+            tipo, cedulas = 'TRANSFERENCIA', (payload.get('cedula_origen'), payload.get('cedula_destino'))
+        else:
+            return
+        try:
+            monto = float(payload['monto'])
+        except (KeyError, TypeError, ValueError):
+            monto = None
+        with self.lock:
+            if tipo not in self.volumen or monto is None:
+                self.metricas['ignorados'] += 1
+                return
+            cubeta = self._cubeta(self.reloj())
+            cubeta.conteo += 1
+            cubeta.volumen[tipo] += monto
+            self.conteo += 1
+            self.volumen[tipo] += monto
+            for cedula in cedulas:
+                if cedula:
+                    self._sumar_cuenta(cubeta, cedula, monto)
+            self.metricas['eventos'] += 1
+
+    def resumen(self):
+        """Agregados de la ventana actual (payload de banco/agregados)"""
+        with self.lock:
+            ahora = self.reloj()
+            # Avanzar el anillo aunque no lleguen eventos: vacía lo que ya salió
+            vencida = int(ahora // self.cubeta_s) - len(self.cubetas)
+            for cubeta in self.cubetas:
+                if cubeta.indice is not None and cubeta.indice <= vencida:
+                    self._retirar(cubeta)
+                    cubeta.indice = None
+
+            transcurrido = min(max(ahora - self.inicio, self.cubeta_s), self.ventana_s)
+            depositos, retiros = self.volumen['DEPOSITO'], self.volumen['RETIRO']
+            top = heapq.nlargest(self.top, self.cuentas.items(), key=lambda item: item[1])
+            return {
+                'ventana_s': self.ventana_s,
+                'tps': round(self.conteo / transcurrido, 2),
+                'transacciones': self.conteo,
+                'volumen': {tipo: round(max(monto, 0.0), 2) for tipo, monto in self.volumen.items()},
+                'ratio_depositos_retiros': round(depositos / retiros, 3) if retiros >= 0.01 else None,
+                'top_cuentas': [[cedula, round(monto, 2)] for cedula, monto in top],
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+            }
+
+    def stats(self):
+        with self.lock:
+            return {**self.metricas, 'cuentas_en_ventana': len(self.cuentas)}
@@ -0,0 +1,214 @@
+"""
+Codificación Compacta de Eventos MQTT - Sistema Bancario
+Lotes de eventos en registros binarios de tamaño fijo por tipo
+
+Un mensaje del tópico banco/lote reemplaza a muchos mensajes JSON:
+
+    Cabecera: 'BQ' | versión (1 byte) | base_ms (int64) | cantidad (uint16)
+    Registro: tipo (1 byte) | flags (1 byte) | delta_ms (uint32) | campos
+        TRANSACCION_*: cedula | monto | saldo_nuevo
+        TRANSFERENCIA: cedula_origen | cedula_destino | monto | saldo_origen | saldo_destino
+        SALDO:         cedula | saldo_nuevo | saldo_anterior
+
+- Cédulas: longitud (1 byte) + UTF-8; montos y saldos: centavos en int64
+  (saldo_anterior ausente = INT64_MIN)
+- Fecha: milisegundos desde base_ms, en lugar de un ISO por evento
+- flags & 1: trace_id (16 bytes) y span_id (8 bytes) de la traza muestreada
+- Una transacción viaja una sola vez; al decodificar se entrega en
+  banco/transacciones y en banco/depositos o banco/retiros, igual que en JSON
+"""
+
+import struct
+from datetime import datetime
+
+
+TOPIC_LOTE = "banco/lote"
+
+MAGIA = b'BQ'
+VERSION = 1
+
+TRANSACCION_DEPOSITO = 1
+TRANSACCION_RETIRO = 2
+TRANSFERENCIA = 3
+SALDO = 4
+
+_CABECERA = struct.Struct('>2sBqH')
+_REGISTRO = struct.Struct('>BBI')
+_DOS_MONTOS = struct.Struct('>qq')
+_TRES_MONTOS = struct.Struct('>qqq')
+_SIN_VALOR = -(1 << 63)
+_CON_TRAZA = 0x01
+
+MAX_REGISTROS = 0xFFFF
+
+
+class LoteInvalidoError(ValueError):
+    """El mensaje no es un lote de eventos válido"""
+
+
+def _centavos(valor):
+    return _SIN_VALOR if valor is None else int(round(float(valor) * 100))
+
+
+def _monto(centavos):
+    return None if centavos == _SIN_VALOR else centavos / 100
+
+
+def _ms(timestamp):
+    """Milisegundos epoch de un timestamp ISO (el formato de los payloads JSON)"""
+    return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+
+
+def _cedula(texto):
+    datos = str(texto).encode('utf-8')
+    if len(datos) > 255:
+        raise ValueError(f"Cédula demasiado larga: {texto!r}")
+    return bytes((len(datos),)) + datos
+
+
+def codificar_lote(eventos):
+    """
+    Empaqueta eventos en un mensaje binario
+
+    Args:
+        eventos: lista de (tipo, payload) con los mismos campos que los
+            payloads JSON de MQTTPublisher (timestamp ISO incluido); un
+            payload puede traer 'traceparent'
+
+    Returns:
+        bytes del mensaje
+    """
+    if len(eventos) > MAX_REGISTROS:
+        raise ValueError(f"Lote con más de {MAX_REGISTROS} eventos")
+
+    tiempos = [_ms(payload['timestamp']) for _, payload in eventos]
+    base_ms = min(tiempos) if tiempos else 0
+    partes = [_CABECERA.pack(MAGIA, VERSION, base_ms, len(eventos))]
+
+    for (tipo, p), ms in zip(eventos, tiempos):
+        traza = p.get('traceparent')
+        flags = _CON_TRAZA if traza else 0
+        partes.append(_REGISTRO.pack(tipo, flags, ms - base_ms))
+
+        if tipo in (TRANSACCION_DEPOSITO, TRANSACCION_RETIRO):
+            partes.append(_cedula(p['cedula']))
+            partes.append(_DOS_MONTOS.pack(_centavos(p['monto']), _centavos(p['saldo_nuevo'])))
+        elif tipo == TRANSFERENCIA:
+            partes.append(_cedula(p['cedula_origen']))
+            partes.append(_cedula(p['cedula_destino']))
+            partes.append(_TRES_MONTOS.pack(
+                _centavos(p['monto']), _centavos(p['saldo_origen']), _centavos(p['saldo_destino'])
+            ))
+        elif tipo == SALDO:
+            partes.append(_cedula(p['cedula']))
+            partes.append(_DOS_MONTOS.pack(_centavos(p['saldo_nuevo']), _centavos(p.get('saldo_anterior'))))
+        else:
+            raise ValueError(f"Tipo de evento desconocido: {tipo}")
+
+        if traza:
+            _, trace_id, span_id, _ = traza.split('-')
+            partes.append(bytes.fromhex(trace_id) + bytes.fromhex(span_id))
+
+    return b''.join(partes)
+
+
+def es_lote(datos):
+    return datos[:2] == MAGIA
+
+
+class _Lector:
+    __slots__ = ('datos', 'pos')
+
+    def __init__(self, datos):
+        self.datos = datos
+        self.pos = 0
+
+    def leer(self, estructura):
+        valores = estructura.unpack_from(self.datos, self.pos)
+        self.pos += estructura.size
+        return valores
+
+    def cedula(self):
+        largo = self.datos[self.pos]
+        inicio = self.pos + 1
+        self.pos = inicio + largo
+        if self.pos > len(self.datos):
+            raise LoteInvalidoError("Lote truncado")
+        return self.datos[inicio:self.pos].decode('utf-8')
+
+    def bytes(self, n):
+        inicio = self.pos
+        self.pos += n
+        if self.pos > len(self.datos):
+            raise LoteInvalidoError("Lote truncado")
+        return self.datos[inicio:self.pos]
+
+
+def decodificar_lote(datos):
+    """
+    Desempaqueta un lote en los mensajes que habría producido el modo JSON
+
+    Returns:
+        lista de (topic, payload dict) en el orden de publicación
+
+    Raises:
+        LoteInvalidoError si el mensaje no es un lote válido
+    """
+    try:
+        lector = _Lector(memoryview(datos).tobytes())
+        magia, version, base_ms, cantidad = lector.leer(_CABECERA)
+        if magia != MAGIA or version != VERSION:
+            raise LoteInvalidoError(f"Cabecera de lote desconocida: {magia!r} v{version}")
+
+        mensajes = []
+        for _ in range(cantidad):
+            tipo, flags, delta_ms = lector.leer(_REGISTRO)
+            timestamp = datetime.fromtimestamp((base_ms + delta_ms) / 1000).isoformat()
+
+            if tipo in (TRANSACCION_DEPOSITO, TRANSACCION_RETIRO):
+                cedula = lector.cedula()
+                monto, saldo = lector.leer(_DOS_MONTOS)
+                deposito = tipo == TRANSACCION_DEPOSITO
+                payload = {
+                    'cedula': cedula,
+                    'tipo': 'DEPOSITO' if deposito else 'RETIRO',
+                    'monto': _monto(monto),
+                    'saldo_nuevo': _monto(saldo),
+                    'timestamp': timestamp,
+                }
+                topics = ('banco/transacciones', 'banco/depositos' if deposito else 'banco/retiros')
+            elif tipo == TRANSFERENCIA:
+                origen, destino = lector.cedula(), lector.cedula()
+                monto, saldo_origen, saldo_destino = lector.leer(_TRES_MONTOS)
+                payload = {
+                    'cedula_origen': origen,
+                    'cedula_destino': destino,
+                    'monto': _monto(monto),
+                    'saldo_origen': _monto(saldo_origen),
+                    'saldo_destino': _monto(saldo_destino),
+                    'timestamp': timestamp,
+                }
+                topics = ('banco/transferencias',)
+            elif tipo == SALDO:
+                cedula = lector.cedula()
+                saldo_nuevo, saldo_anterior = lector.leer(_DOS_MONTOS)
+                payload = {
+                    'cedula': cedula,
+                    'saldo_nuevo': _monto(saldo_nuevo),
+                    'saldo_anterior': _monto(saldo_anterior),
+                    'timestamp': timestamp,
+                }
+                topics = (f"banco/saldo/{cedula}",)
+            else:
+                raise LoteInvalidoError(f"Tipo de evento desconocido: {tipo}")
+
+            if flags & _CON_TRAZA:
+                ids = lector.bytes(24)
+                payload['traceparent'] = f"00-{ids[:16].hex()}-{ids[16:].hex()}-01"
+
+            for topic in topics:
+                mensajes.append((topic, payload))
+        return mensajes
+
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise LoteInvalidoError(f"Lote mal formado: {e}")
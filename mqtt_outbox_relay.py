@@ -0,0 +1,240 @@
+"""
+Relay del Outbox MQTT - Sistema Bancario
+Publica los eventos que el servidor socket guarda en outbox_mqtt (MQTT_OUTBOX=1)
+
+- El servidor escribe cada evento en la misma transacción de BD que el
+  historial: si el commit ocurre, el evento no se pierde aunque el broker
+  esté caído o el servidor muera antes de publicar
+- El relay lee el outbox en lotes por id, publica con MQTTPublisher (JSON o
+  lotes binarios según MQTT_BATCH) y espera la confirmación del broker antes
+  de avanzar su cursor en outbox_cursor: entrega al menos una vez, y al
+  reiniciar retoma desde el último lote confirmado
+- Un id que falta puede ser una transacción que aún no hizo commit: el relay
+  lo espera OUTBOX_GAP_MS antes de avanzar el cursor sin él. Los ids saltados
+  se registran en WARNING y se vuelven a buscar durante OUTBOX_GAP_RECHECK_S:
+  un commit tardío (esperas de locks, rebuild_summaries) se publica fuera de
+  orden; solo al vencer ese plazo se da por revertido. La purga no borra
+  desde el id saltado más viejo
+- Los eventos ya publicados se borran cada OUTBOX_PURGE_S segundos
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+from db_connection import DatabaseManager
+from mqtt_publisher import MQTTPublisher
+import tracing
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class OutboxRelay:
+    """Lleva los eventos de outbox_mqtt al broker, en orden y sin perderlos"""
+
+    def __init__(self, db_manager, publisher, nombre='mqtt'):
+        """
+        Args:
+            db_manager: DatabaseManager (o InMemoryDatabaseManager)
+            publisher: MQTTPublisher creado con confirmar=True
+            nombre: clave del cursor en outbox_cursor (un relay por nombre)
+        """
+        self.db = db_manager
+        self.publisher = publisher
+        self.nombre = nombre
+
+        self.lote = int(os.getenv('OUTBOX_BATCH', 500))
+        self.intervalo = float(os.getenv('OUTBOX_POLL_MS', 100)) / 1000
+        self.espera_hueco = float(os.getenv('OUTBOX_GAP_MS', 2000)) / 1000
+        self.revision_huecos = float(os.getenv('OUTBOX_GAP_RECHECK_S', 300))
+        self.timeout_confirmacion = float(os.getenv('OUTBOX_ACK_TIMEOUT', 10))
+        self.intervalo_purga = float(os.getenv('OUTBOX_PURGE_S', 60))
+
+        self.cursor = 0
+        self.huecos = {}  # id faltante -> monotonic de cuando se vio por primera vez
+        self.saltados = {}  # id ya detrás del cursor -> monotonic de cuando se saltó
+        self.ultima_revision = 0.0
+        self.detener = threading.Event()
+        self.lock = threading.Lock()
+        self.metricas = {
+            'publicados': 0,
+            'lotes': 0,
+            'reintentos': 0,
+            'huecos_saltados': 0,
+            'huecos_recuperados': 0,
+            'huecos_perdidos': 0,
+            'purgados': 0,
+            'retraso_s': 0.0,
+        }
+
+    def _publicables(self, filas):
+        """Filas desde el cursor hasta el primer hueco de ids que todavía puede llenarse"""
+        ahora = time.monotonic()
+        esperado = self.cursor + 1
+        for i, fila in enumerate(filas):
+            if fila['id'] > esperado:
+                visto = self.huecos.setdefault(esperado, ahora)
+                if ahora - visto < self.espera_hueco:
+                    return filas[:i]
+                # Nadie llenó el hueco a tiempo: seguir, pero volver a buscar esos ids
+                del self.huecos[esperado]
+                for id_faltante in range(esperado, fila['id']):
+                    self.saltados[id_faltante] = ahora
+                with self.lock:
+                    self.metricas['huecos_saltados'] += fila['id'] - esperado
+                logger.warning(
+                    f"⚠️ Outbox: ids {esperado}-{fila['id'] - 1} saltados sin commit tras "
+                    f"{self.espera_hueco:g}s; se revisan durante {self.revision_huecos:g}s"
+                )
+            esperado = fila['id'] + 1
+        return filas
+
+    def _tardios(self):
+        """Filas de ids saltados que hicieron commit después; olvida los vencidos"""
+        ahora = time.monotonic()
+        if not self.saltados or ahora - self.ultima_revision < self.espera_hueco:
+            return []
+        self.ultima_revision = ahora
+        filas = self.db.leer_outbox_ids(sorted(self.saltados))
+
+        encontrados = {fila['id'] for fila in filas}
+        vencidos = sorted(
+            i for i, t in self.saltados.items()
+            if i not in encontrados and ahora - t >= self.revision_huecos
+        )
+        if vencidos:
+            for i in vencidos:
+                del self.saltados[i]
+            with self.lock:
+                self.metricas['huecos_perdidos'] += len(vencidos)
+            logger.warning(
+                f"⚠️ Outbox: ids {vencidos} sin commit tras {self.revision_huecos:g}s; "
+                f"se dan por revertidos"
+            )
+        return filas
+
+    def _publicar(self, filas):
+        """Publica un lote y espera la confirmación del broker para todo"""
+        for fila in filas:
+            with tracing.continuar(fila['traceparent']):
+                if not self.publisher.publish_event(fila['tipo'], fila['datos']):
+                    # Se desconectó a mitad del lote: descartar lo pendiente de confirmar
+                    self.publisher.esperar_confirmacion(0)
+                    return False
+        return self.publisher.esperar_confirmacion(self.timeout_confirmacion)
+
+    def procesar_lote(self):
+        """
+        Un paso del relay: lee, publica y avanza el cursor
+
+        Returns:
+            cantidad de eventos publicados (0 si no había nada listo o falló)
+        """
+        filas = self._publicables(self.db.leer_outbox(self.cursor, self.lote))
+        tardios = self._tardios()
+        if not filas and not tardios:
+            return 0
+
+        # Los tardíos son más viejos que el lote: van primero
+        if not self._publicar(tardios + filas):
+            # El cursor no avanza: el lote completo se vuelve a publicar
+            with self.lock:
+                self.metricas['reintentos'] += 1
+            logger.warning(f"⚠️ Lote del outbox sin confirmar desde id {self.cursor + 1}; se reintentará")
+            return 0
+
+        if tardios:
+            for fila in tardios:
+                del self.saltados[fila['id']]
+            with self.lock:
+                self.metricas['huecos_recuperados'] += len(tardios)
+            logger.info(f"📤 Outbox: {len(tardios)} eventos con commit tardío publicados fuera de orden")
+
+        with self.lock:
+            self.metricas['publicados'] += len(tardios) + len(filas)
+            self.metricas['lotes'] += 1
+        if not filas:
+            return 0
+
+        self.cursor = filas[-1]['id']
+        self.db.guardar_cursor_outbox(self.nombre, self.cursor)
+        self.huecos = {i: t for i, t in self.huecos.items() if i > self.cursor}
+
+        with self.lock:
+            # Antigüedad del último evento publicado
+            self.metricas['retraso_s'] = max((datetime.now() - filas[-1]['creado']).total_seconds(), 0.0)
+        return len(filas)
+
+    def ejecutar(self):
+        """Bucle del relay hasta detener(); retoma desde el cursor guardado"""
+        self.cursor = self.db.cursor_outbox(self.nombre)
+        logger.info(f"📤 Relay del outbox '{self.nombre}' desde id {self.cursor}")
+        ultima_purga = time.monotonic()
+
+        while not self.detener.is_set():
+            if not self.publisher.connected:
+                self.detener.wait(1)
+                continue
+            try:
+                publicados = self.procesar_lote()
+            except Exception as e:
+                logger.error(f"❌ Error en relay del outbox: {e}")
+                self.detener.wait(1)
+                continue
+
+            if time.monotonic() - ultima_purga >= self.intervalo_purga:
+                ultima_purga = time.monotonic()
+                try:
+                    # Un id saltado puede hacer commit todavía: no purgar desde él
+                    hasta_id = min(self.saltados) - 1 if self.saltados else None
+                    borradas = self.db.purgar_outbox(hasta_id=hasta_id)
+                    with self.lock:
+                        self.metricas['purgados'] += borradas
+                except Exception as e:
+                    logger.warning(f"⚠️ No se pudo purgar el outbox: {e}")
+
+            # Lote lleno: seguir sin esperar hasta alcanzar la cola del outbox
+            if publicados < self.lote:
+                self.detener.wait(self.intervalo)
+
+    def stop(self):
+        self.detener.set()
+
+    def stats(self):
+        with self.lock:
+            return {'relay': self.nombre, 'cursor': self.cursor, 'huecos_en_revision': len(self.saltados),
+                    **self.metricas}
+
+
+if __name__ == "__main__":
+    db_config = {
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'port': int(os.getenv('DB_PORT', 3306)),
+        'database': os.getenv('DB_NAME', 'examen'),
+        'user': os.getenv('DB_USER', 'socketuser'),
+        'password': os.getenv('DB_PASSWORD', '12345')
+    }
+
+    tracing.configurar('outbox-relay')
+
+    publisher = MQTTPublisher(confirmar=True)
+    if not publisher.connect():
+        raise SystemExit("❌ No se pudo iniciar el cliente MQTT")
+
+    relay = OutboxRelay(DatabaseManager(db_config), publisher, os.getenv('OUTBOX_RELAY', 'mqtt'))
+    try:
+        relay.ejecutar()
+    except KeyboardInterrupt:
+        logger.info("\n⏹️ Deteniendo relay del outbox...")
+    finally:
+        relay.stop()
+        publisher.disconnect()
+        logger.info(f"📊 Relay del outbox: {relay.stats()}")
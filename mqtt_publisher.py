@@ -1,24 +1,72 @@
 """
 MQTT Publisher - Sistema Bancario
 Publica eventos de transacciones a broker MQTT
+Con una traza muestreada en curso, cada payload lleva su `traceparent`
+
+- QoS configurable por tópico (MQTT_QOS) y ventana de mensajes en vuelo
+  (MQTT_MAX_INFLIGHT)
+- Modo lote opcional (MQTT_BATCH=1): transacciones, transferencias y saldos
+  se acumulan y salen juntos en un mensaje binario compacto por banco/lote
+  (mqtt_codec.py) cada MQTT_BATCH_MS o al juntar MQTT_BATCH_MAX eventos
+- Spool en disco opcional (MQTT_SPOOL_DIR): sin broker los mensajes van a
+  disco (mqtt_spool.py) y al reconectar se reenvían en orden, a
+  MQTT_SPOOL_RATE mensajes/s, antes que los nuevos. Con confirmar=True,
+  esperar_confirmacion() hace fsync del spool antes de dar por entregado
+  lo que quedó en disco
 """
 
 import paho.mqtt.client as mqtt
 import json
 import logging
 import os
+import threading
+import time
 from datetime import datetime
 from dotenv import load_dotenv
+import mqtt_codec
+from mqtt_spool import DiskSpool
+import tracing
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Marca en sin_confirmar de un mensaje que fue al spool: esperar_confirmacion
+# lo da por entregado después de sincronizar el spool a disco
+_EN_SPOOL = object()
+
+
+def parsear_qos(texto):
+    """'banco/saldo=0,banco/lote=1' -> {'banco/saldo': 0, 'banco/lote': 1}"""
+    niveles = {}
+    for item in (texto or '').split(','):
+        if not item.strip():
+            continue
+        topic, _, qos = item.partition('=')
+        qos = int(qos)
+        if qos not in (0, 1, 2):
+            raise ValueError(f"QoS inválido para {topic.strip()}: {qos}")
+        niveles[topic.strip()] = qos
+    return niveles
+
 
 class MQTTPublisher:
     """Publicador MQTT para eventos bancarios"""
 
-    def __init__(self):
+    # Evento (tipo, datos) del outbox -> método que lo publica
+    EVENTOS = {
+        'TRANSACCION': 'publish_transaction',
+        'TRANSFERENCIA': 'publish_transfer',
+        'SALDO': 'publish_balance_update',
+        'ALERTA': 'publish_alert',
+    }
+
+    def __init__(self, confirmar=False):
+        """
+        Args:
+            confirmar: guardar cada publicación para esperar_confirmacion()
+                (relay del outbox, entrega al menos una vez)
+        """
         self.broker_host = os.getenv('MQTT_BROKER_HOST', 'localhost')
         self.broker_port = int(os.getenv('MQTT_BROKER_PORT', 1883))
         self.username = os.getenv('MQTT_USERNAME')
@@ -35,6 +83,54 @@ class MQTTPublisher:
         self.TOPIC_BALANCE = "banco/saldo"               # Cambios de saldo
         self.TOPIC_STATS = "banco/estadisticas"          # Estadísticas del servidor
         self.TOPIC_ALERTS = "banco/alertas"              # Alertas (saldo bajo, etc)
+        self.TOPIC_BATCH = mqtt_codec.TOPIC_LOTE          # Lotes binarios (modo lote)
+
+        # QoS por tópico (banco/saldo cubre banco/saldo/<cedula>)
+        self.qos = {
+            self.TOPIC_TRANSACTIONS: 1,  # Al menos una vez
+            self.TOPIC_DEPOSITS: 1,
+            self.TOPIC_WITHDRAWALS: 1,
+            self.TOPIC_TRANSFERS: 1,
+            self.TOPIC_BALANCE: 1,
+            self.TOPIC_STATS: 0,  # Best effort para stats
+            self.TOPIC_ALERTS: 2,  # Exactly once para alertas
+            self.TOPIC_BATCH: 1,
+            **parsear_qos(os.getenv('MQTT_QOS')),
+        }
+        # Mensajes QoS>0 sin confirmar por el broker (ventana de paho)
+        self.max_inflight = int(os.getenv('MQTT_MAX_INFLIGHT', 20))
+
+        # Modo lote
+        self.lote_activo = os.getenv('MQTT_BATCH', '0') == '1'
+        self.lote_max = min(int(os.getenv('MQTT_BATCH_MAX', 200)), mqtt_codec.MAX_REGISTROS)
+        self.lote_intervalo = float(os.getenv('MQTT_BATCH_MS', 50)) / 1000
+        self.lote = []  # (tipo, payload) pendientes
+        self.lote_lock = threading.Lock()
+        self.envio_lock = threading.Lock()  # Los lotes salen en el orden en que se cierran
+        self.detener_lote = threading.Event()
+
+        self.metricas = {'eventos': 0, 'mensajes': 0, 'bytes': 0, 'lotes': 0}
+
+        # MQTTMessageInfo aún sin revisar; None = lote que no se pudo enviar
+        self.sin_confirmar = [] if confirmar else None
+
+        # Spool en disco para caídas del broker
+        self.spool = None
+        if os.getenv('MQTT_SPOOL_DIR'):
+            self.spool = DiskSpool(
+                os.getenv('MQTT_SPOOL_DIR'),
+                max_bytes=int(float(os.getenv('MQTT_SPOOL_MAX_MB', 256)) * 1024 * 1024),
+                segmento_bytes=int(float(os.getenv('MQTT_SPOOL_SEGMENT_MB', 8)) * 1024 * 1024)
+            )
+        self.spool_ritmo = float(os.getenv('MQTT_SPOOL_RATE', 500))
+        self.spool_lote = 100
+        self.detener_spool = threading.Event()
+        self.metricas['reproducidos'] = 0
+
+    @property
+    def disponible(self):
+        """Acepta eventos: conectado, o con spool donde guardarlos"""
+        return self.connected or self.spool is not None
 
     def connect(self):
         """Conectar al broker MQTT"""
@@ -45,6 +141,7 @@ class MQTTPublisher:
             )
             self.client.on_connect = self._on_connect
             self.client.on_disconnect = self._on_disconnect
+            self.client.max_inflight_messages_set(self.max_inflight)
 
             # Configurar credenciales si están definidas
             if self.username and self.password:
@@ -71,9 +168,26 @@ class MQTTPublisher:
             })
             self.client.will_set(self.TOPIC_ALERTS, will_payload, qos=1, retain=False)
 
-            self.client.connect(self.broker_host, self.broker_port, keepalive=60)
+            if self.spool is not None:
+                # Con spool, un broker caído al arrancar no es fatal: paho reintenta
+                self.client.connect_async(self.broker_host, self.broker_port, keepalive=60)
+                self.detener_spool.clear()
+                threading.Thread(target=self._reproducir_spool, name="mqtt-spool", daemon=True).start()
+                pendientes = self.spool.pendientes()
+                if pendientes:
+                    logger.info(f"📼 Spool MQTT con {pendientes} mensajes pendientes de una ejecución anterior")
+            else:
+                self.client.connect(self.broker_host, self.broker_port, keepalive=60)
             self.client.loop_start()  # Non-blocking loop
             logger.info(f"🔗 Conectando a broker MQTT {self.broker_host}:{self.broker_port}")
+
+            if self.lote_activo:
+                self.detener_lote.clear()
+                threading.Thread(target=self._vaciar_periodicamente, name="mqtt-lote", daemon=True).start()
+                logger.info(
+                    f"📦 MQTT en modo lote: hasta {self.lote_max} eventos "
+                    f"o {self.lote_intervalo * 1000:.0f} ms por mensaje"
+                )
             return True
         except Exception as e:
             logger.error(f"❌ Error conectando a MQTT broker: {e}")
@@ -93,9 +207,157 @@ class MQTTPublisher:
         if reason_code != 0:
             logger.warning(f"⚠️ Desconexión inesperada de MQTT. Code: {reason_code}")
 
+    def _qos(self, topic):
+        qos = self.qos.get(topic)
+        return qos if qos is not None else self.qos.get(topic.rsplit('/', 1)[0], 1)
+
+    def _enviar(self, topic, datos, retain=False, eventos=1):
+        if self.spool is not None and (not self.connected or self.spool.pendientes()):
+            # Sin broker, o con spool aún por reenviar (para no desordenar): a disco
+            self.spool.agregar(topic, datos, retain)
+            if self.sin_confirmar is not None:
+                self.sin_confirmar.append(_EN_SPOOL)
+            return
+        info = self.client.publish(topic, datos, qos=self._qos(topic), retain=retain)
+        if self.sin_confirmar is not None:
+            self.sin_confirmar.append(info)
+        self.metricas['eventos'] += eventos
+        self.metricas['mensajes'] += 1
+        self.metricas['bytes'] += len(datos)
+
+    def _publicar(self, topic, payload, retain=False):
+        """Publica un payload JSON dentro de un span PRODUCER propagando la traza"""
+        if tracing.traceparent_actual() is None:
+            # Publicaciones periódicas (stats) fuera de una petición: sin traza propia
+            self._enviar(topic, json.dumps(payload), retain)
+            return
+        with tracing.span('mqtt.publish', 'PRODUCER', topic=topic, qos=self._qos(topic)) as span:
+            if span.muestreado:
+                payload = {**payload, 'traceparent': span.traceparent()}
+            self._enviar(topic, json.dumps(payload), retain)
+
+    def _encolar(self, tipo, payload):
+        """Modo lote: agrega el evento al lote en curso y lo cierra si se llenó"""
+        if tracing.traceparent_actual() is not None:
+            with tracing.span('mqtt.encolar', 'PRODUCER', topic=self.TOPIC_BATCH) as span:
+                if span.muestreado:
+                    payload = {**payload, 'traceparent': span.traceparent()}
+        with self.lote_lock:
+            self.lote.append((tipo, payload))
+            lleno = len(self.lote) >= self.lote_max
+        if lleno:
+            self._vaciar_lote()
+
+    def _vaciar_lote(self):
+        """Publica los eventos acumulados como un solo mensaje binario"""
+        with self.envio_lock:
+            with self.lote_lock:
+                eventos, self.lote = self.lote, []
+            if not eventos:
+                return
+            try:
+                self._enviar(self.TOPIC_BATCH, mqtt_codec.codificar_lote(eventos), eventos=len(eventos))
+                self.metricas['lotes'] += 1
+            except Exception as e:
+                logger.error(f"❌ Error publicando lote MQTT de {len(eventos)} eventos: {e}")
+                if self.sin_confirmar is not None:
+                    self.sin_confirmar.append(None)
+
+    def _vaciar_periodicamente(self):
+        while not self.detener_lote.wait(self.lote_intervalo):
+            self._vaciar_lote()
+
+    def esperar_confirmacion(self, timeout=10):
+        """
+        Cierra el lote en curso y espera que el broker confirme todo lo
+        publicado desde la llamada anterior (PUBACK/PUBCOMP; QoS 0 cuenta
+        como enviado). Requiere MQTTPublisher(confirmar=True)
+
+        Returns:
+            True si todo quedó confirmado; False si algo se perdió o venció
+            el plazo (hay que volver a publicarlo)
+        """
+        if self.lote_activo:
+            self._vaciar_lote()
+        # Bajo envio_lock: el hilo de lotes no agrega mientras se cambia la lista
+        with self.envio_lock:
+            pendientes, self.sin_confirmar = self.sin_confirmar, []
+        if any(info is _EN_SPOOL for info in pendientes):
+            # Lo que fue al spool cuenta como entregado solo si ya está en disco
+            try:
+                self.spool.sincronizar()
+            except OSError as e:
+                logger.error(f"❌ No se pudo sincronizar el spool MQTT: {e}")
+                return False
+            pendientes = [info for info in pendientes if info is not _EN_SPOOL]
+        return self._confirmados(pendientes, timeout)
+
+    def _confirmados(self, pendientes, timeout):
+        """True si el broker confirmó todos los MQTTMessageInfo dentro del plazo"""
+        limite = time.monotonic() + timeout
+        for info in pendientes:
+            if info is None:
+                return False
+            try:
+                info.wait_for_publish(max(limite - time.monotonic(), 0))
+            except (RuntimeError, ValueError):
+                # Sin conexión o cola de paho llena: el mensaje no salió
+                return False
+            if not info.is_published():
+                return False
+        return True
+
+    def _reproducir_spool(self):
+        """Reenvía el spool en orden, a ritmo controlado, mientras haya conexión"""
+        ultimo_aviso = 0
+        while not self.detener_spool.is_set():
+            if not self.connected or not self.spool.pendientes():
+                self.detener_spool.wait(0.2)
+                continue
+
+            mensajes, posicion = self.spool.leer(self.spool_lote)
+            inicio = time.monotonic()
+            infos = []
+            for i, (topic, datos, retain, _) in enumerate(mensajes):
+                infos.append(self.client.publish(topic, datos, qos=self._qos(topic), retain=retain))
+                espera = inicio + (i + 1) / self.spool_ritmo - time.monotonic()
+                if espera > 0:
+                    time.sleep(espera)
+
+            if self._confirmados(infos, 10):
+                self.spool.confirmar(posicion, len(mensajes))
+                self.metricas['reproducidos'] += len(mensajes)
+                self.metricas['mensajes'] += len(mensajes)
+                self.metricas['bytes'] += sum(len(m[1]) for m in mensajes)
+            else:
+                # Se cayó de nuevo: el mismo tramo se reenvía al reconectar
+                self.detener_spool.wait(1)
+
+            if time.monotonic() - ultimo_aviso >= 10:
+                ultimo_aviso = time.monotonic()
+                estado = self.spool.stats()
+                logger.info(
+                    f"📼 Reenviando spool MQTT: {estado['pendientes']} pendientes, "
+                    f"el más viejo de hace {estado['antiguedad_s']:.1f} s"
+                )
+
+    def publish_event(self, tipo, datos):
+        """Publica un evento (tipo, datos) del outbox con el método de su tipo"""
+        return getattr(self, self.EVENTOS[tipo])(**datos)
+
+    def stats(self):
+        """Eventos, mensajes y bytes publicados (eventos/mensajes = factor de agrupación)"""
+        return {
+            'conectado': self.connected,
+            'modo': 'lote' if self.lote_activo else 'json',
+            **self.metricas,
+            'pendientes_lote': len(self.lote),
+            'spool': self.spool.stats() if self.spool is not None else None,
+        }
+
     def publish_transaction(self, cedula, tipo, monto, saldo_nuevo, timestamp=None):
         """Publicar evento de transacción"""
-        if not self.connected:
+        if not self.disponible:
             logger.warning("MQTT no conectado. Saltando publicación.")
             return False
 
@@ -109,24 +371,26 @@ class MQTTPublisher:
             'timestamp': timestamp
         }
 
-        # Publicar en tópico general de transacciones
-        self.client.publish(
-            self.TOPIC_TRANSACTIONS,
-            json.dumps(payload),
-            qos=1,  # Al menos una vez
-            retain=False
-        )
+        if self.lote_activo:
+            # Un solo registro: el consumidor lo entrega en ambos tópicos
+            self._encolar(
+                mqtt_codec.TRANSACCION_DEPOSITO if tipo == 'DEPOSITO' else mqtt_codec.TRANSACCION_RETIRO,
+                payload
+            )
+        else:
+            # Publicar en tópico general de transacciones
+            self._publicar(self.TOPIC_TRANSACTIONS, payload)
 
-        # Publicar en tópico específico según tipo
-        topic = self.TOPIC_DEPOSITS if tipo == 'DEPOSITO' else self.TOPIC_WITHDRAWALS
-        self.client.publish(topic, json.dumps(payload), qos=1, retain=False)
+            # Publicar en tópico específico según tipo
+            topic = self.TOPIC_DEPOSITS if tipo == 'DEPOSITO' else self.TOPIC_WITHDRAWALS
+            self._publicar(topic, payload)
 
         logger.info(f"📤 MQTT: {tipo} ${monto} para cédula {cedula}")
         return True
 
     def publish_transfer(self, cedula_origen, cedula_destino, monto, saldo_origen, saldo_destino, timestamp=None):
         """Publicar evento de transferencia"""
-        if not self.connected:
+        if not self.disponible:
             logger.warning("MQTT no conectado. Saltando publicación.")
             return False
 
@@ -142,31 +406,34 @@ class MQTTPublisher:
         }
 
         # Publicar en tópico de transferencias
-        self.client.publish(
-            self.TOPIC_TRANSFERS,
-            json.dumps(payload),
-            qos=1,
-            retain=False
-        )
+        if self.lote_activo:
+            self._encolar(mqtt_codec.TRANSFERENCIA, payload)
+        else:
+            self._publicar(self.TOPIC_TRANSFERS, payload)
 
         logger.info(f"📤 MQTT: TRANSFERENCIA ${monto} de {cedula_origen} a {cedula_destino}")
         return True
 
-    def publish_balance_update(self, cedula, saldo_nuevo, saldo_anterior=None):
+    def publish_balance_update(self, cedula, saldo_nuevo, saldo_anterior=None, timestamp=None):
         """Publicar actualización de saldo"""
-        if not self.connected:
+        if not self.disponible:
             return False
 
         payload = {
             'cedula': cedula,
             'saldo_nuevo': saldo_nuevo,
             'saldo_anterior': saldo_anterior,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': timestamp or datetime.now().isoformat()
         }
 
+        if self.lote_activo:
+            # En lote no hay saldo retenido por cédula: el último saldo se pide con CONSULTA
+            self._encolar(mqtt_codec.SALDO, payload)
+            return True
+
         # Usar tópico específico por cédula para filtrado eficiente
         topic = f"{self.TOPIC_BALANCE}/{cedula}"
-        self.client.publish(topic, json.dumps(payload), qos=1, retain=True)  # Retain last balance
+        self._publicar(topic, payload, retain=True)  # Retain last balance
 
         return True
 
@@ -180,17 +447,12 @@ class MQTTPublisher:
             'timestamp': datetime.now().isoformat()
         }
 
-        self.client.publish(
-            self.TOPIC_STATS,
-            json.dumps(payload),
-            qos=0,  # Best effort para stats
-            retain=True  # Mantener último valor
-        )
+        self._publicar(self.TOPIC_STATS, payload, retain=True)  # Mantener último valor
         return True
 
-    def publish_alert(self, alert_type, message, cedula=None, data=None):
+    def publish_alert(self, alert_type, message, cedula=None, data=None, timestamp=None):
         """Publicar alerta (saldo bajo, transacción rechazada, etc)"""
-        if not self.connected:
+        if not self.disponible:
             return False
 
         payload = {
@@ -198,15 +460,10 @@ class MQTTPublisher:
             'message': message,
             'cedula': cedula,
             'data': data,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': timestamp or datetime.now().isoformat()
         }
 
-        self.client.publish(
-            self.TOPIC_ALERTS,
-            json.dumps(payload),
-            qos=2,  # Exactly once para alertas
-            retain=False
-        )
+        self._publicar(self.TOPIC_ALERTS, payload)
 
         logger.warning(f"🚨 Alerta MQTT: {alert_type} - {message}")
         return True
@@ -214,6 +471,11 @@ class MQTTPublisher:
     def disconnect(self):
         """Desconectar del broker"""
         if self.client:
+            if self.lote_activo:
+                self.detener_lote.set()
+                self._vaciar_lote()
+            # Lo que quede en el spool se reenvía en el próximo arranque
+            self.detener_spool.set()
             self.client.loop_stop()
             self.client.disconnect()
             logger.info("🔌 Desconectado de broker MQTT")
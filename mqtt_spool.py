@@ -0,0 +1,266 @@
+"""
+Spool en Disco para MQTT - Sistema Bancario
+Guarda los mensajes que MQTTPublisher no puede enviar mientras el broker no responde
+
+- Segmentos de solo-agregar (NNNNNNNN.seg) de hasta segmento_bytes; cada
+  registro lleva longitud, CRC32, hora de encolado, retain y tópico
+- Índice (spool.idx): segmento y offset del primer mensaje sin confirmar.
+  Se reescribe de forma atómica al confirmar, así que tras un reinicio la
+  reproducción retoma donde quedó
+- Acotado: con más de max_bytes en disco se descarta el segmento más viejo;
+  en memoria solo vive el lote que se está reproduciendo
+- Un registro cortado por una caída a mitad de escritura se trunca al abrir
+- agregar() no hace fsync (sobrevive a la caída del proceso, no a la del
+  host); sincronizar() lleva a disco lo escrito, una vez por lote
+"""
+
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+
+# longitud del cuerpo, crc32 del cuerpo, ms de encolado, retain, largo del tópico
+_CABECERA = struct.Struct('>IIqBH')
+_INDICE = 'spool.idx'
+
+
+class DiskSpool:
+    """Cola FIFO persistente de mensajes MQTT (tópico, datos, retain)"""
+
+    def __init__(self, directorio, max_bytes=256 * 1024 * 1024, segmento_bytes=8 * 1024 * 1024):
+        """
+        Args:
+            directorio: carpeta de los segmentos y el índice
+            max_bytes: tope de disco; al pasarlo se descarta el segmento más viejo
+            segmento_bytes: tamaño a partir del cual se abre un segmento nuevo
+        """
+        if max_bytes <= segmento_bytes:
+            raise ValueError("max_bytes debe ser mayor que segmento_bytes")
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.segmento_bytes = segmento_bytes
+        self.lock = threading.Lock()
+        self.metricas = {'encolados': 0, 'confirmados': 0, 'descartados': 0, 'segmentos_descartados': 0}
+        self.generacion = 0  # Cambia al descartar: invalida las lecturas en curso
+        self.sin_sincronizar = False  # Hay escrituras sin fsync en el segmento abierto
+        self.directorio_sin_sincronizar = False  # Se creó un segmento desde el último fsync
+
+        os.makedirs(directorio, exist_ok=True)
+        self.tamanos = {}  # segmento -> bytes
+        self.conteos = {}  # segmento -> registros
+        for nombre in sorted(os.listdir(directorio)):
+            if nombre.endswith('.seg'):
+                segmento = int(nombre[:-4])
+                self.tamanos[segmento], self.conteos[segmento] = self._escanear(segmento)
+
+        segmento, offset = self._leer_indice()
+        for viejo in [s for s in self.tamanos if s < segmento]:
+            self._borrar(viejo)
+        if not self.tamanos:
+            segmento, offset = segmento or 1, 0
+            self.tamanos[segmento], self.conteos[segmento] = 0, 0
+        elif segmento not in self.tamanos:
+            segmento, offset = min(self.tamanos), 0
+
+        self.lectura = (segmento, min(offset, self.tamanos[segmento]))
+        # Registros ya confirmados del segmento de lectura
+        self.consumidos = self._contar_hasta(*self.lectura)
+        self.escritura = max(self.tamanos)
+        self.fd = os.open(self._ruta(self.escritura), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    # ---- archivos -------------------------------------------------------
+
+    def _ruta(self, segmento):
+        return os.path.join(self.directorio, f"{segmento:08d}.seg")
+
+    def _leer_indice(self):
+        try:
+            with open(os.path.join(self.directorio, _INDICE)) as f:
+                indice = json.load(f)
+            return int(indice['segmento']), int(indice['offset'])
+        except (OSError, ValueError, KeyError):
+            return 0, 0
+
+    def _guardar_indice(self):
+        ruta = os.path.join(self.directorio, _INDICE)
+        with open(ruta + '.tmp', 'w') as f:
+            json.dump({'segmento': self.lectura[0], 'offset': self.lectura[1]}, f)
+        os.replace(ruta + '.tmp', ruta)
+
+    def _registros(self, archivo, desde=0):
+        """(offset, offset_siguiente, cabecera, cuerpo) de cada registro válido desde un offset"""
+        archivo.seek(desde)
+        offset = desde
+        while True:
+            cabecera = archivo.read(_CABECERA.size)
+            if len(cabecera) < _CABECERA.size:
+                return
+            largo, crc, ms, retain, largo_topic = _CABECERA.unpack(cabecera)
+            cuerpo = archivo.read(largo)
+            if len(cuerpo) < largo or zlib.crc32(cuerpo) != crc:
+                return
+            siguiente = offset + _CABECERA.size + largo
+            yield offset, siguiente, (ms, bool(retain), largo_topic), cuerpo
+            offset = siguiente
+
+    def _escanear(self, segmento):
+        """Tamaño válido y cantidad de registros; trunca un registro final cortado"""
+        ruta = self._ruta(segmento)
+        fin, cantidad = 0, 0
+        with open(ruta, 'rb') as f:
+            for _, fin, _, _ in self._registros(f):
+                cantidad += 1
+        if os.path.getsize(ruta) != fin:
+            logging.warning(f"⚠️ Spool MQTT: registro incompleto truncado en {ruta}")
+            os.truncate(ruta, fin)
+        return fin, cantidad
+
+    def _contar_hasta(self, segmento, offset):
+        if offset == 0:
+            return 0
+        with open(self._ruta(segmento), 'rb') as f:
+            return sum(1 for _, fin, _, _ in self._registros(f) if fin <= offset)
+
+    def _borrar(self, segmento):
+        self.tamanos.pop(segmento, None)
+        self.conteos.pop(segmento, None)
+        try:
+            os.remove(self._ruta(segmento))
+        except FileNotFoundError:
+            pass
+
+    def _rotar(self):
+        if self.sin_sincronizar:
+            # Lo escrito en el segmento que se cierra ya no lo cubre sincronizar()
+            os.fsync(self.fd)
+            self.sin_sincronizar = False
+        os.close(self.fd)
+        self.directorio_sin_sincronizar = True
+        self.escritura += 1
+        self.tamanos[self.escritura], self.conteos[self.escritura] = 0, 0
+        self.fd = os.open(self._ruta(self.escritura), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def _descartar_mas_viejo(self):
+        """Sin espacio: pierde los mensajes pendientes del segmento más viejo"""
+        viejo = self.lectura[0]
+        perdidos = self.conteos[viejo] - self.consumidos
+        self._borrar(viejo)
+        self.lectura = (min(self.tamanos), 0)
+        self.consumidos = 0
+        self.generacion += 1
+        self._guardar_indice()
+        self.metricas['descartados'] += perdidos
+        self.metricas['segmentos_descartados'] += 1
+        logging.warning(f"⚠️ Spool MQTT lleno: {perdidos} mensajes más viejos descartados")
+
+    # ---- API ------------------------------------------------------------
+
+    def agregar(self, topic, datos, retain=False):
+        """Agrega un mensaje al final del spool (una escritura por registro)"""
+        if isinstance(datos, str):
+            datos = datos.encode('utf-8')
+        topic_bytes = topic.encode('utf-8')
+        cuerpo = topic_bytes + datos
+        registro = _CABECERA.pack(
+            len(cuerpo), zlib.crc32(cuerpo), int(time.time() * 1000), int(retain), len(topic_bytes)
+        ) + cuerpo
+
+        with self.lock:
+            if self.tamanos[self.escritura] >= self.segmento_bytes:
+                self._rotar()
+            os.write(self.fd, registro)
+            self.sin_sincronizar = True
+            self.tamanos[self.escritura] += len(registro)
+            self.conteos[self.escritura] += 1
+            self.metricas['encolados'] += 1
+            while sum(self.tamanos.values()) > self.max_bytes and len(self.tamanos) > 1:
+                self._descartar_mas_viejo()
+
+    def sincronizar(self):
+        """fsync de lo agregado hasta ahora (y del directorio si hubo segmentos nuevos)"""
+        with self.lock:
+            if self.sin_sincronizar:
+                os.fsync(self.fd)
+                self.sin_sincronizar = False
+            if self.directorio_sin_sincronizar:
+                fd = os.open(self.directorio, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+                self.directorio_sin_sincronizar = False
+
+    def leer(self, maximo=100):
+        """
+        Primeros mensajes sin confirmar, sin sacarlos del spool
+
+        Returns:
+            (lista de (topic, datos, retain, ms_encolado), posición para confirmar())
+        """
+        with self.lock:
+            segmento, offset = self.lectura
+            mensajes = []
+            while len(mensajes) < maximo:
+                with open(self._ruta(segmento), 'rb') as f:
+                    for _, offset, (ms, retain, largo_topic), cuerpo in self._registros(f, offset):
+                        mensajes.append((cuerpo[:largo_topic].decode('utf-8'), cuerpo[largo_topic:], retain, ms))
+                        if len(mensajes) >= maximo:
+                            break
+                siguientes = [s for s in self.tamanos if s > segmento]
+                if len(mensajes) >= maximo or not siguientes or offset < self.tamanos[segmento]:
+                    break
+                segmento, offset = min(siguientes), 0
+            return mensajes, (self.generacion, segmento, offset)
+
+    def confirmar(self, posicion, cantidad):
+        """Marca como entregados los mensajes leídos hasta posicion"""
+        with self.lock:
+            generacion, segmento, offset = posicion
+            if generacion != self.generacion:
+                # Se descartaron mensajes mientras se reproducía: volver a leer
+                return
+            self.metricas['confirmados'] += cantidad
+            while self.lectura[0] < segmento:
+                cantidad -= self.conteos[self.lectura[0]] - self.consumidos
+                self._borrar(self.lectura[0])
+                self.lectura, self.consumidos = (min(self.tamanos), 0), 0
+            self.consumidos += cantidad
+            self.lectura = (segmento, offset)
+
+            if self.consumidos == self.conteos[segmento] and segmento == self.escritura:
+                # Spool vacío: empezar un segmento nuevo y liberar el disco
+                self._rotar()
+                self._borrar(segmento)
+                self.lectura, self.consumidos = (self.escritura, 0), 0
+            self._guardar_indice()
+
+    def pendientes(self):
+        with self.lock:
+            return sum(self.conteos.values()) - self.consumidos
+
+    def _ms_mas_viejo(self):
+        segmento, offset = self.lectura
+        with open(self._ruta(segmento), 'rb') as f:
+            for _, _, (ms, _, _), _ in self._registros(f, offset):
+                return ms
+        return None
+
+    def stats(self):
+        """Profundidad (mensajes y bytes) y antigüedad del mensaje más viejo"""
+        with self.lock:
+            ms = self._ms_mas_viejo()
+            return {
+                'pendientes': sum(self.conteos.values()) - self.consumidos,
+                'bytes': sum(self.tamanos.values()) - self.lectura[1],
+                'segmentos': len(self.tamanos),
+                'antiguedad_s': round(time.time() - ms / 1000, 3) if ms is not None else 0.0,
+                **self.metricas,
+            }
+
+    def close(self):
+        with self.lock:
+            os.close(self.fd)
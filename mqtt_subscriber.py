@@ -1,14 +1,22 @@
 """
 MQTT Subscriber - Sistema Bancario
 Suscriptor de ejemplo para monitorear eventos en tiempo real
+Entiende los mensajes JSON y los lotes binarios de banco/lote (mqtt_codec.py)
+
+Con --agregar no registra cada evento: mantiene métricas de ventana
+deslizante (mqtt_agregador.py) y las publica retenidas en banco/agregados
+cada AGREGADOS_INTERVALO_S segundos
 """
 
 import paho.mqtt.client as mqtt
 import json
 import logging
 import os
+import threading
 from datetime import datetime
 from dotenv import load_dotenv
+import mqtt_codec
+from mqtt_agregador import AgregadorVentana, TOPIC_AGREGADOS
 
 load_dotenv()
 
@@ -22,12 +30,27 @@ logger = logging.getLogger(__name__)
 class MQTTSubscriber:
     """Suscriptor MQTT para monitorear eventos bancarios"""
 
-    def __init__(self):
+    def __init__(self, agregar=False):
+        """
+        Args:
+            agregar: modo agregación (publica banco/agregados en vez de registrar eventos)
+        """
         self.broker_host = os.getenv('MQTT_BROKER_HOST', 'localhost')
         self.broker_port = int(os.getenv('MQTT_BROKER_PORT', 1883))
         self.client_id = f"banco_subscriber_{os.getpid()}"
         self.client = None
 
+        self.agregador = None
+        self.intervalo_agregados = float(os.getenv('AGREGADOS_INTERVALO_S', 5))
+        self.detener = threading.Event()
+        if agregar:
+            self.agregador = AgregadorVentana(
+                ventana_s=float(os.getenv('AGREGADOS_VENTANA_S', 60)),
+                cubeta_s=float(os.getenv('AGREGADOS_CUBETA_S', 1)),
+                top=int(os.getenv('AGREGADOS_TOP', 10)),
+                max_cuentas=int(os.getenv('AGREGADOS_MAX_CUENTAS', 500))
+            )
+
     def on_connect(self, client, userdata, flags, reason_code, properties):
         """Callback cuando se conecta al broker (API v2)"""
         if reason_code == 0:
@@ -41,8 +64,16 @@ class MQTTSubscriber:
                 ("banco/transferencias", 1),     # Transferencias entre cuentas
                 ("banco/saldo/#", 1),            # Wildcard para todos los saldos
                 ("banco/estadisticas", 0),       # QoS 0 (best effort)
-                ("banco/alertas", 2)             # QoS 2 (exactly once)
+                ("banco/alertas", 2),            # QoS 2 (exactly once)
+                (mqtt_codec.TOPIC_LOTE, 1)       # Lotes binarios (MQTT_BATCH=1)
             ]
+            if self.agregador:
+                # Solo los eventos que suman a los agregados
+                topics = [
+                    ("banco/transacciones", 1),
+                    ("banco/transferencias", 1),
+                    (mqtt_codec.TOPIC_LOTE, 1)
+                ]
             
             for topic, qos in topics:
                 client.subscribe(topic, qos)
@@ -53,32 +84,42 @@ class MQTTSubscriber:
     def on_message(self, client, userdata, msg):
         """Callback cuando llega un mensaje"""
         try:
-            topic = msg.topic
-            payload = json.loads(msg.payload.decode('utf-8'))
-            
-            # Procesar según el tópico
-            if topic == "banco/transacciones":
-                self.handle_transaction(payload)
-            elif topic == "banco/depositos":
-                self.handle_deposit(payload)
-            elif topic == "banco/retiros":
-                self.handle_withdrawal(payload)
-            elif topic == "banco/transferencias":
-                self.handle_transfer(payload)
-            elif topic.startswith("banco/saldo/"):
-                self.handle_balance_update(payload, topic)
-            elif topic == "banco/estadisticas":
-                self.handle_stats(payload)
-            elif topic == "banco/alertas":
-                self.handle_alert(payload)
+            if msg.topic == mqtt_codec.TOPIC_LOTE:
+                for topic, payload in mqtt_codec.decodificar_lote(msg.payload):
+                    self.despachar(topic, payload)
             else:
-                logger.info(f"📨 [{topic}] {payload}")
-                
+                self.despachar(msg.topic, json.loads(msg.payload.decode('utf-8')))
+
         except json.JSONDecodeError:
             logger.warning(f"⚠️ Mensaje no JSON en {msg.topic}: {msg.payload}")
+        except mqtt_codec.LoteInvalidoError as e:
+            logger.warning(f"⚠️ Lote inválido en {msg.topic}: {e}")
         except Exception as e:
             logger.error(f"❌ Error procesando mensaje: {e}")
 
+    def despachar(self, topic, payload):
+        """Procesa un evento según su tópico"""
+        if self.agregador:
+            self.agregador.registrar(topic, payload)
+            return
+
+        if topic == "banco/transacciones":
+            self.handle_transaction(payload)
+        elif topic == "banco/depositos":
+            self.handle_deposit(payload)
+        elif topic == "banco/retiros":
+            self.handle_withdrawal(payload)
+        elif topic == "banco/transferencias":
+            self.handle_transfer(payload)
+        elif topic.startswith("banco/saldo/"):
+            self.handle_balance_update(payload, topic)
+        elif topic == "banco/estadisticas":
+            self.handle_stats(payload)
+        elif topic == "banco/alertas":
+            self.handle_alert(payload)
+        else:
+            logger.info(f"📨 [{topic}] {payload}")
+
     def handle_transaction(self, payload):
         """Procesar evento de transacción"""
         logger.info(
@@ -137,10 +178,27 @@ class MQTTSubscriber:
             f"(Cédula: {payload.get('cedula', 'N/A')})"
         )
 
-    def on_disconnect(self, client, userdata, rc):
-        """Callback cuando se desconecta del broker"""
-        if rc != 0:
-            logger.warning(f"⚠️ Desconexión inesperada de MQTT. Code: {rc}")
+    def publicar_agregados(self):
+        """Publica el resumen de la ventana cada intervalo (retenido: el último siempre disponible)"""
+        while not self.detener.wait(self.intervalo_agregados):
+            resumen = self.agregador.resumen()
+            self.client.publish(
+                TOPIC_AGREGADOS,
+                json.dumps(resumen, separators=(',', ':')),
+                qos=1,
+                retain=True
+            )
+            logger.info(
+                f"📈 AGREGADOS {resumen['ventana_s']:.0f}s: {resumen['tps']} tx/s | "
+                f"Depósitos ${resumen['volumen']['DEPOSITO']:.2f} | "
+                f"Retiros ${resumen['volumen']['RETIRO']:.2f} | "
+                f"Transferencias ${resumen['volumen']['TRANSFERENCIA']:.2f}"
+            )
+
+    def on_disconnect(self, client, userdata, flags, reason_code, properties):
+        """Callback cuando se desconecta del broker (API v2)"""
+        if reason_code != 0:
+            logger.warning(f"⚠️ Desconexión inesperada de MQTT. Code: {reason_code}")
 
     def start(self):
         """Iniciar suscriptor"""
@@ -157,6 +215,13 @@ class MQTTSubscriber:
             logger.info(f"🔗 Conectando a {self.broker_host}:{self.broker_port}")
             self.client.connect(self.broker_host, self.broker_port, keepalive=60)
             
+            if self.agregador:
+                threading.Thread(target=self.publicar_agregados, name="agregados", daemon=True).start()
+                logger.info(
+                    f"📈 Modo agregación: ventana de {self.agregador.ventana_s:.0f} s "
+                    f"en {TOPIC_AGREGADOS} cada {self.intervalo_agregados:.0f} s"
+                )
+
             # Blocking loop (mantiene el subscriber corriendo)
             logger.info("👂 Escuchando eventos MQTT... (Ctrl+C para salir)")
             self.client.loop_forever()
@@ -172,6 +237,7 @@ class MQTTSubscriber:
 
     def stop(self):
         """Detener suscriptor"""
+        self.detener.set()
         if self.client:
             self.client.loop_stop()
             self.client.disconnect()
@@ -179,9 +245,16 @@ class MQTTSubscriber:
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Monitor MQTT del sistema bancario')
+    parser.add_argument('--agregar', action='store_true',
+                        help=f'Publicar métricas de ventana deslizante en {TOPIC_AGREGADOS} en vez de registrar eventos')
+    args = parser.parse_args()
+
     print("=" * 60)
     print("🏦 Sistema Bancario - Monitor MQTT")
     print("=" * 60)
     
-    subscriber = MQTTSubscriber()
+    subscriber = MQTTSubscriber(agregar=args.agregar)
     subscriber.start()
@@ -98,7 +98,7 @@ autostart=true
 autorestart=true
 stderr_logfile=/var/log/bridge.err.log
 stdout_logfile=/var/log/bridge.out.log
-environment=PATH="$HOME/ExamenDistribuidos/venv/bin"
+environment=PATH="$HOME/ExamenDistribuidos/venv/bin",BRIDGE_ASYNC_MODE="gevent"
 EOF
 
 # Recargar Supervisor
@@ -0,0 +1,315 @@
+"""
+Prueba de Resistencia con Verificación de Invariantes - Sistema Bancario
+Genera depósitos, retiros y transferencias a alta concurrencia sobre muchas
+cuentas y luego verifica contra la BD que no se perdió dinero
+
+Invariantes verificados:
+1. Saldo final de cada cuenta = saldo inicial + suma de operaciones confirmadas (OK)
+2. Encadenamiento del historial: cada saldo_final = saldo_final anterior ± monto
+3. Una fila de historial por operación confirmada (ni perdidas ni duplicadas)
+4. Conservación global: Σ saldos finales - Σ iniciales = Σ depósitos - Σ retiros
+
+Ejecutar sin otro tráfico sobre las cuentas usadas: cualquier operación ajena
+aparecería como violación.
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+from collections import defaultdict
+from decimal import Decimal
+from benchmark import OpenLoopLoadGenerator, CUENTAS_EJEMPLO
+
+CENTAVO = Decimal('0.01')
+
+MEZCLA_SOAK = 'AUMENTAR:40,DISMINUIR:35,TRANSFERIR:25'
+
+# Efecto de cada tipo de fila del historial sobre el saldo
+SIGNO_TIPO = {
+    'DEPOSITO': 1,
+    'RETIRO': -1,
+    'TRANSFERENCIA_ENVIADA': -1,
+    'TRANSFERENCIA_RECIBIDA': 1,
+}
+
+
+def _dinero(valor):
+    """Normaliza un monto a Decimal con dos decimales"""
+    return Decimal(str(valor)).quantize(CENTAVO)
+
+
+class OperationLog:
+    """Registro thread-safe de las operaciones enviadas y su resultado"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.secuencia = 0
+        self.por_cuenta = defaultdict(list)  # cedula -> [(seq, comando, tipo, delta)]
+        self.indeterminadas = defaultdict(list)  # cedula -> [(seq, comando)] sin respuesta
+        self.confirmadas = 0
+        self.rechazadas = 0
+        self.depositos = Decimal('0.00')
+        self.retiros = Decimal('0.00')
+
+    def registrar(self, comando, respuesta):
+        """Callback on_response del generador de carga"""
+        partes = comando.split()
+        operacion = partes[0]
+        with self.lock:
+            self.secuencia += 1
+            seq = self.secuencia
+
+            if respuesta is None:
+                # Sin respuesta no sabemos si el servidor aplicó la operación
+                for cedula in partes[1:-1]:
+                    self.indeterminadas[cedula].append((seq, comando))
+                return
+
+            if not respuesta.startswith('OK'):
+                self.rechazadas += 1
+                return
+
+            self.confirmadas += 1
+            if operacion == 'AUMENTAR':
+                monto = _dinero(partes[2])
+                self.por_cuenta[partes[1]].append((seq, comando, 'DEPOSITO', monto))
+                self.depositos += monto
+            elif operacion == 'DISMINUIR':
+                monto = _dinero(partes[2])
+                self.por_cuenta[partes[1]].append((seq, comando, 'RETIRO', -monto))
+                self.retiros += monto
+            elif operacion == 'TRANSFERIR':
+                monto = _dinero(partes[3])
+                self.por_cuenta[partes[1]].append((seq, comando, 'TRANSFERENCIA_ENVIADA', -monto))
+                self.por_cuenta[partes[2]].append((seq, comando, 'TRANSFERENCIA_RECIBIDA', monto))
+
+
+class InvariantChecker:
+    """Toma la foto inicial de la BD y verifica los invariantes al final"""
+
+    def __init__(self, db_manager, cuentas):
+        self.db = db_manager
+        self.cuentas = cuentas
+        self.saldos_iniciales = {}
+        self.id_inicial = 0
+
+    def _saldos(self):
+        """Saldo actual de cada cuenta según la BD"""
+        saldos = {}
+        for cedula in self.cuentas:
+            cliente = self.db.consultar_cliente(cedula)
+            if cliente is None:
+                raise ValueError(f"La cuenta {cedula} no existe")
+            saldos[cedula] = _dinero(cliente['saldo'])
+        return saldos
+
+    def snapshot(self):
+        """Guarda saldos y último id de transacción antes de la prueba"""
+        self.saldos_iniciales = self._saldos()
+        self.id_inicial = self.db.ultimo_id_transaccion()
+
+    def _ledger(self):
+        """Filas nuevas del historial agrupadas por cédula, en orden de id"""
+        por_cuenta = defaultdict(list)
+        desde = self.id_inicial
+        while True:
+            filas = self.db.obtener_transacciones_desde(desde)
+            if not filas:
+                break
+            for fila in filas:
+                por_cuenta[fila['cedula']].append(fila)
+            desde = filas[-1]['id']
+        return por_cuenta
+
+    def verificar(self, log):
+        """Retorna el reporte de verificación (dict)"""
+        saldos_finales = self._saldos()
+        ledger = self._ledger()
+        violaciones = []
+        no_verificables = sorted(log.indeterminadas)
+
+        for cedula in self.cuentas:
+            if cedula in log.indeterminadas:
+                continue
+
+            inicial = self.saldos_iniciales[cedula]
+            final = saldos_finales[cedula]
+            operaciones = log.por_cuenta.get(cedula, [])
+            filas = ledger.get(cedula, [])
+            esperado = inicial + sum((delta for _, _, _, delta in operaciones), Decimal('0.00'))
+
+            # 1. Saldo final contra operaciones confirmadas
+            if final != esperado:
+                violaciones.append({
+                    'tipo': 'saldo_final',
+                    'cedula': cedula,
+                    'saldo_inicial': str(inicial),
+                    'saldo_esperado': str(esperado),
+                    'saldo_final': str(final),
+                    'diferencia': str(final - esperado),
+                    'operaciones': [cmd for _, cmd, _, _ in operaciones],
+                })
+
+            # 2. Encadenamiento de saldo_final en el historial
+            saldo = inicial
+            for anterior, fila in zip([None] + filas, filas):
+                calculado = saldo + SIGNO_TIPO[fila['tipo']] * _dinero(fila['monto'])
+                registrado = _dinero(fila['saldo_final'])
+                if calculado != registrado:
+                    violaciones.append({
+                        'tipo': 'cadena_historial',
+                        'cedula': cedula,
+                        'transaccion_id': fila['id'],
+                        'transaccion_anterior_id': anterior['id'] if anterior else None,
+                        'tipo_transaccion': fila['tipo'],
+                        'monto': str(_dinero(fila['monto'])),
+                        'saldo_final_esperado': str(calculado),
+                        'saldo_final_registrado': str(registrado),
+                    })
+                saldo = registrado
+            if filas and saldo != final:
+                violaciones.append({
+                    'tipo': 'cadena_vs_saldo',
+                    'cedula': cedula,
+                    'ultimo_saldo_historial': str(saldo),
+                    'saldo_cliente': str(final),
+                })
+
+            # 3. Una fila por operación confirmada
+            if len(filas) != len(operaciones):
+                violaciones.append({
+                    'tipo': 'filas_historial',
+                    'cedula': cedula,
+                    'operaciones_confirmadas': len(operaciones),
+                    'filas_historial': len(filas),
+                    'operaciones': [cmd for _, cmd, _, _ in operaciones],
+                })
+
+        # 4. Conservación global (solo si todas las cuentas son verificables)
+        conservacion = None
+        if not no_verificables:
+            delta_total = sum(saldos_finales.values()) - sum(self.saldos_iniciales.values())
+            esperado_total = log.depositos - log.retiros
+            conservacion = {
+                'delta_saldos': str(delta_total),
+                'depositos_menos_retiros': str(esperado_total),
+                'ok': delta_total == esperado_total,
+            }
+            if delta_total != esperado_total:
+                violaciones.append({'tipo': 'conservacion_global', **conservacion})
+
+        return {
+            'cuentas': len(self.cuentas),
+            'operaciones_confirmadas': log.confirmadas,
+            'operaciones_rechazadas': log.rechazadas,
+            'filas_historial_nuevas': sum(len(f) for f in ledger.values()),
+            'cuentas_no_verificables': no_verificables,
+            'conservacion_global': conservacion,
+            'violaciones': violaciones,
+            'ok': not violaciones,
+        }
+
+
+def ejecutar_soak(db_manager, host, port, cuentas, tasa, duracion, conexiones, mezcla=MEZCLA_SOAK,
+                  zipf_s=0.0, semilla=None, on_progress=None):
+    """Ejecuta la carga y la verificación; retorna (reporte_carga, reporte_invariantes)"""
+    checker = InvariantChecker(db_manager, cuentas)
+    checker.snapshot()
+
+    log = OperationLog()
+    generador = OpenLoopLoadGenerator(
+        host=host,
+        port=port,
+        tasa=tasa,
+        duracion=duracion,
+        conexiones=conexiones,
+        mezcla=mezcla,
+        cuentas=cuentas,
+        zipf_s=zipf_s,
+        semilla=semilla,
+        on_progress=on_progress,
+        on_response=log.registrar
+    )
+    reporte_carga = generador.run()
+    return reporte_carga, checker.verificar(log)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Prueba de resistencia con verificación de invariantes')
+    parser.add_argument('--local', action='store_true',
+                        help='Levantar un SocketServer local con BD en memoria en lugar de usar MySQL')
+    parser.add_argument('--host', default='localhost', help='Host del servidor')
+    parser.add_argument('--port', type=int, default=5000, help='Puerto del servidor')
+    parser.add_argument('--tasa', type=float, default=500, help='Operaciones por segundo')
+    parser.add_argument('--duracion', type=float, default=300, help='Segundos de carga')
+    parser.add_argument('--conexiones', type=int, default=64, help='Conexiones concurrentes')
+    parser.add_argument('--mezcla', default=MEZCLA_SOAK, help='Mezcla de comandos CMD:peso,...')
+    parser.add_argument('--zipf', type=float, default=0.8, help='Sesgo Zipf de cuentas (más contención)')
+    parser.add_argument('--num-cuentas', type=int, help='Usar cédulas sintéticas de bulk_loader.py')
+    parser.add_argument('--prefijo', default='2', help='Prefijo de las cédulas sintéticas')
+    parser.add_argument('--semilla', type=int, help='Semilla del generador')
+    parser.add_argument('--salida', help='Archivo JSON con el reporte completo')
+    args = parser.parse_args()
+
+    def mostrar_progreso(p):
+        print(f"⏱️ t={p['segundo']}s | {p['throughput_rps']} ops/s | "
+                     f"p99={p['p99_us'] / 1000:.2f}ms | fallos={p['fallos']}")
+
+    if args.local:
+        from benchmark_regression import LocalServer
+
+        logging.getLogger().setLevel(logging.WARNING)
+        with LocalServer(args.num_cuentas or 200, saldo_inicial=1000.0) as local:
+            carga, invariantes = ejecutar_soak(
+                local.db, local.server.host, local.server.port, local.cuentas,
+                args.tasa, args.duracion, args.conexiones, args.mezcla, args.zipf, args.semilla,
+                mostrar_progreso
+            )
+    else:
+        from dotenv import load_dotenv
+        from db_connection import DatabaseManager
+
+        load_dotenv()
+        db = DatabaseManager({
+            'host': os.getenv('DB_HOST', 'localhost'),
+            'port': int(os.getenv('DB_PORT', 3306)),
+            'database': os.getenv('DB_NAME', 'examen'),
+            'user': os.getenv('DB_USER', 'socketuser'),
+            'password': os.getenv('DB_PASSWORD', '12345')
+        })
+        if args.num_cuentas:
+            cuentas = [f"{args.prefijo}{i:09d}" for i in range(args.num_cuentas)]
+        else:
+            cuentas = list(CUENTAS_EJEMPLO)
+        carga, invariantes = ejecutar_soak(
+            db, args.host, args.port, cuentas, args.tasa, args.duracion, args.conexiones,
+            args.mezcla, args.zipf, args.semilla, mostrar_progreso
+        )
+
+    print(f"\n📊 {carga['completadas']} operaciones, {carga['throughput_rps']} ops/s, "
+          f"p99={carga['latencia_us']['p99'] / 1000:.2f}ms")
+    print(f"   Confirmadas: {invariantes['operaciones_confirmadas']} | "
+          f"Rechazadas: {invariantes['operaciones_rechazadas']} | "
+          f"Filas nuevas en historial: {invariantes['filas_historial_nuevas']}")
+    if invariantes['cuentas_no_verificables']:
+        print(f"⚠️ Cuentas con operaciones sin respuesta (no verificables): "
+              f"{', '.join(invariantes['cuentas_no_verificables'])}")
+
+    if invariantes['ok']:
+        print("✅ Invariantes de conservación del dinero verificados")
+    else:
+        print(f"❌ {len(invariantes['violaciones'])} violaciones de invariantes (posibles lost updates):")
+        for v in invariantes['violaciones'][:20]:
+            print(f"   • {json.dumps(v, ensure_ascii=False)}")
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump({'carga': carga, 'invariantes': invariantes}, f, indent=2, ensure_ascii=False)
+
+    sys.exit(0 if invariantes['ok'] else 1)
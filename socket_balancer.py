@@ -0,0 +1,662 @@
+"""
+Balanceo entre Servidores Socket
+Reparte los comandos del bridge entre varios servidores socket (todos sobre
+la misma base de datos), cada uno con su propio SocketConnectionPool
+
+- Verificación activa de salud: PING periódico por una conexión aparte
+- Menor número de peticiones en curso (least outstanding requests)
+- Circuit breaker: tras N fallos de transporte seguidos (timeouts, conexión
+  rechazada) el backend queda fuera durante un enfriamiento; luego una sola
+  sonda (PING o petición) decide si vuelve
+- Failover: errores antes de enviar el comando se reintentan en otro backend
+  para cualquier comando; errores después, solo para comandos idempotentes
+- Hedging: CONSULTA/HISTORIAL/STATS que tardan más que el umbral se lanzan
+  también en un segundo backend y gana la primera respuesta
+- Enrutamiento por cédula (opcional): hash consistente hacia el servidor
+  dueño de cada cuenta; las escrituras solo van al dueño y las lecturas lo
+  prefieren. El anillo se recalcula cuando un servidor entra o sale, y una
+  cédula que cambia de dueño espera a que terminen sus escrituras en curso
+  en el dueño anterior. Transferencias entre dueños distintos: handoff de
+  hash_ring.transferir_con_handoff
+- Reporte de latencias por backend, de failovers y de hedges
+"""
+
+import contextvars
+import logging
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from hash_ring import HashRing, cedulas_de_comando, es_escritura, transferir_con_handoff
+from socket_pool import SocketConnectionPool, PoolTimeoutError, BatchError, es_idempotente
+
+
+# Lecturas que se pueden duplicar en otro backend si la primera tarda
+COMANDOS_HEDGE = {'CONSULTA', 'HISTORIAL', 'STATS'}
+
+# Errores que ocurren antes de que el comando salga hacia el servidor
+ERRORES_ANTES_DE_ENVIAR = (ConnectionRefusedError, PoolTimeoutError, socket.gaierror)
+
+
+def parsear_backends(texto, puerto_por_defecto=5000):
+    """'host1:5000,host2' -> [('host1', 5000), ('host2', puerto_por_defecto)]"""
+    backends = []
+    for parte in texto.split(','):
+        parte = parte.strip()
+        if not parte:
+            continue
+        host, separador, puerto = parte.rpartition(':')
+        if not separador:
+            host, puerto = parte, ''
+        backends.append((host, int(puerto) if puerto else puerto_por_defecto))
+    return backends
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+def _resumen_latencias(valores):
+    return {
+        'p50_ms': round(_percentil(valores, 0.50), 2),
+        'p95_ms': round(_percentil(valores, 0.95), 2),
+        'max_ms': round(max(valores), 2) if valores else 0.0,
+    }
+
+
+class Backend:
+    """Un servidor socket con su pool, su estado de salud y su circuito"""
+
+    CERRADO = 'cerrado'
+    ABIERTO = 'abierto'
+    SEMIABIERTO = 'semiabierto'
+
+    def __init__(self, host, port, **opciones_pool):
+        self.host = host
+        self.port = port
+        self.pool = SocketConnectionPool(host, port, **opciones_pool)
+        self.nombre = f"{host}:{port}"
+
+        # Protegidos por el lock del balanceador
+        self.en_curso = 0
+        self.sano = True
+        self.circuito = self.CERRADO
+        self.abierto_desde = 0.0
+        self.fallos_seguidos = 0
+        self.latencias = deque(maxlen=256)
+        self.latencia_ewma_ms = 0.0
+        self.metricas = {
+            'peticiones': 0,
+            'errores': 0,
+            'timeouts': 0,
+            'aperturas_circuito': 0,
+            'chequeos_fallidos': 0,
+        }
+
+
+class SocketBalancer:
+    """Cliente de varios servidores socket con balanceo, salud y circuit breaker"""
+
+    def __init__(self, backends, umbral_fallos=3, enfriamiento_s=10, intervalo_salud=5,
+                 timeout_salud=2, hedge_ms=100, enrutar_por_cedula=False, espera_handoff=5,
+                 **opciones_pool):
+        """
+        Args:
+            backends: lista de (host, puerto)
+            umbral_fallos: fallos de transporte seguidos que abren el circuito
+            enfriamiento_s: segundos con el circuito abierto antes de sondear
+            intervalo_salud: segundos entre PINGs de verificación
+            timeout_salud: timeout de cada PING de verificación
+            hedge_ms: espera antes de duplicar una lectura en otro backend (0 desactiva)
+            enrutar_por_cedula: cada cédula va a su dueño en un anillo de hash consistente
+            espera_handoff: segundos que una escritura espera a que su cédula
+                termine de cambiar de dueño
+            opciones_pool: argumentos de SocketConnectionPool para cada backend
+        """
+        if not backends:
+            raise ValueError("Se necesita al menos un servidor socket")
+        self.backends = [Backend(host, port, **opciones_pool) for host, port in backends]
+        self.umbral_fallos = umbral_fallos
+        self.enfriamiento_s = enfriamiento_s
+        self.intervalo_salud = intervalo_salud
+        self.timeout_salud = timeout_salud
+        self.hedge_s = hedge_ms / 1000
+        # Intentos primarios de lecturas con hedge: hilos reutilizados, tantos
+        # como conexiones hay en total (más no podrían estar en vuelo)
+        cupo_hedge = sum(b.pool.max_conexiones for b in self.backends)
+        self.hedge_primarios = ThreadPoolExecutor(max_workers=cupo_hedge, thread_name_prefix='hedge')
+        self.hedge_cupos = threading.BoundedSemaphore(cupo_hedge)
+
+        self.lock = threading.Lock()
+        # Escrituras que esperan el traspaso de una cédula; comparte el lock
+        self.handoff = threading.Condition(self.lock)
+        self.espera_handoff = espera_handoff
+        self.por_nombre = {b.nombre: b for b in self.backends}
+        self.anillo = HashRing(self.por_nombre) if enrutar_por_cedula else None
+        self.escrituras_en_vuelo = {}  # {cedula: [backend, cantidad]}
+        self.chequeo_iniciado = False
+        self.failovers = deque(maxlen=256)  # latencia total de peticiones rescatadas
+        self.transiciones = deque(maxlen=50)
+        self.metricas = {
+            'failovers': 0,
+            'hedges_lanzados': 0,
+            'hedges_ganados': 0,
+            'sin_backend': 0,
+            'rebalanceos': 0,
+            'esperas_handoff': 0,
+            'transferencias_handoff': 0,
+        }
+
+    # ---------- Selección y circuito ----------
+
+    def _disponible(self, backend, ahora):
+        """Con el lock tomado: si el backend puede recibir una petición"""
+        if backend.circuito == Backend.CERRADO:
+            return backend.sano
+        if backend.circuito == Backend.ABIERTO and ahora - backend.abierto_desde >= self.enfriamiento_s:
+            return True  # primera petición tras el enfriamiento: sonda
+        return False
+
+    def _elegir(self, excluir=(), preferido=None):
+        """Backend preferido si está disponible; si no, el de menos peticiones en curso"""
+        ahora = time.monotonic()
+        with self.lock:
+            candidatos = [b for b in self.backends
+                          if b not in excluir and self._disponible(b, ahora)]
+            if not candidatos:
+                self.metricas['sin_backend'] += 1
+                return None
+            if preferido in candidatos:
+                backend = preferido
+            else:
+                backend = min(candidatos, key=lambda b: (b.en_curso, b.latencia_ewma_ms))
+            if backend.circuito == Backend.ABIERTO:
+                self._transicion(backend, Backend.SEMIABIERTO)
+            backend.en_curso += 1
+            backend.metricas['peticiones'] += 1
+            return backend
+
+    def _transicion(self, backend, estado):
+        """Con el lock tomado: cambia el estado del circuito y lo registra"""
+        if backend.circuito == estado:
+            return
+        backend.circuito = estado
+        if estado == Backend.ABIERTO:
+            backend.abierto_desde = time.monotonic()
+            backend.metricas['aperturas_circuito'] += 1
+        self.transiciones.append({
+            'backend': backend.nombre,
+            'estado': estado,
+            'timestamp': time.time(),
+        })
+        nivel = logging.WARNING if estado == Backend.ABIERTO else logging.INFO
+        logging.log(nivel, f"🔀 Circuito hacia {backend.nombre}: {estado}")
+        self._actualizar_anillo()
+
+    def _actualizar_anillo(self):
+        """Con el lock tomado: el anillo contiene los backends sanos con circuito cerrado"""
+        if self.anillo is None:
+            return
+        cambio = False
+        for backend in self.backends:
+            activo = backend.sano and backend.circuito == Backend.CERRADO
+            if activo == (backend.nombre in self.anillo.nodos):
+                continue
+            cambio = True
+            if activo:
+                self.anillo.agregar(backend.nombre)
+            else:
+                self.anillo.quitar(backend.nombre)
+            self.transiciones.append({
+                'backend': backend.nombre,
+                'estado': 'entra al anillo' if activo else 'sale del anillo',
+                'timestamp': time.time(),
+            })
+            logging.info(
+                f"♻️ {backend.nombre} {'entra al' if activo else 'sale del'} anillo "
+                f"({len(self.anillo)} servidores)"
+            )
+        if cambio:
+            self.metricas['rebalanceos'] += 1
+            # Las escrituras en espera recalculan el dueño de su cédula
+            self.handoff.notify_all()
+
+    def _dueno(self, cedula):
+        """Con el lock tomado: backend dueño de la cédula, o None"""
+        nombre = self.anillo.nodo_de(cedula)
+        return self.por_nombre[nombre] if nombre else None
+
+    def _duenos(self, cedulas):
+        with self.lock:
+            return {self._dueno(c) for c in cedulas}
+
+    def _reservar_escritura(self, cedulas):
+        """
+        Reserva el dueño común de las cédulas para una escritura
+
+        Si alguna cédula tiene escrituras en curso en otro backend (cambió de
+        dueño hace poco), espera a que terminen: así dos servidores no
+        modifican la misma cuenta a la vez desde este balanceador. La reserva
+        es local y un timeout la libera; lo que se escape (otro bridge,
+        SocketClient) lo rechaza la BD (SaldoModificadoError en el servidor).
+
+        Returns:
+            el backend, o None si las cédulas ya no comparten dueño
+        """
+        limite = time.monotonic() + self.espera_handoff
+        espero = False
+        with self.handoff:
+            while True:
+                backend = self._dueno(cedulas[0])
+                if backend is None:
+                    self.metricas['sin_backend'] += 1
+                    raise ConnectionError("Ningún servidor socket disponible")
+                if any(self._dueno(c) is not backend for c in cedulas[1:]):
+                    return None
+                if not any(c in self.escrituras_en_vuelo and self.escrituras_en_vuelo[c][0] is not backend
+                           for c in cedulas):
+                    break
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    raise PoolTimeoutError(f"Cédula {cedulas[0]} sigue en traspaso tras {self.espera_handoff}s")
+                if not espero:
+                    espero = True
+                    self.metricas['esperas_handoff'] += 1
+                self.handoff.wait(restante)
+
+            for cedula in cedulas:
+                self.escrituras_en_vuelo.setdefault(cedula, [backend, 0])[1] += 1
+            backend.en_curso += 1
+            backend.metricas['peticiones'] += 1
+            return backend
+
+    def _liberar_escritura(self, cedulas):
+        with self.handoff:
+            for cedula in cedulas:
+                entrada = self.escrituras_en_vuelo[cedula]
+                entrada[1] -= 1
+                if entrada[1] == 0:
+                    del self.escrituras_en_vuelo[cedula]
+            self.handoff.notify_all()
+
+    def _terminar(self, backend, latencia_s, error=None):
+        """Registra el resultado de una petición en el backend"""
+        with self.lock:
+            backend.en_curso -= 1
+            if error is None:
+                backend.latencias.append(latencia_s * 1000)
+                backend.latencia_ewma_ms += 0.2 * (latencia_s * 1000 - backend.latencia_ewma_ms)
+                backend.fallos_seguidos = 0
+                if not backend.sano:
+                    backend.sano = True
+                    self._actualizar_anillo()
+                self._transicion(backend, Backend.CERRADO)
+                return
+
+            backend.metricas['errores'] += 1
+            if isinstance(error, socket.timeout):
+                backend.metricas['timeouts'] += 1
+            backend.fallos_seguidos += 1
+            if (backend.circuito == Backend.SEMIABIERTO
+                    or backend.fallos_seguidos >= self.umbral_fallos):
+                self._transicion(backend, Backend.ABIERTO)
+                # Reabrir reinicia el enfriamiento
+                backend.abierto_desde = time.monotonic()
+
+    # ---------- Envío ----------
+
+    def _enviar(self, backend, operacion, carga):
+        inicio = time.monotonic()
+        try:
+            if operacion == 'batch':
+                resultado = backend.pool.send_batch(carga)
+            else:
+                resultado = backend.pool.send_command(carga)
+        except Exception as e:
+            self._terminar(backend, time.monotonic() - inicio, e)
+            raise
+        self._terminar(backend, time.monotonic() - inicio)
+        return resultado
+
+    def _con_failover(self, operacion, carga, reintentable, preferido=None):
+        """Envía por el mejor backend y, si falla, prueba los demás"""
+        self._iniciar_chequeo()
+        inicio = time.monotonic()
+        probados = []
+        ultimo_error = None
+        while True:
+            backend = self._elegir(excluir=probados, preferido=preferido)
+            if backend is None:
+                raise ultimo_error or ConnectionError("Ningún servidor socket disponible")
+            probados.append(backend)
+            try:
+                resultado = self._enviar(backend, operacion, carga)
+            except Exception as e:
+                ultimo_error = e
+                if not (reintentable or isinstance(e, ERRORES_ANTES_DE_ENVIAR)):
+                    raise
+                logging.warning(f"⚠️ {backend.nombre} falló ({e}); probando otro servidor socket")
+                continue
+
+            if len(probados) > 1:
+                self._registrar_failover(inicio)
+            return resultado
+
+    def _registrar_failover(self, inicio):
+        with self.lock:
+            self.metricas['failovers'] += 1
+            self.failovers.append((time.monotonic() - inicio) * 1000)
+
+    def _con_hedge(self, comando, preferido=None):
+        """
+        Lectura con hedging: si la primera respuesta tarda más que hedge_ms
+        (o falla), se lanza la misma lectura en otro backend y gana la primera
+        respuesta exitosa. La que pierde termina sola y devuelve su conexión.
+
+        El intento primario corre en el executor acotado hedge_primarios; solo
+        el hedge (raro) crea un hilo. Sin cupo en el executor, la lectura va
+        sin hedge por el hilo de quien llama.
+        """
+        if not self.hedge_cupos.acquire(blocking=False):
+            return self._con_failover('comando', comando, es_idempotente(comando), preferido)
+        self._iniciar_chequeo()
+        inicio = time.monotonic()
+        resultados = queue.Queue()
+        lanzados = []
+
+        def lanzar():
+            backend = self._elegir(excluir=lanzados, preferido=preferido)
+            primario = not lanzados
+            if backend is None:
+                if primario:
+                    self.hedge_cupos.release()
+                return False
+            lanzados.append(backend)
+
+            def tarea():
+                try:
+                    resultados.put((backend, self._enviar(backend, 'comando', comando), None))
+                except Exception as e:
+                    resultados.put((backend, None, e))
+                finally:
+                    if primario:
+                        self.hedge_cupos.release()
+
+            # Con el contexto de quien llama: el intento sigue dentro de su traza
+            contexto = contextvars.copy_context()
+            if primario:
+                self.hedge_primarios.submit(contexto.run, tarea)
+            else:
+                threading.Thread(
+                    target=contexto.run, args=(tarea,),
+                    name=f"hedge-{backend.nombre}", daemon=True
+                ).start()
+            return True
+
+        if not lanzar():
+            raise ConnectionError("Ningún servidor socket disponible")
+
+        pendientes = 1
+        ultimo_error = None
+        hedge_lanzado = False
+        while pendientes:
+            try:
+                espera = None if hedge_lanzado else self.hedge_s
+                backend, respuesta, error = resultados.get(timeout=espera)
+            except queue.Empty:
+                # La primera respuesta tarda: se duplica la lectura
+                hedge_lanzado = True
+                if lanzar():
+                    pendientes += 1
+                    with self.lock:
+                        self.metricas['hedges_lanzados'] += 1
+                continue
+
+            pendientes -= 1
+            if error is None:
+                if backend is not lanzados[0]:
+                    with self.lock:
+                        if hedge_lanzado and ultimo_error is None:
+                            self.metricas['hedges_ganados'] += 1
+                    if ultimo_error is not None:
+                        self._registrar_failover(inicio)
+                return respuesta
+
+            ultimo_error = error
+            logging.warning(f"⚠️ {backend.nombre} falló ({error}); probando otro servidor socket")
+            if lanzar():
+                pendientes += 1
+
+        raise ultimo_error
+
+    def _escritura_enrutada(self, comando, cedulas):
+        """Escritura en el dueño de sus cédulas, sin failover a otro servidor"""
+        self._iniciar_chequeo()
+        while True:
+            if len(self._duenos(cedulas)) > 1:
+                # TRANSFERIR entre cédulas de servidores distintos
+                with self.lock:
+                    self.metricas['transferencias_handoff'] += 1
+                _, origen, destino, monto = comando.split()[:4]
+                return transferir_con_handoff(self.send_command, origen, destino, monto)
+
+            backend = self._reservar_escritura(cedulas)
+            if backend is None:
+                continue  # el anillo cambió entre la consulta y la reserva
+            try:
+                return self._enviar(backend, 'comando', comando)
+            finally:
+                self._liberar_escritura(cedulas)
+
+    def send_command(self, comando):
+        """Envía un comando al servidor socket más adecuado y retorna la respuesta"""
+        preferido = None
+        if self.anillo is not None:
+            cedulas = cedulas_de_comando(comando)
+            if cedulas and es_escritura(comando):
+                return self._escritura_enrutada(comando, cedulas)
+            if cedulas:
+                # Las lecturas no toman locks: el dueño es preferido, no obligatorio
+                with self.lock:
+                    preferido = self._dueno(cedulas[0])
+
+        partes = comando.split(None, 1)
+        if (self.hedge_s > 0 and len(self.backends) > 1
+                and partes and partes[0].upper() in COMANDOS_HEDGE):
+            return self._con_hedge(comando, preferido)
+        return self._con_failover('comando', comando, es_idempotente(comando), preferido)
+
+    def send_batch(self, comandos):
+        """
+        Envía comandos en BATCH (con failover si todos son idempotentes)
+
+        Con enrutamiento por cédula los comandos se parten en tramos
+        consecutivos del mismo dueño, y cada tramo va como un BATCH a su
+        dueño. Un TRANSFERIR entre dueños distintos es un tramo propio (handoff).
+        Los tramos corren uno tras otro, así cada comando ve el efecto de los
+        anteriores, como en un BATCH a un solo servidor. Si un tramo falla,
+        sus elementos llevan el error.
+        """
+        if self.anillo is None:
+            return self._con_failover('batch', comandos, all(es_idempotente(c) for c in comandos))
+
+        tramos = []  # [dueño o None, [índices], entre dueños]
+        for i, comando in enumerate(comandos):
+            duenos = self._duenos(cedulas_de_comando(comando))
+            if len(duenos) > 1:
+                tramos.append([None, [i], True])
+                continue
+            dueno = next(iter(duenos), None)
+            ultimo = tramos[-1] if tramos else None
+            if ultimo and not ultimo[2] and (dueno is None or ultimo[0] in (None, dueno)):
+                # Sin cédula puede ir con cualquier dueño
+                ultimo[0] = ultimo[0] or dueno
+                ultimo[1].append(i)
+            else:
+                tramos.append([dueno, [i], False])
+
+        respuestas = [None] * len(comandos)
+        for dueno, indices, entre_duenos in tramos:
+            if entre_duenos:
+                respuestas[indices[0]] = self._enviar_sin_excepcion(comandos[indices[0]])
+                continue
+            grupo = [comandos[i] for i in indices]
+            try:
+                resultado = self._batch_enrutado(grupo, dueno)
+            except BatchError as e:
+                resultado = [str(e)] * len(grupo)
+            except Exception as e:
+                resultado = [f"ERROR|Error de conexión: {e}"] * len(grupo)
+            for i, respuesta in zip(indices, resultado):
+                respuestas[i] = respuesta
+        return respuestas
+
+    def _batch_enrutado(self, grupo, dueno):
+        """BATCH de comandos con el mismo dueño (o sin cédula si dueno es None)"""
+        escrituras = list(dict.fromkeys(
+            c for comando in grupo if es_escritura(comando) for c in cedulas_de_comando(comando)
+        ))
+        if not escrituras:
+            return self._con_failover('batch', grupo, all(es_idempotente(c) for c in grupo), dueno)
+
+        backend = self._reservar_escritura(escrituras)
+        if backend is None:
+            # El anillo cambió mientras se agrupaba: uno por uno
+            return [self._enviar_sin_excepcion(comando) for comando in grupo]
+        try:
+            return self._enviar(backend, 'batch', grupo)
+        finally:
+            self._liberar_escritura(escrituras)
+
+    def _enviar_sin_excepcion(self, comando):
+        try:
+            return self.send_command(comando)
+        except Exception as e:
+            return f"ERROR|Error de conexión: {e}"
+
+    # ---------- Verificación de salud ----------
+
+    def _iniciar_chequeo(self):
+        if self.chequeo_iniciado or self.intervalo_salud <= 0:
+            return
+        with self.lock:
+            if self.chequeo_iniciado:
+                return
+            self.chequeo_iniciado = True
+        threading.Thread(target=self._chequeo_periodico, name="socket-health", daemon=True).start()
+
+    def _ping(self, backend):
+        """PING por una conexión propia, sin pasar por el pool del backend"""
+        try:
+            with socket.create_connection((backend.host, backend.port),
+                                          timeout=self.timeout_salud) as sock:
+                sock.recv(1024)  # BIENVENIDO
+                sock.sendall(b'PING')
+                return sock.recv(1024).startswith(b'OK')
+        except OSError:
+            return False
+
+    def verificar(self):
+        """Hace PING a cada backend y actualiza salud y circuitos"""
+        ahora = time.monotonic()
+        for backend in self.backends:
+            with self.lock:
+                abierto = backend.circuito == Backend.ABIERTO
+                if abierto and ahora - backend.abierto_desde < self.enfriamiento_s:
+                    continue
+            sano = self._ping(backend)
+            with self.lock:
+                self._verificado(backend, sano)
+
+    def _verificado(self, backend, sano):
+        """Con el lock tomado: aplica el resultado de un PING de verificación"""
+        if sano:
+            if not backend.sano:
+                logging.info(f"✅ Servidor socket {backend.nombre} responde de nuevo")
+            backend.sano = True
+            backend.fallos_seguidos = 0
+            if backend.circuito != Backend.CERRADO:
+                self._transicion(backend, Backend.CERRADO)
+        else:
+            backend.metricas['chequeos_fallidos'] += 1
+            if backend.sano:
+                logging.warning(f"⚠️ Servidor socket {backend.nombre} no responde al PING")
+            backend.sano = False
+            if backend.circuito != Backend.CERRADO:
+                self._transicion(backend, Backend.ABIERTO)
+                backend.abierto_desde = time.monotonic()
+        # La salud también decide quién está en el anillo
+        self._actualizar_anillo()
+
+    def _chequeo_periodico(self):
+        while True:
+            time.sleep(self.intervalo_salud)
+            try:
+                self.verificar()
+            except Exception as e:
+                logging.error(f"❌ Error verificando servidores socket: {e}")
+
+    # ---------- Métricas ----------
+
+    def stats(self):
+        """Estado por backend y reporte de failover"""
+        with self.lock:
+            backends = [{
+                'servidor': b.nombre,
+                'sano': b.sano,
+                'circuito': b.circuito,
+                'en_curso': b.en_curso,
+                'fallos_seguidos': b.fallos_seguidos,
+                **b.metricas,
+                'latencia': _resumen_latencias(list(b.latencias)),
+            } for b in self.backends]
+            return {
+                'backends': backends,
+                **self.metricas,
+                'hedge_ms': self.hedge_s * 1000,
+                'latencia_failover': _resumen_latencias(list(self.failovers)),
+                'transiciones': list(self.transiciones),
+                'anillo': None if self.anillo is None else {
+                    'servidores': sorted(self.anillo.nodos),
+                    'distribucion': self.anillo.distribucion(),
+                    'cedulas_con_escrituras': len(self.escrituras_en_vuelo),
+                },
+            }
+
+    def destino_directo(self, cedulas):
+        """
+        Servidor para carga que no pasa por el balanceador (pruebas de carga)
+        y las cédulas que puede tocar sin romper el reparto por dueño
+
+        Returns:
+            ((host, puerto), cédulas)
+        """
+        with self.lock:
+            if self.anillo is None or not len(self.anillo):
+                activos = [b for b in self.backends if b.sano and b.circuito == Backend.CERRADO]
+                backend = (activos or self.backends)[0]
+                return (backend.host, backend.port), list(cedulas)
+            anillo = self.anillo.copiar()
+
+        # Hashear todas las cédulas fuera del lock: no frena el enrutamiento en curso
+        grupos = {}
+        for cedula in cedulas:
+            grupos.setdefault(anillo.nodo_de(cedula), []).append(cedula)
+        nombre, propias = max(grupos.items(), key=lambda par: len(par[1]))
+        backend = self.por_nombre[nombre]
+        return (backend.host, backend.port), propias
+
+    def pool_stats(self):
+        """Métricas del pool de cada backend"""
+        return [b.pool.stats() for b in self.backends]
+
+    def close(self):
+        self.hedge_primarios.shutdown(wait=False)
+        for backend in self.backends:
+            backend.pool.close()
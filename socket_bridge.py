@@ -2,22 +2,51 @@
 Microservicio Puente - Flask
 Actúa como intermediario entre el Frontend (React/Next.js) y el Servidor Socket
 Traduce peticiones HTTP en comandos de socket
+
+Modo de servicio (BRIDGE_ASYNC_MODE):
+- threading: servidor de desarrollo de Werkzeug, un hilo por petición
+- gevent / eventlet: workers cooperativos; las llamadas al servidor socket y
+  el fan-out de WebSocket ceden el control en lugar de bloquear un hilo, así
+  un solo proceso sostiene miles de suscriptores y peticiones concurrentes
 """
 
-from flask import Flask, request, jsonify
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# El parcheo debe ocurrir antes de importar Flask, socket y threading
+BRIDGE_ASYNC_MODE = os.getenv('BRIDGE_ASYNC_MODE', 'threading').lower()
+if BRIDGE_ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+elif BRIDGE_ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif BRIDGE_ASYNC_MODE != 'threading':
+    raise ValueError(f"BRIDGE_ASYNC_MODE inválido: {BRIDGE_ASYNC_MODE} (threading, gevent o eventlet)")
+
+from flask import Flask, request, jsonify, g, has_request_context
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, join_room, leave_room
 import socket
 import logging
-import os
-import subprocess
-import sys
+import math
 import threading
 import time
-from dotenv import load_dotenv
+from contextlib import ExitStack
+from functools import wraps
 from datetime import datetime
-
-load_dotenv()
+from socket_pool import BatchError, PoolTimeoutError
+from socket_balancer import SocketBalancer, parsear_backends
+from bridge_mqtt import BridgeMQTTListener
+from bridge_fanout import CoalescingFanout
+from bridge_cache import ResponseCache, SingleFlight
+from bridge_ratelimit import RateLimiter, LoadShedder
+from bridge_loadtest import LoadTestRunner, LoadTestLimitError
+from bridge_metrics import RequestMetrics, gauges_prometheus
+from hash_ring import cedulas_de_comando, es_escritura
+import tracing
 
 # Configuración de logging
 logging.basicConfig(
@@ -31,51 +60,196 @@ logging.basicConfig(
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=BRIDGE_ASYNC_MODE)
 
-# Configuración del servidor socket
+# Trazas distribuidas (TRACE_FILE, TRACE_SAMPLE_RATE): cada petición HTTP es
+# la raíz de una traza que sigue al servidor socket, la BD y MQTT
+tracing.configurar('bridge')
+
+# Configuración de los servidores socket
 # IMPORTANTE: Usar 'localhost' para conectar, NO '0.0.0.0'
-SOCKET_HOST = 'localhost'  # Siempre localhost para el cliente del bridge
-SOCKET_PORT = int(os.getenv('SERVER_PORT', 5000))
+# SOCKET_BACKENDS=host1:5000,host2:5000 reparte la carga entre varios servidores
+# sobre la misma base de datos; sin él se usa SOCKET_HOST:SOCKET_PORT
+SOCKET_HOST = os.getenv('SOCKET_HOST', 'localhost')
+SOCKET_PORT = int(os.getenv('SOCKET_PORT', os.getenv('SERVER_PORT', 5000)))
+SOCKET_BACKENDS = parsear_backends(
+    os.getenv('SOCKET_BACKENDS', f"{SOCKET_HOST}:{SOCKET_PORT}"), SOCKET_PORT
+)
+
+# Reparto entre servidores (SOCKET_ROUTING):
+# - hash: cada cédula tiene un servidor dueño (hash consistente); los locks
+#   por cédula de cada servidor siguen siendo correctos
+# - least: el servidor con menos peticiones en curso; solo con un único
+#   servidor. Con varios, las escrituras a una cédula llegarían a servidores
+#   distintos y sus locks en memoria no se verían: la BD rechazaría los
+#   choques (SaldoModificadoError) y el cliente vería errores
+SOCKET_ROUTING = os.getenv('SOCKET_ROUTING', 'hash').lower()
+if SOCKET_ROUTING not in ('hash', 'least'):
+    raise ValueError(f"SOCKET_ROUTING inválido: {SOCKET_ROUTING} (hash o least)")
+if SOCKET_ROUTING == 'least' and len(SOCKET_BACKENDS) > 1:
+    raise ValueError("SOCKET_ROUTING=least solo admite un servidor; con varios use SOCKET_ROUTING=hash")
+
+# Un pool de conexiones persistentes por servidor (una petición en vuelo por
+# conexión), con verificación de salud, circuit breaker y hedging de lecturas
+socket_backends = SocketBalancer(
+    SOCKET_BACKENDS,
+    enrutar_por_cedula=SOCKET_ROUTING == 'hash',
+    umbral_fallos=int(os.getenv('SOCKET_BREAKER_FALLOS', 3)),
+    enfriamiento_s=float(os.getenv('SOCKET_BREAKER_ENFRIAMIENTO', 10)),
+    intervalo_salud=float(os.getenv('SOCKET_HEALTH_INTERVAL', 5)),
+    hedge_ms=float(os.getenv('SOCKET_HEDGE_MS', 100)),
+    max_conexiones=int(os.getenv('SOCKET_POOL_SIZE', 10)),
+    timeout=10,
+    espera_max=float(os.getenv('SOCKET_POOL_WAIT', 5))
+)
+
+# Caché de lecturas: TTL corto por ruta, invalidada por escrituras y eventos MQTT
+response_cache = ResponseCache(
+    max_entradas=int(os.getenv('BRIDGE_CACHE_MAX', 10000)),
+    stale_max_s=float(os.getenv('BRIDGE_CACHE_STALE', 30))
+)
+CACHE_TTL = {
+    'consulta': float(os.getenv('BRIDGE_CACHE_TTL_CONSULTA', 2)),
+    'historial': float(os.getenv('BRIDGE_CACHE_TTL_HISTORIAL', 2)),
+    'stats': float(os.getenv('BRIDGE_CACHE_TTL_STATS', 1)),
+}
+
+# Lecturas idénticas concurrentes comparten un solo viaje al servidor socket
+singleflight = SingleFlight()
+
+# Elementos como máximo en /api/consulta/bulk y /api/batch
+BATCH_MAX = int(os.getenv('BRIDGE_BATCH_MAX', 100))
+
+# Límites por IP y clase de ruta (token bucket) y descarte por latencia del servidor
+RATE_LIMIT_ACTIVO = os.getenv('BRIDGE_RATE_LIMIT', '1') == '1'
+rate_limiter = RateLimiter(
+    {
+        'lectura': (float(os.getenv('BRIDGE_RATE_LECTURA', 20)),
+                    float(os.getenv('BRIDGE_BURST_LECTURA', 40))),
+        'escritura': (float(os.getenv('BRIDGE_RATE_ESCRITURA', 5)),
+                      float(os.getenv('BRIDGE_BURST_ESCRITURA', 10))),
+    },
+    max_clientes=int(os.getenv('BRIDGE_RATE_MAX_CLIENTES', 10000))
+)
+load_shedder = LoadShedder(objetivo_ms=float(os.getenv('BRIDGE_SHED_LATENCIA_MS', 200)))
+# Detrás de nginx la IP del cliente es la última de X-Forwarded-For (la que
+# agrega el proxy); las anteriores las puede falsificar el cliente
+CONFIAR_PROXY = os.getenv('BRIDGE_TRUST_PROXY', '0') == '1'
+
+# Clase de cada endpoint limitado; los demás (health, métricas) no se limitan
+CLASE_RUTA = {
+    'consulta': 'lectura',
+    'historial': 'lectura',
+    'resumen': 'lectura',
+    'stats': 'lectura',
+    'consulta_bulk': 'lectura',
+    'deposito': 'escritura',
+    'retiro': 'escritura',
+    'crear_cliente': 'escritura',
+    'transferir': 'escritura',
+    'batch': 'escritura',
+    'simulate': 'escritura',
+}
+
+# Respuestas de send_command cuando el servidor socket no contestó
+ERRORES_DE_TRANSPORTE = ('ERROR|Timeout', 'ERROR|Error de conexión')
+
+# Origen de las actualizaciones en tiempo real:
+# - polling: HISTORIAL/STATS periódicos contra el servidor socket
+# - mqtt: eventos que publica el servidor; sin actividad no hay carga
+BRIDGE_UPDATES_MODE = os.getenv('BRIDGE_UPDATES_MODE', 'polling').lower()
+mqtt_listener = None
+
+# Latencia por ruta (total y por fase), peticiones en curso y errores
+request_metrics = RequestMetrics()
+
+
+def registrar_fase(fase, segundos):
+    """Suma el tiempo a la petición HTTP en curso, o a 'segundo_plano' fuera de una"""
+    medicion = g.get('medicion') if has_request_context() else None
+    if medicion is not None:
+        medicion.sumar(fase, segundos)
+    else:
+        request_metrics.observar_fase(fase, segundos)
+
+
+def medir_fase(fase):
+    """Decorador: atribuye la duración de la llamada a una fase (socket, parse, emit)"""
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                registrar_fase(fase, time.perf_counter() - inicio)
+        return envoltura
+    return decorador
+
+
+@medir_fase('emit')
+def emitir_ws(evento, datos, **kwargs):
+    """socketio.emit con el tiempo de emisión medido"""
+    socketio.emit(evento, datos, **kwargs)
 
 
 class SocketBridge:
     """Puente para comunicarse con el servidor socket"""
 
     @staticmethod
+    @medir_fase('socket')
     def send_command(comando):
-        """Envía un comando al servidor socket y retorna la respuesta"""
+        """Envía un comando al servidor socket por el pool y retorna la respuesta"""
+        inicio = time.monotonic()
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(10)  # Timeout de 10 segundos
-            sock.connect((SOCKET_HOST, SOCKET_PORT))
-
-            # Recibir mensaje de bienvenida
-            _ = sock.recv(1024)
-
-            # Enviar comando
-            sock.send(comando.encode('utf-8'))
-
-            # Recibir respuesta
-            respuesta = sock.recv(4096).decode('utf-8')
-            sock.close()
+            respuesta = socket_backends.send_command(comando)
 
-            return respuesta
-
-        except socket.timeout:
+        except (socket.timeout, PoolTimeoutError):
+            # Los timeouts cuentan para el load shedder: son la señal más clara de saturación
+            load_shedder.registrar(time.monotonic() - inicio)
             logging.error(f"❌ Timeout esperando respuesta del socket server")
             return f"ERROR|Timeout: El servidor no respondió en 10 segundos"
         except Exception as e:
+            # Fallos rápidos (conexión rechazada) no miden latencia: bajarían la EWMA
             logging.error(f"❌ Error comunicándose con socket: {e}")
             return f"ERROR|Error de conexión: {str(e)}"
 
+        load_shedder.registrar(time.monotonic() - inicio)
+        return respuesta
+
+    @staticmethod
+    @medir_fase('socket')
+    def send_batch(comandos):
+        """Envía varios comandos en un solo BATCH y retorna una respuesta por comando"""
+        inicio = time.monotonic()
+        try:
+            respuestas = socket_backends.send_batch(comandos)
+
+        except (socket.timeout, PoolTimeoutError):
+            load_shedder.registrar(time.monotonic() - inicio)
+            logging.error(f"❌ Timeout esperando respuesta del BATCH")
+            return ["ERROR|Timeout: El servidor no respondió en 10 segundos"] * len(comandos)
+        except BatchError as e:
+            logging.error(f"❌ BATCH rechazado: {e}")
+            return [str(e)] * len(comandos)
+        except Exception as e:
+            logging.error(f"❌ Error comunicándose con socket: {e}")
+            return [f"ERROR|Error de conexión: {str(e)}"] * len(comandos)
+
+        # Con enrutamiento por cédula los grupos que fallan vuelven como respuestas de error
+        if not all(r.startswith(ERRORES_DE_TRANSPORTE) for r in respuestas):
+            load_shedder.registrar(time.monotonic() - inicio)
+        return respuestas
+
     @staticmethod
+    @medir_fase('parse')
     def parsear_respuesta(respuesta):
         """Convierte la respuesta del socket en JSON"""
         partes = respuesta.split('|')
 
         if partes[0] == 'OK':
-            if len(partes) == 4:  # CONSULTA
+            if (len(partes) == 4 and not partes[1].startswith('Clientes conectados')
+                    and partes[1] != 'Transferencia exitosa'):  # CONSULTA
                 return {
                     'success': True,
                     'action': 'consulta',
@@ -86,6 +260,29 @@ class SocketBridge:
                     }
                 }
 
+            elif len(partes) > 1 and partes[1].startswith('Resumen'):
+                # Formato: OK|Resumen PERIODO|FECHA|DEP|RET|ENV|REC|NUM|...
+                periodos = []
+                for i in range(2, len(partes), 6):
+                    if i + 5 < len(partes):
+                        periodos.append({
+                            'periodo': partes[i],
+                            'total_depositos': float(partes[i+1]),
+                            'total_retiros': float(partes[i+2]),
+                            'total_transferencias_enviadas': float(partes[i+3]),
+                            'total_transferencias_recibidas': float(partes[i+4]),
+                            'num_transacciones': int(partes[i+5])
+                        })
+
+                return {
+                    'success': True,
+                    'action': 'resumen',
+                    'data': {
+                        'periodo': partes[1].split(' ')[-1],
+                        'periodos': periodos
+                    }
+                }
+
             elif len(partes) == 3 and partes[1] in ['Depósito exitoso', 'Retiro exitoso']:
                 accion = 'deposito' if partes[1] == 'Depósito exitoso' else 'retiro'
                 return {
@@ -152,14 +349,16 @@ class SocketBridge:
                 }
 
             else:  # HISTORIAL
+                # Formato: OK|ID|TIPO|MONTO|SALDO_FINAL|FECHA|... (más reciente primero)
                 transacciones = []
-                for i in range(1, len(partes), 4):
-                    if i + 3 < len(partes):
+                for i in range(1, len(partes), 5):
+                    if i + 4 < len(partes):
                         transacciones.append({
-                            'tipo': partes[i],
-                            'monto': float(partes[i+1]),
-                            'saldo_final': float(partes[i+2]),
-                            'fecha': partes[i+3]
+                            'id': int(partes[i]),
+                            'tipo': partes[i+1],
+                            'monto': float(partes[i+2]),
+                            'saldo_final': float(partes[i+3]),
+                            'fecha': partes[i+4]
                         })
 
                 return {
@@ -176,6 +375,136 @@ class SocketBridge:
             }
 
 
+def leer_compartido(comando, cedula=None):
+    """
+    Envía una lectura deduplicada con SingleFlight
+
+    La versión de caché de la cédula forma parte de la clave: tras una
+    escritura nadie se suma a una lectura que empezó antes. Retorna
+    (versión tomada antes de enviar, respuesta).
+    """
+    version = response_cache.version(cedula)
+    return singleflight.do(
+        (comando, version),
+        lambda: (version, SocketBridge.send_command(comando))
+    )
+
+
+def consultar_con_cache(ruta, cedula, comando):
+    """
+    Lectura a través de la caché de respuestas
+
+    Si el servidor socket no responde y hay una entrada vencida dentro de la
+    ventana stale, se sirve marcada con 'stale': True.
+    """
+    resultado = response_cache.obtener(ruta, cedula)
+    if resultado is not None:
+        return resultado
+
+    version, respuesta = leer_compartido(comando, cedula)
+
+    if respuesta.startswith(ERRORES_DE_TRANSPORTE):
+        anterior = response_cache.obtener_stale(ruta, cedula)
+        if anterior is not None:
+            logging.warning(f"⚠️ Sirviendo {ruta} {cedula or ''} desde caché vencida: {respuesta}")
+            return {**anterior, 'stale': True}
+
+    resultado = SocketBridge.parsear_respuesta(respuesta)
+    if resultado.get('success'):
+        response_cache.guardar(ruta, cedula, resultado, CACHE_TTL[ruta], version)
+    return resultado
+
+
+# ==================== MÉTRICAS Y TRAZAS POR RUTA ====================
+# Registrados antes que los límites para contar también los 429 y 503
+
+@app.before_request
+def iniciar_medicion():
+    # Plantilla de la ruta ('/api/historial/<cedula>'), no la URL: cardinalidad acotada
+    ruta = request.url_rule.rule if request.url_rule is not None else 'sin_ruta'
+    g.medicion = request_metrics.iniciar(ruta)
+
+    # Span raíz de la petición; si el cliente o el proxy mandan traceparent, se continúa
+    g.traza = ExitStack()
+    g.traza.enter_context(tracing.continuar(request.headers.get('traceparent')))
+    g.span = g.traza.enter_context(tracing.span(
+        f"{request.method} {ruta}", 'SERVER', **{'http.method': request.method, 'http.route': ruta}
+    ))
+
+
+@app.after_request
+def registrar_estado(respuesta):
+    g.estado = respuesta.status_code
+    if g.get('span') is not None and g.span.muestreado:
+        respuesta.headers['X-Trace-Id'] = g.span.trace_id
+    return respuesta
+
+
+@app.teardown_request
+def terminar_medicion(error=None):
+    estado = g.get('estado', 500)
+    medicion = g.pop('medicion', None)
+    if medicion is not None:
+        request_metrics.terminar(medicion, request.method, estado)
+
+    traza = g.pop('traza', None)
+    if traza is not None:
+        span = g.pop('span')
+        span.set('http.status_code', estado)
+        if estado >= 500:
+            span.marcar_error(error or f"HTTP {estado}")
+        traza.close()
+
+
+# ==================== LÍMITES DE TASA ====================
+
+def _ip_cliente():
+    if CONFIAR_PROXY:
+        reenviada = request.headers.get('X-Forwarded-For', '')
+        if reenviada:
+            return reenviada.split(',')[-1].strip()
+    return request.remote_addr or 'desconocida'
+
+
+def _costo_peticion(endpoint):
+    """Fichas que consume la petición: las rutas bulk cobran por elemento"""
+    if endpoint in ('consulta_bulk', 'batch'):
+        datos = request.get_json(silent=True) or {}
+        elementos = datos.get('cedulas' if endpoint == 'consulta_bulk' else 'operaciones')
+        if isinstance(elementos, list) and elementos:
+            return len(elementos)
+    return 1
+
+
+@app.before_request
+def limitar_peticiones():
+    """Aplica descarte adaptativo (503) y token buckets por IP y clase (429)"""
+    if not RATE_LIMIT_ACTIVO or request.method == 'OPTIONS':
+        return None
+    clase = CLASE_RUTA.get(request.endpoint)
+    if clase is None:
+        return None
+
+    # Primero el descarte: una petición descartada no gasta fichas del cliente
+    if load_shedder.descartar(clase):
+        respuesta = jsonify({
+            'success': False,
+            'error': 'Servidor sobrecargado, intente de nuevo en unos segundos'
+        })
+        respuesta.headers['Retry-After'] = '1'
+        return respuesta, 503
+
+    espera = rate_limiter.permitir(_ip_cliente(), clase, _costo_peticion(request.endpoint))
+    if espera:
+        respuesta = jsonify({
+            'success': False,
+            'error': f'Demasiadas peticiones de {clase}, intente de nuevo en {espera:.1f}s'
+        })
+        respuesta.headers['Retry-After'] = str(max(1, math.ceil(espera)))
+        return respuesta, 429
+    return None
+
+
 # ==================== RUTAS API ====================
 
 @app.route('/health', methods=['GET'])
@@ -188,6 +517,82 @@ def health():
     })
 
 
+@app.route('/api/pool/stats', methods=['GET'])
+def pool_stats():
+    """Métricas del pool de conexiones de cada servidor socket"""
+    return jsonify({'success': True, 'pools': socket_backends.pool_stats()})
+
+
+@app.route('/api/backends', methods=['GET'])
+def backends_stats():
+    """Salud, circuito y latencias de cada servidor socket, y reporte de failover"""
+    return jsonify({'success': True, **socket_backends.stats()})
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Métricas de la caché de respuestas"""
+    return jsonify({
+        'success': True,
+        'cache': response_cache.stats(),
+        'singleflight': singleflight.stats()
+    })
+
+
+@app.route('/api/fanout/stats', methods=['GET'])
+def fanout_stats():
+    """Métricas del fan-out de notificaciones"""
+    return jsonify({'success': True, 'fanout': fanout.stats()})
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Resumen para el dashboard: latencias por ruta, límites de tasa y descarte de carga"""
+    return jsonify({
+        'success': True,
+        'rutas': request_metrics.resumen(),
+        'trazas': tracing.tracer().stats(),
+        'rate_limit': {'activo': RATE_LIMIT_ACTIVO, **rate_limiter.stats()},
+        'load_shedding': load_shedder.stats()
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_prometheus():
+    """Métricas en formato de exposición de Prometheus"""
+    limites = rate_limiter.stats()
+    descarte = load_shedder.stats()
+    cache = response_cache.stats()
+    backends = socket_backends.stats()['backends']
+
+    lineas = [request_metrics.prometheus().rstrip('\n')]
+    lineas += gauges_prometheus(
+        'bridge_rate_limit_rejected_total', 'Peticiones rechazadas con 429 por clase',
+        [({'class': c}, n) for c, n in limites['rechazadas_429'].items()], tipo='counter'
+    )
+    lineas += gauges_prometheus(
+        'bridge_load_shed_total', 'Peticiones descartadas con 503 por clase',
+        [({'class': c}, n) for c, n in descarte['descartadas_503'].items()], tipo='counter'
+    )
+    lineas += gauges_prometheus(
+        'bridge_socket_latency_ewma_seconds', 'EWMA de la latencia del servidor socket',
+        [({}, descarte['latencia_ewma_ms'] / 1000)]
+    )
+    lineas += gauges_prometheus(
+        'bridge_cache_hit_ratio', 'Fracción de lecturas servidas desde la caché',
+        [({}, cache.get('hit_ratio', 0))]
+    )
+    lineas += gauges_prometheus(
+        'bridge_backend_up', 'Servidor socket sano y con el circuito cerrado',
+        [({'backend': b['servidor']}, int(b['sano'] and b['circuito'] == 'cerrado')) for b in backends]
+    )
+    lineas += gauges_prometheus(
+        'bridge_backend_in_flight', 'Comandos en curso por servidor socket',
+        [({'backend': b['servidor']}, b['en_curso']) for b in backends]
+    )
+    return '\n'.join(lineas) + '\n', 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
 @app.route('/api/consulta', methods=['POST'])
 def consulta():
     """Consulta información de un cliente"""
@@ -201,10 +606,9 @@ def consulta():
         comando = f"CONSULTA {cedula}"
         logging.info(f"📥 Comando: {comando}")
 
-        respuesta = SocketBridge.send_command(comando)
-        resultado = SocketBridge.parsear_respuesta(respuesta)
+        resultado = consultar_con_cache('consulta', cedula, comando)
 
-        logging.info(f"📤 Respuesta: {respuesta}")
+        logging.info(f"📤 Respuesta: {resultado}")
         return jsonify(resultado)
 
     except Exception as e:
@@ -229,6 +633,9 @@ def deposito():
         respuesta = SocketBridge.send_command(comando)
         resultado = SocketBridge.parsear_respuesta(respuesta)
 
+        if resultado.get('success'):
+            response_cache.invalidar_cedula(cedula)
+
         # Emitir actualización de balance por WebSocket
         if resultado.get('success') and resultado.get('data', {}).get('nuevo_saldo'):
             nuevo_saldo = resultado['data']['nuevo_saldo']
@@ -259,6 +666,9 @@ def retiro():
         respuesta = SocketBridge.send_command(comando)
         resultado = SocketBridge.parsear_respuesta(respuesta)
 
+        if resultado.get('success'):
+            response_cache.invalidar_cedula(cedula)
+
         # Emitir actualización de balance por WebSocket
         if resultado.get('success') and resultado.get('data', {}).get('nuevo_saldo'):
             nuevo_saldo = resultado['data']['nuevo_saldo']
@@ -293,6 +703,9 @@ def crear_cliente():
         respuesta = SocketBridge.send_command(comando)
         resultado = SocketBridge.parsear_respuesta(respuesta)
 
+        if resultado.get('success'):
+            response_cache.invalidar_cedula(cedula)
+
         logging.info(f"📤 Respuesta: {respuesta}")
         return jsonify(resultado)
 
@@ -321,6 +734,8 @@ def transferir():
 
         # Emitir actualización de balance para ambas cuentas
         if resultado.get('success'):
+            response_cache.invalidar_cedula(cedula_origen)
+            response_cache.invalidar_cedula(cedula_destino)
             data_parts = resultado.get('data', {})
             if 'saldo_origen' in data_parts:
                 broadcast_balance_update(cedula_origen, data_parts['saldo_origen'])
@@ -342,6 +757,26 @@ def historial(cedula):
         comando = f"HISTORIAL {cedula}"
         logging.info(f"📥 Comando: {comando}")
 
+        resultado = consultar_con_cache('historial', cedula, comando)
+
+        logging.info(f"📤 Respuesta: {resultado}")
+        return jsonify(resultado)
+
+    except Exception as e:
+        logging.error(f"❌ Error en /api/historial: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/resumen/<cedula>', methods=['GET'])
+def resumen(cedula):
+    """Obtiene los totales diarios o mensuales de un cliente"""
+    try:
+        periodo = request.args.get('periodo', 'DIARIO').upper()
+        limite = request.args.get('limite', 30, type=int)
+
+        comando = f"SUMMARY {cedula} {periodo} {limite}"
+        logging.info(f"📥 Comando: {comando}")
+
         respuesta = SocketBridge.send_command(comando)
         resultado = SocketBridge.parsear_respuesta(respuesta)
 
@@ -349,7 +784,7 @@ def historial(cedula):
         return jsonify(resultado)
 
     except Exception as e:
-        logging.error(f"❌ Error en /api/historial: {e}")
+        logging.error(f"❌ Error en /api/resumen: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
@@ -360,10 +795,9 @@ def stats():
         comando = "STATS"
         logging.info(f"📥 Comando: {comando}")
 
-        respuesta = SocketBridge.send_command(comando)
-        resultado = SocketBridge.parsear_respuesta(respuesta)
+        resultado = consultar_con_cache('stats', None, comando)
 
-        logging.info(f"📤 Respuesta: {respuesta}")
+        logging.info(f"📤 Respuesta: {resultado}")
         return jsonify(resultado)
 
     except Exception as e:
@@ -371,137 +805,484 @@ def stats():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-@app.route('/api/simulate', methods=['POST'])
-def simulate():
-    """Ejecuta test_concurrency.py para demostrar concurrencia"""
+@app.route('/api/consulta/bulk', methods=['POST'])
+def consulta_bulk():
+    """Consulta varias cédulas: las que no están en caché viajan en un solo BATCH"""
     try:
-        logging.info(f"🎯 Ejecutando pruebas de concurrencia...")
-        
-        # Get the directory of the current file
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        test_script = os.path.join(current_dir, 'test_concurrency.py')
-        
-        # Execute test_concurrency.py
-        if sys.platform == 'win32':
-            # Windows: Use start command to open in new console
-            subprocess.Popen(
-                f'start "Prueba de Concurrencia" cmd /k python "{test_script}"',
-                shell=True,
-                cwd=current_dir
-            )
-        else:
-            # Unix/Linux: Use terminal emulator
-            subprocess.Popen(
-                [sys.executable, test_script],
-                cwd=current_dir
-            )
-        
-        logging.info(f"✅ Pruebas de concurrencia iniciadas correctamente")
+        data = request.get_json()
+        cedulas = data.get('cedulas')
+
+        if not isinstance(cedulas, list) or not cedulas:
+            return jsonify({'success': False, 'error': 'Lista de cédulas requerida'}), 400
+        if len(cedulas) > BATCH_MAX:
+            return jsonify({'success': False, 'error': f'Máximo {BATCH_MAX} cédulas por petición'}), 400
+        if not all(isinstance(c, str) and c and not any(ch.isspace() for ch in c) for c in cedulas):
+            return jsonify({'success': False, 'error': 'Cédulas inválidas'}), 400
+
+        resultados = {}
+        faltantes = []
+        for cedula in dict.fromkeys(cedulas):
+            resultado = response_cache.obtener('consulta', cedula)
+            if resultado is not None:
+                resultados[cedula] = resultado
+            else:
+                faltantes.append(cedula)
+
+        if faltantes:
+            logging.info(f"📥 BATCH: CONSULTA de {len(faltantes)} cédulas")
+            versiones = [response_cache.version(c) for c in faltantes]
+            respuestas = SocketBridge.send_batch([f"CONSULTA {c}" for c in faltantes])
+
+            for cedula, version, respuesta in zip(faltantes, versiones, respuestas):
+                anterior = None
+                if respuesta.startswith(ERRORES_DE_TRANSPORTE):
+                    anterior = response_cache.obtener_stale('consulta', cedula)
+                if anterior is not None:
+                    resultados[cedula] = {**anterior, 'stale': True}
+                    continue
+                resultado = SocketBridge.parsear_respuesta(respuesta)
+                if resultado.get('success'):
+                    response_cache.guardar('consulta', cedula, resultado, CACHE_TTL['consulta'], version)
+                resultados[cedula] = resultado
+
         return jsonify({
             'success': True,
-            'message': 'Pruebas de concurrencia iniciadas. Se ha abierto una nueva consola con los tests.'
+            'resultados': [{'cedula': c, **resultados[c]} for c in cedulas]
         })
 
     except Exception as e:
-        logging.error(f"❌ Error al ejecutar pruebas: {e}")
+        logging.error(f"❌ Error en /api/consulta/bulk: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-# WebSocket event handlers
-@socketio.on('connect')
-def handle_connect():
-    """Cliente conectado vía WebSocket"""
-    logging.info(f"🔌 Cliente WebSocket conectado: {request.sid}")
-    emit('connected', {'message': 'Conectado al servidor'})
+# Operaciones de /api/batch: campos requeridos y comando del protocolo
+OPERACIONES_BATCH = {
+    'consulta': (('cedula',), lambda d: f"CONSULTA {d['cedula']}"),
+    'historial': (('cedula',), lambda d: f"HISTORIAL {d['cedula']}"),
+    'deposito': (('cedula', 'monto'), lambda d: f"AUMENTAR {d['cedula']} {float(d['monto'])}"),
+    'retiro': (('cedula', 'monto'), lambda d: f"DISMINUIR {d['cedula']} {float(d['monto'])}"),
+    'transferir': (('cedula_origen', 'cedula_destino', 'monto'),
+                   lambda d: f"TRANSFERIR {d['cedula_origen']} {d['cedula_destino']} {float(d['monto'])}"),
+    'crear': (('cedula', 'nombre'), lambda d: f"CREAR {d['cedula']} {d['nombre']}"),
+}
+
+
+def _comando_batch(operacion):
+    """Valida una operación de /api/batch y retorna (comando, error)"""
+    if not isinstance(operacion, dict):
+        return None, 'Operación inválida'
+    op = operacion.get('op')
+    if op not in OPERACIONES_BATCH:
+        return None, f"Operación desconocida: {op}"
+
+    campos, construir = OPERACIONES_BATCH[op]
+    faltantes = [c for c in campos if operacion.get(c) in (None, '')]
+    if faltantes:
+        return None, f"Campos requeridos: {', '.join(faltantes)}"
+
+    for campo in campos:
+        valor = str(operacion[campo])
+        # Un salto de línea partiría el batch; un espacio en una cédula, el comando
+        if '\n' in valor or (campo.startswith('cedula') and any(ch.isspace() for ch in valor)):
+            return None, f"Valor inválido en {campo}"
+    if op == 'crear' and not str(operacion['cedula']).startswith('0'):
+        return None, 'La cédula debe comenzar con 0'
 
+    try:
+        return construir(operacion), None
+    except (TypeError, ValueError):
+        return None, 'Monto inválido'
+
+
+def _despues_de_escritura(operacion, resultado):
+    """Invalida caché y encola notificaciones tras una escritura exitosa del batch"""
+    op = operacion['op']
+    datos = resultado.get('data', {})
+    if op in ('deposito', 'retiro'):
+        response_cache.invalidar_cedula(operacion['cedula'])
+        if 'nuevo_saldo' in datos:
+            broadcast_balance_update(operacion['cedula'], datos['nuevo_saldo'])
+    elif op == 'transferir':
+        response_cache.invalidar_cedula(operacion['cedula_origen'])
+        response_cache.invalidar_cedula(operacion['cedula_destino'])
+        if 'saldo_origen' in datos:
+            broadcast_balance_update(operacion['cedula_origen'], datos['saldo_origen'])
+        if 'saldo_destino' in datos:
+            broadcast_balance_update(operacion['cedula_destino'], datos['saldo_destino'])
+    elif op == 'crear':
+        response_cache.invalidar_cedula(operacion['cedula'])
+
+
+@app.route('/api/batch', methods=['POST'])
+def batch():
+    """
+    Ejecuta una lista ordenada de operaciones mixtas en un solo BATCH
+
+    Cuerpo: {"operaciones": [{"op": "deposito", "cedula": "...", "monto": 10}, ...]}
+    Las operaciones se ejecutan en orden; cada una tiene su propio resultado
+    y un fallo no detiene a las siguientes.
+    """
+    try:
+        data = request.get_json()
+        operaciones = data.get('operaciones')
+
+        if not isinstance(operaciones, list) or not operaciones:
+            return jsonify({'success': False, 'error': 'Lista de operaciones requerida'}), 400
+        if len(operaciones) > BATCH_MAX:
+            return jsonify({'success': False, 'error': f'Máximo {BATCH_MAX} operaciones por petición'}), 400
+
+        resultados = [None] * len(operaciones)
+        comandos = []
+        indices = []
+        for i, operacion in enumerate(operaciones):
+            comando, error = _comando_batch(operacion)
+            if error:
+                resultados[i] = {'success': False, 'error': error}
+            else:
+                comandos.append(comando)
+                indices.append(i)
+
+        if comandos:
+            logging.info(f"📥 BATCH: {len(comandos)} operaciones")
+            for i, respuesta in zip(indices, SocketBridge.send_batch(comandos)):
+                resultado = SocketBridge.parsear_respuesta(respuesta)
+                if resultado.get('success'):
+                    _despues_de_escritura(operaciones[i], resultado)
+                resultados[i] = resultado
 
-@socketio.on('disconnect')
-def handle_disconnect():
-    """Cliente desconectado"""
-    logging.info(f"🔌 Cliente WebSocket desconectado: {request.sid}")
+        return jsonify({
+            'success': True,
+            'resultados': [
+                {'op': op.get('op') if isinstance(op, dict) else None, **r}
+                for op, r in zip(operaciones, resultados)
+            ]
+        })
+
+    except Exception as e:
+        logging.error(f"❌ Error en /api/batch: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# Pruebas de carga en segundo plano; el progreso va por WebSocket a todos
+loadtest_runner = LoadTestRunner(
+    max_simultaneos=int(os.getenv('BRIDGE_LOADTEST_MAX_JOBS', 1)),
+    max_tasa=float(os.getenv('BRIDGE_LOADTEST_MAX_RPS', 2000)),
+    max_duracion=float(os.getenv('BRIDGE_LOADTEST_MAX_DURACION', 300)),
+    max_cuentas=int(os.getenv('BRIDGE_LOADTEST_MAX_CUENTAS', 100_000)),
+    emitir=emitir_ws,
+    iniciar_tarea=socketio.start_background_task
+)
+
+
+def _respuesta_loadtest(comando, respuesta):
+    """Las escrituras de la prueba no pasan por las rutas: invalidar y notificar aquí"""
+    if respuesta is None or not respuesta.startswith('OK') or not es_escritura(comando):
+        return
+    for cedula in cedulas_de_comando(comando):
+        response_cache.invalidar_cedula(cedula)
+        broadcast_balance_update(cedula, None)
+
+
+@app.route('/api/simulate', methods=['POST'])
+def simulate():
+    """
+    Lanza una prueba de carga de lazo abierto contra el servidor socket
 
+    Body (todo opcional): tasa, duracion, calentamiento, conexiones, mezcla
+    ('CMD:peso,...' o {cmd: peso}), cuentas | num_cuentas + prefijo, zipf, semilla
+    """
+    try:
+        escenario = loadtest_runner.validar(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    # Con reparto por dueño la carga directa solo toca cédulas de un servidor
+    (host, port), cuentas = socket_backends.destino_directo(escenario['cuentas'])
+    escenario['cuentas'] = cuentas
+
+    try:
+        job_id = loadtest_runner.lanzar(escenario, host, port, on_response=_respuesta_loadtest)
+    except LoadTestLimitError as e:
+        return jsonify({'success': False, 'error': str(e)}), 429
+    except Exception as e:
+        logging.error(f"❌ Error al lanzar prueba de carga: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
 
-# Mantener registro de clientes suscritos por cédula
-active_subscriptions = {}  # {cedula: [sid1, sid2, ...]}
+    return jsonify({
+        'success': True,
+        'message': 'Prueba de carga iniciada. El progreso llega por WebSocket (loadtest_progress).',
+        'job': loadtest_runner.obtener(job_id)
+    }), 202
+
+
+@app.route('/api/simulate', methods=['GET'])
+def simulate_list():
+    """Pruebas de carga recientes"""
+    return jsonify({'success': True, 'jobs': loadtest_runner.listar()})
+
+
+@app.route('/api/simulate/<job_id>', methods=['GET'])
+def simulate_status(job_id):
+    """Estado, último progreso y reporte final de una prueba de carga"""
+    trabajo = loadtest_runner.obtener(job_id)
+    if trabajo is None:
+        return jsonify({'success': False, 'error': 'Prueba de carga no encontrada'}), 404
+    return jsonify({'success': True, 'job': trabajo})
+
+
+@app.route('/api/simulate/<job_id>/cancel', methods=['POST'])
+def simulate_cancel(job_id):
+    """Detiene una prueba de carga en ejecución"""
+    if not loadtest_runner.cancelar(job_id):
+        return jsonify({'success': False, 'error': 'La prueba no existe o ya terminó'}), 404
+    return jsonify({'success': True, 'job_id': job_id})
+
+
+# Suscripciones por cédula: cada cédula es una sala de Socket.IO y los
+# índices en ambos sentidos dan alta, baja y limpieza en O(1)
+active_subscriptions = {}  # {cedula: {sid1, sid2, ...}}
+sid_subscriptions = {}  # {sid: {cedula1, cedula2, ...}}
 subscriptions_lock = threading.Lock()
 
+
+# Flujo delta del historial: por sala se recuerda el id de la transacción más
+# reciente emitida y solo se envían las filas nuevas. Con HISTORIAL_LIMITE o
+# más filas nuevas el hueco no cabe en un delta y se envía un resync completo
+HISTORIAL_LIMITE = 10  # filas que retorna el servidor por HISTORIAL
+ultimo_id_emitido = {}  # {cedula: id más reciente enviado a la sala}
+historial_lock = threading.Lock()
+
+
+def sala_cedula(cedula):
+    """Nombre de la sala de Socket.IO de una cédula"""
+    return f"cedula:{cedula}"
+
+
+def _cedula_suscrita(cedula):
+    with subscriptions_lock:
+        return cedula in active_subscriptions
+
+
+def _quitar_suscripcion(sid, cedula):
+    """Quita una suscripción de ambos índices (llamar con subscriptions_lock tomado)"""
+    sids = active_subscriptions.get(cedula)
+    if sids is not None:
+        sids.discard(sid)
+        if not sids:
+            del active_subscriptions[cedula]
+            with historial_lock:
+                ultimo_id_emitido.pop(cedula, None)
+    cedulas = sid_subscriptions.get(sid)
+    if cedulas is not None:
+        cedulas.discard(cedula)
+        if not cedulas:
+            del sid_subscriptions[sid]
+
+
+# WebSocket event handlers
 @socketio.on('connect')
 def handle_connect():
-    """Cliente WebSocket conectado"""
+    """Cliente conectado vía WebSocket"""
     logging.info(f"🔌 Cliente WebSocket conectado: {request.sid}")
+    emitir_ws('connected', {'message': 'Conectado al servidor'}, to=request.sid)
+
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    """Cliente WebSocket desconectado"""
-    # Remover de todas las suscripciones
+    """Cliente desconectado: Socket.IO lo saca de sus salas, aquí se limpian los índices"""
     with subscriptions_lock:
-        for cedula in list(active_subscriptions.keys()):
-            if request.sid in active_subscriptions[cedula]:
-                active_subscriptions[cedula].remove(request.sid)
-                if not active_subscriptions[cedula]:
-                    del active_subscriptions[cedula]
+        for cedula in list(sid_subscriptions.get(request.sid, ())):
+            _quitar_suscripcion(request.sid, cedula)
     logging.info(f"🔌 Cliente WebSocket desconectado: {request.sid}")
 
+
+@socketio.on('unsubscribe_balance')
+def handle_unsubscribe_balance(data):
+    """Cliente deja de recibir actualizaciones de una cédula"""
+    cedula = data.get('cedula')
+    leave_room(sala_cedula(cedula))
+    with subscriptions_lock:
+        _quitar_suscripcion(request.sid, cedula)
+    logging.info(f"📡 Cliente {request.sid} desuscrito de cédula {cedula}")
+
+
 @socketio.on('subscribe_balance')
 def handle_subscribe_balance(data):
-    """Cliente se suscribe a actualizaciones de saldo e historial"""
+    """
+    Cliente se suscribe a actualizaciones de saldo e historial
+
+    Si envía `ultimo_id` (la transacción más reciente que ya tiene) recibe solo
+    las nuevas como transactions_delta; si no, la lista como transactions_resync
+    """
     cedula = data.get('cedula')
+    ultimo_id = data.get('ultimo_id')
+    join_room(sala_cedula(cedula))
     with subscriptions_lock:
-        if cedula not in active_subscriptions:
-            active_subscriptions[cedula] = []
-        if request.sid not in active_subscriptions[cedula]:
-            active_subscriptions[cedula].append(request.sid)
+        active_subscriptions.setdefault(cedula, set()).add(request.sid)
+        sid_subscriptions.setdefault(request.sid, set()).add(cedula)
     logging.info(f"📡 Cliente {request.sid} suscrito a cédula {cedula}")
-    
+
     # Enviar historial inicial inmediatamente
     try:
-        comando = f"HISTORIAL {cedula}"
-        respuesta = SocketBridge.send_command(comando)
-        resultado = SocketBridge.parsear_respuesta(respuesta)
-        
-        if resultado.get('success') and resultado.get('data', {}).get('transacciones'):
-            emit('transactions_updated', {
-                'cedula': cedula,
-                'transactions': resultado['data']['transacciones']
-            })
+        transacciones = consultar_historial(cedula, ultimo_id)
+        if transacciones is None:
+            return
+
+        if ultimo_id is not None and len(transacciones) < HISTORIAL_LIMITE:
+            if transacciones:
+                emitir_ws('transactions_delta', _payload_delta(cedula, ultimo_id, transacciones), to=request.sid)
+        else:
+            emitir_ws('transactions_resync', _payload_resync(cedula, transacciones), to=request.sid)
+
+        with historial_lock:
+            if cedula not in ultimo_id_emitido:
+                ultimo_id_emitido[cedula] = transacciones[0]['id'] if transacciones else (ultimo_id or 0)
     except Exception as e:
         logging.error(f"Error enviando historial inicial: {e}")
 
 
-def broadcast_balance_update(cedula, new_balance):
-    """Broadcast actualización de saldo y historial a todos los clientes conectados"""
-    # Emitir actualización de balance
-    socketio.emit('balance_updated', {
+@socketio.on('resync_transactions')
+def handle_resync_transactions(data):
+    """El cliente perdió la continuidad del delta y pide la lista completa"""
+    cedula = data.get('cedula')
+    transacciones = consultar_historial(cedula)
+    if transacciones is not None:
+        emitir_ws('transactions_resync', _payload_resync(cedula, transacciones), to=request.sid)
+
+
+def consultar_historial(cedula, desde_id=None):
+    """Transacciones del servidor (más reciente primero), o None si hubo error"""
+    comando = f"HISTORIAL {cedula}" if desde_id is None else f"HISTORIAL {cedula} DESDE {int(desde_id)}"
+    _, respuesta = leer_compartido(comando, cedula)
+    resultado = SocketBridge.parsear_respuesta(respuesta)
+    if not resultado.get('success'):
+        logging.error(f"Error obteniendo historial de {cedula}: {resultado.get('error')}")
+        return None
+    return resultado['data']['transacciones']
+
+
+def _payload_resync(cedula, transacciones):
+    return {
         'cedula': cedula,
-        'balance': new_balance
-    })
-    
-    # Obtener historial actualizado y emitirlo
+        'ultimo_id': transacciones[0]['id'] if transacciones else 0,
+        'transactions': transacciones
+    }
+
+
+def _payload_delta(cedula, desde_id, transacciones):
+    return {
+        'cedula': cedula,
+        'desde_id': desde_id,
+        'ultimo_id': transacciones[0]['id'],
+        'transactions': transacciones
+    }
+
+
+def emitir_historial(cedula):
+    """Envía a la sala de la cédula solo las transacciones nuevas, o un resync"""
     try:
-        comando = f"HISTORIAL {cedula}"
-        respuesta = SocketBridge.send_command(comando)
-        resultado = SocketBridge.parsear_respuesta(respuesta)
-        
-        if resultado.get('success') and resultado.get('data', {}).get('transacciones'):
-            socketio.emit('transactions_updated', {
-                'cedula': cedula,
-                'transactions': resultado['data']['transacciones']
-            })
+        with historial_lock:
+            desde = ultimo_id_emitido.get(cedula)
+
+        transacciones = consultar_historial(cedula, desde)
+        if not transacciones:
+            return
+
+        with historial_lock:
+            actual = ultimo_id_emitido.get(cedula)
+            if actual is not None and actual != desde:
+                # Otra emisión avanzó mientras tanto: solo lo que aún no salió
+                transacciones = [tx for tx in transacciones if tx['id'] > actual]
+                if not transacciones:
+                    return
+                desde = actual
+            ultimo_id_emitido[cedula] = transacciones[0]['id']
+
+        if desde is None or len(transacciones) >= HISTORIAL_LIMITE:
+            emitir_ws('transactions_resync', _payload_resync(cedula, transacciones), to=sala_cedula(cedula))
+        else:
+            emitir_ws('transactions_delta', _payload_delta(cedula, desde, transacciones), to=sala_cedula(cedula))
     except Exception as e:
-        logging.error(f"Error obteniendo historial actualizado: {e}")
+        logging.error(f"Error obteniendo historial actualizado de {cedula}: {e}")
+
+
+def _refrescar_cedula(cedula, saldo):
+    """Trabajo del fan-out: saldo (si se conoce) e historial nuevo a la sala"""
+    # Nadie observa esta cuenta: ni emitir ni pedir HISTORIAL
+    if not _cedula_suscrita(cedula):
+        return
+
+    if saldo is not None:
+        emitir_ws('balance_updated', {
+            'cedula': cedula,
+            'balance': saldo
+        }, to=sala_cedula(cedula))
+
+    emitir_historial(cedula)
+
+
+# Notificaciones posteriores a escrituras, fuera del camino HTTP y agrupadas
+# por cédula: una ráfaga sobre la misma cuenta produce un solo refresco
+fanout = CoalescingFanout(_refrescar_cedula, workers=int(os.getenv('BRIDGE_FANOUT_WORKERS', 2)))
+
+
+def broadcast_balance_update(cedula, new_balance):
+    """Encola la notificación de saldo e historial para los suscriptores de la cédula"""
+    # En modo MQTT el evento del servidor trae el cambio; emitir aquí lo duplicaría
+    if mqtt_listener and mqtt_listener.connected:
+        return
+
+    fanout.notificar(cedula, new_balance)
+
+
+# ==================== EVENTOS MQTT ====================
+# Se ejecutan en el hilo de paho: el HISTORIAL pasa por el fan-out para no
+# frenar la recepción de eventos
+
+def on_mqtt_balance(cedula, saldo_nuevo):
+    response_cache.invalidar_cedula(cedula)
+    if _cedula_suscrita(cedula):
+        emitir_ws('balance_updated', {'cedula': cedula, 'balance': saldo_nuevo}, to=sala_cedula(cedula))
+
+
+def on_mqtt_transaction(cedula, payload):
+    response_cache.invalidar_cedula(cedula)
+    if _cedula_suscrita(cedula):
+        fanout.notificar(cedula)
+
+
+def on_mqtt_transfer(payload):
+    for cedula in (payload.get('cedula_origen'), payload.get('cedula_destino')):
+        if cedula:
+            response_cache.invalidar_cedula(cedula)
+        if cedula and _cedula_suscrita(cedula):
+            fanout.notificar(cedula)
+
+
+def on_mqtt_stats(payload):
+    # Mismo formato que parsear_respuesta para STATS
+    emitir_ws('stats_updated', {
+        'success': True,
+        'action': 'stats',
+        'estadisticas': {
+            'clientes_activos': payload.get('clientes_conectados', 0),
+            'operaciones_simultaneas': payload.get('total_transacciones', 0),
+            'conexiones_activas': payload.get('ips_activas', 0)
+        }
+    })
 
 
 def broadcast_stats():
     """Broadcast de estadísticas del servidor cada 3 segundos"""
     while True:
         try:
-            time.sleep(3)
+            socketio.sleep(3)
             comando = "STATS"
             respuesta = SocketBridge.send_command(comando)
             resultado = SocketBridge.parsear_respuesta(respuesta)
             
             if resultado.get('success'):
-                socketio.emit('stats_updated', resultado)
+                emitir_ws('stats_updated', resultado)
         except Exception as e:
             logging.error(f"Error broadcasting stats: {e}")
 
@@ -510,35 +1291,38 @@ def broadcast_transactions():
     """Broadcast de historial de transacciones para cédulas activas cada 5 segundos"""
     while True:
         try:
-            time.sleep(5)
+            socketio.sleep(5)
             # Obtener lista de cédulas activas
             with subscriptions_lock:
                 cedulas_activas = list(active_subscriptions.keys())
             
-            # Broadcast historial para cada cédula activa
+            # Solo viajan las transacciones nuevas de cada cédula activa
             for cedula in cedulas_activas:
-                try:
-                    comando = f"HISTORIAL {cedula}"
-                    respuesta = SocketBridge.send_command(comando)
-                    resultado = SocketBridge.parsear_respuesta(respuesta)
-                    
-                    if resultado.get('success') and resultado.get('data', {}).get('transacciones'):
-                        socketio.emit('transactions_updated', {
-                            'cedula': cedula,
-                            'transactions': resultado['data']['transacciones']
-                        })
-                except Exception as e:
-                    logging.error(f"Error broadcasting transactions para {cedula}: {e}")
+                emitir_historial(cedula)
         except Exception as e:
             logging.error(f"Error en broadcast_transactions: {e}")
 
 
-# Iniciar threads de broadcast
-stats_thread = threading.Thread(target=broadcast_stats, daemon=True)
-stats_thread.start()
+def iniciar_broadcasts():
+    """Inicia las actualizaciones en tiempo real (no se lanzan al importar el módulo)"""
+    global mqtt_listener
 
-transactions_thread = threading.Thread(target=broadcast_transactions, daemon=True)
-transactions_thread.start()
+    if BRIDGE_UPDATES_MODE == 'mqtt':
+        mqtt_listener = BridgeMQTTListener(
+            on_balance=on_mqtt_balance,
+            on_transaction=on_mqtt_transaction,
+            on_transfer=on_mqtt_transfer,
+            on_stats=on_mqtt_stats
+        )
+        if mqtt_listener.start():
+            logging.info("📡 Actualizaciones en tiempo real por eventos MQTT")
+            return
+        logging.warning("⚠️ MQTT no disponible, usando polling para actualizaciones")
+        mqtt_listener = None
+
+    # Hilos en modo threading, greenlets en gevent/eventlet
+    socketio.start_background_task(broadcast_stats)
+    socketio.start_background_task(broadcast_transactions)
 
 
 @app.errorhandler(404)
@@ -554,14 +1338,31 @@ def internal_error(error):
 
 
 if __name__ == '__main__':
-    logging.info(f"🚀 Iniciando bridge en port 5001")
-    logging.info(f"🔗 Conectando a socket server en {SOCKET_HOST}:{SOCKET_PORT}")
+    BRIDGE_PORT = int(os.getenv('BRIDGE_PORT', 5001))
+    # Depuración por defecto solo con el servidor de desarrollo
+    debug = os.getenv('BRIDGE_DEBUG', '1' if BRIDGE_ASYNC_MODE == 'threading' else '0') == '1'
+
+    logging.info(f"🚀 Iniciando bridge en port {BRIDGE_PORT} (modo {BRIDGE_ASYNC_MODE})")
+    logging.info(f"🔗 Servidores socket: {', '.join(f'{h}:{p}' for h, p in SOCKET_BACKENDS)}")
     logging.info(f"🔌 WebSocket habilitado para actualizaciones en tiempo real")
 
-    socketio.run(
-        app,
-        host='0.0.0.0',
-        port=5001,
-        debug=True,
-        allow_unsafe_werkzeug=True
-    )
+    iniciar_broadcasts()
+
+    if BRIDGE_ASYNC_MODE == 'threading':
+        socketio.run(
+            app,
+            host='0.0.0.0',
+            port=BRIDGE_PORT,
+            debug=debug,
+            allow_unsafe_werkzeug=True
+        )
+    else:
+        # Servidor WSGI de gevent/eventlet con soporte nativo de WebSocket
+        socketio.run(
+            app,
+            host='0.0.0.0',
+            port=BRIDGE_PORT,
+            debug=debug,
+            use_reloader=False,
+            log_output=debug
+        )
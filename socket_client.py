@@ -1,11 +1,15 @@
 """
 Cliente Socket para probar el Servidor Bancario Distribuido
 Envía comandos y recibe respuestas del servidor
+
+Con varios servidores (--servers) cada comando va al dueño de su cédula
+según el mismo anillo de hash consistente que usa el bridge.
 """
 
 import socket
 import sys
 import logging
+from hash_ring import HashRing, cedulas_de_comando, transferir_con_handoff
 
 logging.basicConfig(
     level=logging.INFO,
@@ -16,41 +20,77 @@ logging.basicConfig(
 class SocketClient:
     """Cliente socket para comunicarse con el servidor bancario"""
 
-    def __init__(self, host='localhost', port=5000):
+    def __init__(self, host='localhost', port=5000, servidores=None):
+        """
+        Args:
+            servidores: lista de (host, puerto); con más de uno, las cédulas
+                se reparten con hash consistente
+        """
         self.host = host
         self.port = port
         self.socket = None
+        self.servidores = servidores or [(host, port)]
+        self.anillo = None
+        if len(self.servidores) > 1:
+            self.anillo = HashRing(f"{h}:{p}" for h, p in self.servidores)
+        self.conexiones = {}  # {"host:puerto": socket}
+        self.lectores = {}  # {socket: archivo de lectura por líneas}
 
     def connect(self):
-        """Conecta con el servidor"""
+        """Conecta con el servidor (o con todos, si hay varios)"""
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.host, self.port))
-            logging.info(f"✅ Conectado a {self.host}:{self.port}")
-
-            # Recibir mensaje de bienvenida
-            welcome = self.socket.recv(1024).decode('utf-8')
-            print(f"\n{welcome}")
+            for host, port in self.servidores:
+                conexion = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                conexion.connect((host, port))
+                logging.info(f"✅ Conectado a {host}:{port}")
+
+                # Recibir mensaje de bienvenida
+                self.lectores[conexion] = conexion.makefile('rb')
+                welcome = self.lectores[conexion].readline().decode('utf-8')
+                if self.socket is None:
+                    print(f"\n{welcome}")
+                    self.socket = conexion
+                self.conexiones[f"{host}:{port}"] = conexion
             return True
 
         except Exception as e:
             logging.error(f"❌ Error conectando: {e}")
             return False
 
+    def _enviar(self, comando):
+        """Envía por la conexión del dueño de la cédula (lanza ante errores)"""
+        conexion = self.socket
+        if self.anillo is not None:
+            cedulas = cedulas_de_comando(comando)
+            duenos = {self.anillo.nodo_de(c) for c in cedulas}
+            if len(duenos) > 1:
+                # TRANSFERIR entre cédulas de servidores distintos
+                _, origen, destino, monto = comando.split()[:4]
+                return transferir_con_handoff(self._enviar, origen, destino, monto)
+            if duenos:
+                conexion = self.conexiones[duenos.pop()]
+
+        conexion.sendall(comando.encode('utf-8'))
+        # Una línea por respuesta: el \n marca el fin aunque llegue en varios recv
+        respuesta = self.lectores[conexion].readline()
+        if not respuesta:
+            raise ConnectionError("El servidor cerró la conexión")
+        return respuesta.decode('utf-8').rstrip('\n')
+
     def send_command(self, comando):
         """Envía un comando al servidor y recibe la respuesta"""
         try:
-            self.socket.send(comando.encode('utf-8'))
-            response = self.socket.recv(4096).decode('utf-8')
-            return response
+            return self._enviar(comando)
         except Exception as e:
             logging.error(f"❌ Error enviando comando: {e}")
             return f"ERROR|{str(e)}"
 
     def close(self):
         """Cierra la conexión"""
-        if self.socket:
-            self.socket.close()
+        for conexion in self.conexiones.values():
+            self.lectores.pop(conexion).close()
+            conexion.close()
+        if self.conexiones:
             logging.info("Desconectado del servidor")
 
     def interactive_shell(self):
@@ -63,7 +103,8 @@ class SocketClient:
         print("  • AUMENTAR <cedula> <monto>")
         print("  • DISMINUIR <cedula> <monto>")
         print("  • CREAR <cedula> <nombres> <apellidos> <saldo>")
-        print("  • HISTORIAL <cedula>")
+        print("  • HISTORIAL <cedula> [DESDE <id>]")
+        print("  • SUMMARY <cedula> [DIARIO|MENSUAL] [limite]")
         print("  • STATS")
         print("  • SALIR")
         print("=" * 70 + "\n")
@@ -112,6 +153,15 @@ class SocketClient:
                     print(f"   {partes[2]}")
                     print(f"   Saldo inicial: ${partes[3]}")
 
+                elif partes[1].startswith('Resumen'):
+                    print(f"   {partes[1]}:")
+                    print(f"   {'Periodo':<12} {'Depósitos':<12} {'Retiros':<12} {'Enviadas':<12} {'Recibidas':<12} {'Num':<5}")
+                    print(f"   {'-'*70}")
+                    for i in range(2, len(partes), 6):
+                        if i + 5 < len(partes):
+                            print(f"   {partes[i]:<12} ${partes[i+1]:<11} ${partes[i+2]:<11} "
+                                  f"${partes[i+3]:<11} ${partes[i+4]:<11} {partes[i+5]:<5}")
+
                 elif partes[1] == 'Sin transacciones':
                     print(f"   Sin transacciones registradas")
 
@@ -122,11 +172,11 @@ class SocketClient:
                 else:
                     # HISTORIAL o múltiples partes
                     print(f"   Historial de transacciones:")
-                    print(f"   {'Tipo':<10} {'Monto':<12} {'Saldo Final':<12} {'Fecha':<20}")
-                    print(f"   {'-'*54}")
-                    for i in range(1, len(partes), 4):
-                        if i + 3 < len(partes):
-                            print(f"   {partes[i]:<10} ${partes[i+1]:<11} ${partes[i+2]:<11} {partes[i+3]:<20}")
+                    print(f"   {'ID':<8} {'Tipo':<22} {'Monto':<12} {'Saldo Final':<12} {'Fecha':<20}")
+                    print(f"   {'-'*76}")
+                    for i in range(1, len(partes), 5):
+                        if i + 4 < len(partes):
+                            print(f"   {partes[i]:<8} {partes[i+1]:<22} ${partes[i+2]:<11} ${partes[i+3]:<11} {partes[i+4]:<20}")
 
         else:  # ERROR
             print(f"❌ Error: {partes[1] if len(partes) > 1 else respuesta}")
@@ -151,6 +201,7 @@ def test_automatico(client):
         ("CREAR 1234567890 Juan Pérez 500", "Crear nuevo cliente"),
         ("CONSULTA 1234567890", "Consultar nuevo cliente"),
         ("HISTORIAL 1315151515", "Ver historial de transacciones"),
+        ("SUMMARY 1315151515 MENSUAL", "Ver resumen mensual"),
         ("STATS", "Ver estadísticas del servidor"),
     ]
 
@@ -167,11 +218,16 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Cliente del Sistema Bancario')
     parser.add_argument('--host', default='localhost', help='Host del servidor')
     parser.add_argument('--port', type=int, default=5000, help='Puerto del servidor')
+    parser.add_argument('--servers', help='Varios servidores host:puerto separados por comas')
     parser.add_argument('--test', action='store_true', help='Ejecutar pruebas automáticas')
 
     args = parser.parse_args()
 
-    client = SocketClient(args.host, args.port)
+    servidores = None
+    if args.servers:
+        from socket_balancer import parsear_backends
+        servidores = parsear_backends(args.servers, args.port)
+    client = SocketClient(args.host, args.port, servidores)
 
     if client.connect():
         if args.test:
@@ -0,0 +1,339 @@
+"""
+Pool de Conexiones al Servidor Socket
+Mantiene conexiones TCP persistentes para que cada comando no pague
+connect + BIENVENIDO + creación de hilo en el servidor
+
+- Conexiones reutilizadas (LIFO) con límite máximo
+- Verificación de salud al tomar una conexión (cierre remoto, inactividad, PING)
+- Reintento con conexión nueva para comandos idempotentes
+- Respuestas enmarcadas: una línea por comando (terminada en \n) y BATCH con
+  longitud declarada; lo que sobra de un recv queda en el buffer de la conexión
+- Una conexión con bytes sin leer al devolverla se descarta: esos bytes
+  llegarían como respuesta del próximo comando
+- BATCH: varios comandos en un solo viaje, con respuesta de longitud declarada
+- Métricas del pool
+- Spans de traza (toma de conexión, conexión nueva, viaje) y prefijo TRACE
+  en los comandos cuando hay una traza en curso
+"""
+
+import logging
+import select
+import socket
+import threading
+import time
+from collections import deque
+
+import tracing
+
+
+# Comandos que se pueden repetir sin efectos secundarios
+COMANDOS_IDEMPOTENTES = {'CONSULTA', 'HISTORIAL', 'SUMMARY', 'STATS', 'PING'}
+
+
+def es_idempotente(comando):
+    """Indica si un comando del protocolo se puede reintentar"""
+    partes = comando.split(None, 1)
+    return bool(partes) and partes[0].upper() in COMANDOS_IDEMPOTENTES
+
+
+class PoolTimeoutError(Exception):
+    """No se liberó ninguna conexión dentro del tiempo de espera"""
+
+
+class BatchError(Exception):
+    """El servidor rechazó un BATCH (mensaje ERROR|... de la cabecera)"""
+
+
+class _PooledConnection:
+    """Conexión persistente con sus marcas de uso"""
+
+    def __init__(self, host, port, timeout):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buffer = b''
+        self._leer_linea()  # BIENVENIDO
+        self.creada = time.monotonic()
+        self.ultimo_uso = self.creada
+        self.usos = 0
+
+    def bytes_pendientes(self):
+        """
+        True si hay bytes sin leer: restos en el buffer, datos que el servidor
+        mandó de más o el cierre remoto (legible sin datos)
+        """
+        if self.buffer:
+            return True
+        try:
+            legibles, _, _ = select.select([self.sock], [], [], 0)
+            return bool(legibles)
+        except (OSError, ValueError):
+            return True
+
+    def _leer_linea(self):
+        """Lee hasta el fin de línea; lo que llegó después queda en el buffer"""
+        while b'\n' not in self.buffer:
+            parte = self.sock.recv(65536)
+            if not parte:
+                raise ConnectionError("El servidor cerró la conexión")
+            self.buffer += parte
+        linea, _, self.buffer = self.buffer.partition(b'\n')
+        return linea
+
+    def send_command(self, comando):
+        self.sock.sendall(comando.encode('utf-8'))
+        respuesta = self._leer_linea()
+        self.ultimo_uso = time.monotonic()
+        self.usos += 1
+        return respuesta.decode('utf-8')
+
+    def send_batch(self, comandos):
+        """
+        Envía un BATCH y retorna la lista de respuestas
+
+        Lanza BatchError si el servidor rechaza el batch; la conexión queda
+        en un estado desconocido y debe descartarse.
+        """
+        cuerpo = '\n'.join(comandos).encode('utf-8')
+        self.sock.sendall(f"BATCH {len(cuerpo)}\n".encode('utf-8') + cuerpo)
+
+        cabecera = self._leer_linea().decode('utf-8')
+        if not cabecera.startswith('OK|BATCH|'):
+            raise BatchError(cabecera)
+
+        _, _, cantidad, nbytes = cabecera.split('|')
+        nbytes = int(nbytes)
+        datos = self.buffer
+        while len(datos) < nbytes:
+            parte = self.sock.recv(65536)
+            if not parte:
+                raise ConnectionError("El servidor cerró la conexión")
+            datos += parte
+        datos, self.buffer = datos[:nbytes], datos[nbytes:]
+
+        self.ultimo_uso = time.monotonic()
+        self.usos += 1
+        respuestas = datos.decode('utf-8').split('\n')
+        if len(respuestas) != int(cantidad):
+            raise ConnectionError(f"Batch incompleto: {len(respuestas)} de {cantidad} respuestas")
+        return respuestas
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class SocketConnectionPool:
+    """
+    Pool de conexiones persistentes a un servidor socket
+
+    El protocolo no lleva identificador de petición, así que cada conexión
+    transporta una sola petición en vuelo; max_conexiones acota las peticiones
+    simultáneas hacia el servidor.
+    """
+
+    def __init__(self, host, port, max_conexiones=10, timeout=10, espera_max=5,
+                 max_inactividad=300, intervalo_ping=30):
+        """
+        Args:
+            max_conexiones: conexiones abiertas como máximo (= peticiones en vuelo)
+            timeout: timeout de socket por comando
+            espera_max: segundos esperando una conexión libre antes de fallar
+            max_inactividad: conexiones inactivas más tiempo se cierran
+            intervalo_ping: conexiones inactivas más tiempo se verifican con PING
+        """
+        self.host = host
+        self.port = port
+        self.max_conexiones = max_conexiones
+        self.timeout = timeout
+        self.espera_max = espera_max
+        self.max_inactividad = max_inactividad
+        self.intervalo_ping = intervalo_ping
+
+        self.condicion = threading.Condition()
+        self.inactivas = deque()
+        self.abiertas = 0
+
+        self.metricas = {
+            'conexiones_creadas': 0,
+            'reutilizaciones': 0,
+            'descartadas_salud': 0,
+            'fallos': 0,
+            'reintentos': 0,
+            'esperas': 0,
+            'espera_total_ms': 0.0,
+            'timeouts_pool': 0,
+            'batches': 0,
+        }
+
+    def _incrementar(self, clave, valor=1):
+        with self.condicion:
+            self.metricas[clave] += valor
+
+    def _saludable(self, conexion):
+        """Verifica una conexión inactiva antes de entregarla"""
+        inactiva = time.monotonic() - conexion.ultimo_uso
+        if inactiva > self.max_inactividad or conexion.bytes_pendientes():
+            return False
+        if inactiva > self.intervalo_ping:
+            try:
+                return conexion.send_command('PING').startswith('OK')
+            except Exception:
+                return False
+        return True
+
+    def _tomar(self):
+        """Obtiene una conexión sana del pool o crea una nueva"""
+        inicio = time.monotonic()
+        espero = False
+        while True:
+            with self.condicion:
+                while not self.inactivas and self.abiertas >= self.max_conexiones:
+                    restante = self.espera_max - (time.monotonic() - inicio)
+                    if restante <= 0:
+                        self.metricas['timeouts_pool'] += 1
+                        raise PoolTimeoutError(
+                            f"Sin conexiones libres hacia {self.host}:{self.port} tras {self.espera_max}s"
+                        )
+                    espero = True
+                    self.condicion.wait(restante)
+
+                if espero:
+                    self.metricas['esperas'] += 1
+                    self.metricas['espera_total_ms'] += (time.monotonic() - inicio) * 1000
+                    espero = False
+
+                if self.inactivas:
+                    conexion = self.inactivas.pop()
+                else:
+                    conexion = None
+                    self.abiertas += 1
+
+            if conexion is None:
+                try:
+                    with tracing.span('socket.conectar', 'CLIENT', servidor=f"{self.host}:{self.port}"):
+                        conexion = _PooledConnection(self.host, self.port, self.timeout)
+                except Exception:
+                    self._descartar(None)
+                    raise
+                self._incrementar('conexiones_creadas')
+                return conexion, False
+
+            if self._saludable(conexion):
+                self._incrementar('reutilizaciones')
+                return conexion, True
+
+            self._incrementar('descartadas_salud')
+            self._descartar(conexion)
+
+    def _tomar_trazado(self):
+        with tracing.span('socket.pool.tomar') as span:
+            conexion, reutilizada = self._tomar()
+            span.set('reutilizada', reutilizada)
+            return conexion, reutilizada
+
+    def _devolver(self, conexion):
+        if conexion.bytes_pendientes():
+            # Flujo desincronizado: no reutilizar
+            self._incrementar('descartadas_salud')
+            self._descartar(conexion)
+            return
+        with self.condicion:
+            self.inactivas.append(conexion)
+            self.condicion.notify()
+
+    def _descartar(self, conexion):
+        if conexion is not None:
+            conexion.close()
+        with self.condicion:
+            self.abiertas -= 1
+            self.condicion.notify()
+
+    def send_command(self, comando):
+        """
+        Envía un comando por una conexión del pool y retorna la respuesta
+
+        Ante un error la conexión se descarta (una respuesta tardía dejaría el
+        flujo desincronizado). Si la conexión era reutilizada y el comando es
+        idempotente, se reintenta una vez con una conexión nueva.
+        """
+        with tracing.span('socket.send', 'CLIENT', servidor=f"{self.host}:{self.port}",
+                          comando=comando.split(' ', 1)[0].upper()) as span:
+            conexion, reutilizada = self._tomar_trazado()
+            try:
+                respuesta = conexion.send_command(tracing.inyectar(comando))
+            except Exception:
+                self._incrementar('fallos')
+                self._descartar(conexion)
+                if not (reutilizada and es_idempotente(comando)):
+                    raise
+                self._incrementar('reintentos')
+                span.set('reintento', True)
+                conexion, _ = self._tomar_trazado()
+                try:
+                    respuesta = conexion.send_command(tracing.inyectar(comando))
+                except Exception:
+                    self._incrementar('fallos')
+                    self._descartar(conexion)
+                    raise
+
+            self._devolver(conexion)
+            return respuesta
+
+    def send_batch(self, comandos):
+        """
+        Envía varios comandos en un solo BATCH por una conexión del pool
+
+        Returns:
+            lista de respuestas, una por comando y en el mismo orden
+        """
+        with tracing.span('socket.send', 'CLIENT', servidor=f"{self.host}:{self.port}",
+                          comando='BATCH', comandos=len(comandos)) as span:
+            conexion, reutilizada = self._tomar_trazado()
+            try:
+                respuestas = conexion.send_batch([tracing.inyectar(c) for c in comandos])
+            except BatchError:
+                self._descartar(conexion)
+                raise
+            except Exception:
+                self._incrementar('fallos')
+                self._descartar(conexion)
+                if not (reutilizada and all(es_idempotente(c) for c in comandos)):
+                    raise
+                self._incrementar('reintentos')
+                span.set('reintento', True)
+                conexion, _ = self._tomar_trazado()
+                try:
+                    respuestas = conexion.send_batch([tracing.inyectar(c) for c in comandos])
+                except Exception:
+                    self._incrementar('fallos')
+                    self._descartar(conexion)
+                    raise
+
+            self._devolver(conexion)
+            self._incrementar('batches')
+            return respuestas
+
+    def stats(self):
+        """Métricas del pool"""
+        with self.condicion:
+            return {
+                'servidor': f"{self.host}:{self.port}",
+                'max_conexiones': self.max_conexiones,
+                'abiertas': self.abiertas,
+                'inactivas': len(self.inactivas),
+                'en_uso': self.abiertas - len(self.inactivas),
+                **self.metricas,
+                'espera_total_ms': round(self.metricas['espera_total_ms'], 1),
+            }
+
+    def close(self):
+        """Cierra las conexiones inactivas"""
+        with self.condicion:
+            conexiones = list(self.inactivas)
+            self.inactivas.clear()
+            self.abiertas -= len(conexiones)
+        for conexion in conexiones:
+            conexion.close()
+        logging.info(f"🔒 Pool hacia {self.host}:{self.port} cerrado")
@@ -5,17 +5,29 @@ Características Pro:
 - Lock por cédula para sincronización
 - Logging detallado de operaciones
 - Tabla de transacciones (historial)
+- Resúmenes diarios/mensuales precalculados
+- Cada respuesta es una línea terminada en \n (enmarcado para conexiones
+  persistentes); BATCH: varios comandos por mensaje con respuesta de
+  longitud declarada
+- Transferencias en dos fases (débito/crédito/reverso) entre servidores que
+  se reparten las cédulas con hash consistente
 - Protocolo de comandos estructurado
+- Trazas distribuidas: prefijo TRACE <traceparent> en los comandos (tracing.py)
+- Outbox MQTT opcional (MQTT_OUTBOX=1): los eventos se guardan en la misma
+  transacción de BD que el historial y los publica mqtt_outbox_relay.py
 - Control de errores robusto
 """
 
 import socket
 import threading
 import logging
+import time
+from contextlib import contextmanager
 from datetime import datetime
 from decimal import Decimal
 from db_connection import DatabaseManager
 import os
+import tracing
 
 # Importar MQTT de forma opcional
 try:
@@ -39,12 +51,27 @@ logging.basicConfig(
 class SocketServer:
     """Servidor de sockets con control de concurrencia avanzado"""
 
+    # Límites de BATCH
+    BATCH_MAX_COMANDOS = 1000
+    BATCH_MAX_BYTES = 1024 * 1024
+    BATCH_MAX_CABECERA = 64  # 'BATCH <nbytes>' sin terminador más largo que esto se rechaza
+
+    # Fases de transferencias entre servidores recordadas para reintentos
+    FASES_HANDOFF = {
+        'TRANSFERIR_DEBITO': 'DEBITO',
+        'TRANSFERIR_CREDITO': 'CREDITO',
+        'TRANSFERIR_REVERSO': 'REVERSO',
+    }
+
     def __init__(self, host='0.0.0.0', port=5000):
         self.host = host
         self.port = port
         self.server_socket = None
         self.db_manager = None
         self.mqtt_publisher = None  # Publisher MQTT
+        # Con outbox, los eventos se guardan con la transacción y los publica
+        # mqtt_outbox_relay.py; sin outbox, se publican directo (si hay broker)
+        self.outbox = os.getenv('MQTT_OUTBOX', '0') == '1'
         self.running = False
 
         # Control de concurrencia: un lock por cada cédula
@@ -67,6 +94,20 @@ class SocketServer:
                 logging.debug(f"Lock creado para cédula: {cedula}")
             return self.client_locks[cedula]
 
+    @contextmanager
+    def bloquear_cedulas(self, *cedulas):
+        """Toma los locks de las cédulas en orden (sin deadlocks) y traza la espera"""
+        ordenadas = sorted(set(cedulas))
+        locks = [self.get_client_lock(c) for c in ordenadas]
+        with tracing.span('lock.espera', cedulas=','.join(ordenadas)):
+            for lock in locks:
+                lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
     def initialize_database(self, db_config):
         """Inicializa el gestor de base de datos"""
         self.db_manager = DatabaseManager(db_config)
@@ -88,6 +129,20 @@ class SocketServer:
             logging.info("ℹ️ MQTT deshabilitado (paho-mqtt no instalado)")
             self.mqtt_publisher = None
 
+    def _eventos_outbox(self, eventos):
+        """Eventos a guardar junto con la transacción (ninguno sin MQTT_OUTBOX)"""
+        if not self.outbox:
+            return ()
+        timestamp = datetime.now().isoformat()
+        return [(tipo, {**datos, 'timestamp': timestamp}) for tipo, datos in eventos]
+
+    def _publicar_eventos(self, eventos):
+        """Sin outbox, publica los eventos directo al broker"""
+        if self.outbox or not (self.mqtt_publisher and self.mqtt_publisher.disponible):
+            return
+        for tipo, datos in eventos:
+            self.mqtt_publisher.publish_event(tipo, datos)
+
     def start(self):
         """Inicia el servidor de sockets"""
         try:
@@ -98,6 +153,20 @@ class SocketServer:
 
             self.running = True
             logging.info(f"🚀 Servidor escuchando en {self.host}:{self.port}")
+
+            retencion_fases = float(os.getenv('TRANSFER_FASES_RETENCION_S', 86400))
+            if retencion_fases > 0:
+                threading.Thread(
+                    target=self._purgar_fases_transferencia,
+                    args=(retencion_fases, float(os.getenv('TRANSFER_FASES_PURGE_S', 600))),
+                    daemon=True
+                ).start()
+            if self.mqtt_publisher:
+                threading.Thread(
+                    target=self._publicar_stats_al_cambiar,
+                    args=(float(os.getenv('MQTT_STATS_INTERVAL', 3)),),
+                    daemon=True
+                ).start()
             logging.info(f"📊 Esperando conexiones de clientes...")
 
             while self.running:
@@ -136,11 +205,24 @@ class SocketServer:
         try:
             # Enviar mensaje de bienvenida
             welcome_msg = "BIENVENIDO|Sistema Bancario Distribuido v1.0\n"
-            conn.send(welcome_msg.encode('utf-8'))
+            conn.sendall(welcome_msg.encode('utf-8'))
 
             while True:
                 # Recibir mensaje del cliente
-                data = conn.recv(4096).decode('utf-8').strip()
+                raw = conn.recv(4096)
+                while raw and len(raw) < 5 and b'BATCH'.startswith(raw):
+                    # 'BATCH' partido entre recv: completar antes de decidir
+                    parte = conn.recv(4096)
+                    if not parte:
+                        break
+                    raw += parte
+
+                if raw.startswith(b'BATCH'):
+                    # Mensaje con longitud declarada: puede ocupar varios recv
+                    conn.sendall(self.cmd_batch(conn, raw, client_id).encode('utf-8'))
+                    continue
+
+                data = raw.decode('utf-8').strip()
 
                 if not data:
                     logging.info(f"⚠️ Cliente {client_id} desconectado (sin datos)")
@@ -151,8 +233,8 @@ class SocketServer:
                 # Procesar comando
                 response = self.procesar_comando(data, client_id)
 
-                # Enviar respuesta
-                conn.send(response.encode('utf-8'))
+                # Enviar respuesta (una línea: el \n marca el fin aunque TCP la parta)
+                conn.sendall((response + '\n').encode('utf-8'))
                 logging.info(f"📤 Respuesta a {client_id} -> {response}")
 
                 # Si el comando es SALIR, cerrar conexión
@@ -169,8 +251,71 @@ class SocketServer:
                 self.stats['clientes_activos'].discard(addr[0])
             logging.info(f"🔴 Conexión cerrada con {client_id}")
 
+    def cmd_batch(self, conn, raw, client_id):
+        """
+        Ejecuta en orden varios comandos enviados en un solo mensaje
+
+        Petición:  BATCH <nbytes>\n<comando>\n<comando>...   (nbytes = bytes del cuerpo)
+        Respuesta: OK|BATCH|<n>|<nbytes>\n<respuesta>\n<respuesta>...
+                   ERROR|<mensaje>\n
+
+        Cada comando toma sus propios locks, igual que si llegara solo.
+        La cabecera puede llegar partida en varios recv; si supera
+        BATCH_MAX_CABECERA sin '\n' se responde ERROR y se cierra la conexión,
+        porque ya no se sabe dónde empieza el siguiente comando.
+        """
+        while b'\n' not in raw:
+            if len(raw) > self.BATCH_MAX_CABECERA:
+                conn.sendall(b"ERROR|Cabecera de batch sin terminador\n")
+                raise ConnectionAbortedError("Cabecera de BATCH sin terminador")
+            parte = conn.recv(4096)
+            if not parte:
+                raise ConnectionError("Conexión cerrada a mitad de la cabecera del batch")
+            raw += parte
+
+        try:
+            cabecera, _, cuerpo = raw.partition(b'\n')
+            nbytes = int(cabecera.split()[1])
+            if nbytes > self.BATCH_MAX_BYTES:
+                return f"ERROR|Batch demasiado grande (máx {self.BATCH_MAX_BYTES} bytes)\n"
+
+            while len(cuerpo) < nbytes:
+                parte = conn.recv(65536)
+                if not parte:
+                    raise ConnectionError("Conexión cerrada a mitad del batch")
+                cuerpo += parte
+
+            comandos = cuerpo[:nbytes].decode('utf-8').split('\n')
+            if len(comandos) > self.BATCH_MAX_COMANDOS:
+                return f"ERROR|Batch con más de {self.BATCH_MAX_COMANDOS} comandos\n"
+        except (IndexError, ValueError, UnicodeDecodeError) as e:
+            return f"ERROR|Batch mal formado: {e}\n"
+
+        logging.info(f"📥 Cliente {client_id} -> BATCH de {len(comandos)} comandos")
+
+        respuestas = []
+        for comando in comandos:
+            nombre = tracing.extraer(comando)[1].split(' ', 1)[0].upper()
+            if nombre in ('BATCH', 'SALIR'):
+                respuestas.append(f"ERROR|{nombre} no permitido dentro de un batch")
+            else:
+                respuestas.append(self.procesar_comando(comando.strip(), client_id))
+
+        cuerpo_respuesta = '\n'.join(respuestas).encode('utf-8')
+        return f"OK|BATCH|{len(respuestas)}|{len(cuerpo_respuesta)}\n" + cuerpo_respuesta.decode('utf-8')
+
     def procesar_comando(self, mensaje, client_id):
         """Procesa comandos del cliente y retorna respuesta"""
+        traceparent, mensaje = tracing.extraer(mensaje)
+        with tracing.continuar(traceparent):
+            with tracing.span('procesar_comando', 'SERVER',
+                              comando=mensaje.split(' ', 1)[0].upper(), cliente=client_id) as span:
+                respuesta = self._ejecutar_comando(mensaje, client_id)
+                if respuesta.startswith('ERROR'):
+                    span.marcar_error(respuesta)
+                return respuesta
+
+    def _ejecutar_comando(self, mensaje, client_id):
         try:
             partes = mensaje.split()
             if not partes:
@@ -204,13 +349,33 @@ class SocketServer:
                 monto = float(partes[3])
                 return self.cmd_transferir(cedula_origen, cedula_destino, monto, client_id)
 
+            elif comando in self.FASES_HANDOFF and len(partes) >= 5:
+                # TRANSFERIR_<FASE> <cedula> <contraparte> <monto> <id> [saldo_origen]
+                return self.cmd_transferir_fase(
+                    self.FASES_HANDOFF[comando], partes[1], partes[2], float(partes[3]), partes[4], client_id,
+                    saldo_origen=float(partes[5]) if len(partes) >= 6 else None
+                )
+
             elif comando == 'HISTORIAL' and len(partes) >= 2:
                 cedula = partes[1]
-                return self.cmd_historial(cedula, client_id)
+                # HISTORIAL <cedula> DESDE <id>: solo transacciones con id mayor
+                desde_id = int(partes[3]) if len(partes) >= 4 and partes[2].upper() == 'DESDE' else None
+                return self.cmd_historial(cedula, client_id, desde_id)
+
+            elif comando == 'SUMMARY' and len(partes) >= 2:
+                cedula = partes[1]
+                periodo = partes[2].upper() if len(partes) >= 3 else 'DIARIO'
+                if len(partes) >= 4 and not partes[3].isdigit():
+                    return "ERROR|Límite inválido (debe ser un entero positivo)"
+                limite = int(partes[3]) if len(partes) >= 4 else 30
+                return self.cmd_summary(cedula, periodo, limite, client_id)
 
             elif comando == 'SALIR':
                 return "OK|Hasta pronto"
 
+            elif comando == 'PING':
+                return "OK|PONG"
+
             elif comando == 'STATS':
                 return self.cmd_stats()
 
@@ -244,9 +409,7 @@ class SocketServer:
             return "ERROR|El monto debe ser positivo"
 
         # Control de concurrencia: lock por cédula
-        lock = self.get_client_lock(cedula)
-
-        with lock:
+        with self.bloquear_cedulas(cedula):
             try:
                 logging.info(f"🔒 Lock adquirido para cédula {cedula} - Operación DEPOSITO")
 
@@ -258,15 +421,25 @@ class SocketServer:
                 saldo_anterior = Decimal(str(cliente['saldo']))
                 nuevo_saldo = saldo_anterior + Decimal(str(monto))
 
-                # Actualizar saldo
-                self.db_manager.actualizar_saldo(cedula, float(nuevo_saldo))
-
-                # Registrar transacción
-                self.db_manager.insertar_transaccion(
-                    cedula=cedula,
-                    tipo='DEPOSITO',
-                    monto=monto,
-                    saldo_final=nuevo_saldo
+                eventos = [
+                    ('TRANSACCION', {
+                        'cedula': cedula,
+                        'tipo': 'DEPOSITO',
+                        'monto': float(monto),
+                        'saldo_nuevo': float(nuevo_saldo)
+                    }),
+                    ('SALDO', {
+                        'cedula': cedula,
+                        'saldo_nuevo': float(nuevo_saldo),
+                        'saldo_anterior': float(saldo_anterior)
+                    }),
+                ]
+
+                # Actualizar saldo y registrar la transacción (y sus eventos en el
+                # outbox); la BD rechaza la escritura si otro proceso movió el saldo
+                self.db_manager.registrar_movimientos(
+                    [(cedula, 'DEPOSITO', monto, saldo_anterior, nuevo_saldo)],
+                    eventos=self._eventos_outbox(eventos)
                 )
 
                 # Actualizar estadísticas
@@ -274,18 +447,7 @@ class SocketServer:
                     self.stats['total_transacciones'] += 1
 
                 # 🆕 Publicar evento MQTT
-                if self.mqtt_publisher and self.mqtt_publisher.connected:
-                    self.mqtt_publisher.publish_transaction(
-                        cedula=cedula,
-                        tipo='DEPOSITO',
-                        monto=float(monto),
-                        saldo_nuevo=float(nuevo_saldo)
-                    )
-                    self.mqtt_publisher.publish_balance_update(
-                        cedula=cedula,
-                        saldo_nuevo=float(nuevo_saldo),
-                        saldo_anterior=float(saldo_anterior)
-                    )
+                self._publicar_eventos(eventos)
 
                 logging.info(
                     f"💰 DEPOSITO exitoso - Cédula: {cedula}, "
@@ -307,9 +469,7 @@ class SocketServer:
             return "ERROR|El monto debe ser positivo"
 
         # Control de concurrencia: lock por cédula
-        lock = self.get_client_lock(cedula)
-
-        with lock:
+        with self.bloquear_cedulas(cedula):
             try:
                 logging.info(f"🔒 Lock adquirido para cédula {cedula} - Operación RETIRO")
 
@@ -330,15 +490,33 @@ class SocketServer:
 
                 nuevo_saldo = saldo_anterior - Decimal(str(monto))
 
-                # Actualizar saldo
-                self.db_manager.actualizar_saldo(cedula, float(nuevo_saldo))
-
-                # Registrar transacción
-                self.db_manager.insertar_transaccion(
-                    cedula=cedula,
-                    tipo='RETIRO',
-                    monto=monto,
-                    saldo_final=nuevo_saldo
+                eventos = [
+                    ('TRANSACCION', {
+                        'cedula': cedula,
+                        'tipo': 'RETIRO',
+                        'monto': float(monto),
+                        'saldo_nuevo': float(nuevo_saldo)
+                    }),
+                    ('SALDO', {
+                        'cedula': cedula,
+                        'saldo_nuevo': float(nuevo_saldo),
+                        'saldo_anterior': float(saldo_anterior)
+                    }),
+                ]
+                # Alerta si saldo bajo
+                if nuevo_saldo < Decimal('100.00'):
+                    eventos.append(('ALERTA', {
+                        'alert_type': 'LOW_BALANCE',
+                        'message': f'Saldo bajo: ${float(nuevo_saldo):.2f}',
+                        'cedula': cedula,
+                        'data': {'saldo': float(nuevo_saldo)}
+                    }))
+
+                # Actualizar saldo y registrar la transacción (y sus eventos en el
+                # outbox); la BD rechaza la escritura si otro proceso movió el saldo
+                self.db_manager.registrar_movimientos(
+                    [(cedula, 'RETIRO', monto, saldo_anterior, nuevo_saldo)],
+                    eventos=self._eventos_outbox(eventos)
                 )
 
                 # Actualizar estadísticas
@@ -346,27 +524,7 @@ class SocketServer:
                     self.stats['total_transacciones'] += 1
 
                 # 🆕 Publicar evento MQTT
-                if self.mqtt_publisher and self.mqtt_publisher.connected:
-                    self.mqtt_publisher.publish_transaction(
-                        cedula=cedula,
-                        tipo='RETIRO',
-                        monto=float(monto),
-                        saldo_nuevo=float(nuevo_saldo)
-                    )
-                    self.mqtt_publisher.publish_balance_update(
-                        cedula=cedula,
-                        saldo_nuevo=float(nuevo_saldo),
-                        saldo_anterior=float(saldo_anterior)
-                    )
-                    
-                    # Publicar alerta si saldo bajo
-                    if nuevo_saldo < Decimal('100.00'):
-                        self.mqtt_publisher.publish_alert(
-                            alert_type='LOW_BALANCE',
-                            message=f'Saldo bajo: ${float(nuevo_saldo):.2f}',
-                            cedula=cedula,
-                            data={'saldo': float(nuevo_saldo)}
-                        )
+                self._publicar_eventos(eventos)
 
                 logging.info(
                     f"💸 RETIRO exitoso - Cédula: {cedula}, "
@@ -420,76 +578,194 @@ class SocketServer:
 
     def cmd_transferir(self, cedula_origen, cedula_destino, monto, client_id):
         """Transfiere dinero entre dos cuentas"""
-        # Lock de ambas cédulas en orden para evitar deadlocks
-        cedulas_ordenadas = sorted([cedula_origen, cedula_destino])
-        lock1 = self.get_client_lock(cedulas_ordenadas[0])
-        lock2 = self.get_client_lock(cedulas_ordenadas[1])
+        if cedula_origen == cedula_destino:
+            return "ERROR|No se puede transferir a la misma cuenta"
 
         try:
-            with lock1:
-                with lock2:
-                    # Verificar que ambas cuentas existan
-                    cliente_origen = self.db_manager.consultar_cliente(cedula_origen)
-                    if not cliente_origen:
-                        return "ERROR|Cuenta origen no existe"
-
-                    cliente_destino = self.db_manager.consultar_cliente(cedula_destino)
-                    if not cliente_destino:
-                        return "ERROR|Cuenta destino no existe"
-
-                    # Verificar saldo suficiente
-                    saldo_origen = float(cliente_origen['saldo'])
-                    if saldo_origen < monto:
-                        return "ERROR|Saldo insuficiente en cuenta origen"
-
-                    # Realizar transferencia
-                    nuevo_saldo_origen = saldo_origen - monto
-                    nuevo_saldo_destino = float(cliente_destino['saldo']) + monto
-
-                    # Actualizar saldos
-                    self.db_manager.actualizar_saldo(cedula_origen, nuevo_saldo_origen)
-                    self.db_manager.actualizar_saldo(cedula_destino, nuevo_saldo_destino)
-
-                    # Registrar transacciones
-                    self.db_manager.insertar_transaccion(cedula_origen, 'TRANSFERENCIA_ENVIADA', monto, nuevo_saldo_origen)
-                    self.db_manager.insertar_transaccion(cedula_destino, 'TRANSFERENCIA_RECIBIDA', monto, nuevo_saldo_destino)
+            # Lock de ambas cédulas en orden para evitar deadlocks
+            with self.bloquear_cedulas(cedula_origen, cedula_destino):
+                # Verificar que ambas cuentas existan
+                cliente_origen = self.db_manager.consultar_cliente(cedula_origen)
+                if not cliente_origen:
+                    return "ERROR|Cuenta origen no existe"
 
-                    # Actualizar estadísticas
-                    with self.stats_lock:
-                        self.stats['total_transacciones'] += 2
+                cliente_destino = self.db_manager.consultar_cliente(cedula_destino)
+                if not cliente_destino:
+                    return "ERROR|Cuenta destino no existe"
 
-                    # Publicar a MQTT
-                    if self.mqtt_publisher and self.mqtt_publisher.connected:
-                        self.mqtt_publisher.publish_transfer(
-                            cedula_origen, cedula_destino, monto,
-                            nuevo_saldo_origen, nuevo_saldo_destino
-                        )
-                        self.mqtt_publisher.publish_balance_update(cedula_origen, nuevo_saldo_origen, saldo_origen)
-                        self.mqtt_publisher.publish_balance_update(cedula_destino, nuevo_saldo_destino, cliente_destino['saldo'])
+                # Verificar saldo suficiente
+                saldo_origen = float(cliente_origen['saldo'])
+                if saldo_origen < monto:
+                    return "ERROR|Saldo insuficiente en cuenta origen"
+
+                # Realizar transferencia
+                nuevo_saldo_origen = saldo_origen - monto
+                nuevo_saldo_destino = float(cliente_destino['saldo']) + monto
+
+                eventos = [
+                    ('TRANSFERENCIA', {
+                        'cedula_origen': cedula_origen,
+                        'cedula_destino': cedula_destino,
+                        'monto': monto,
+                        'saldo_origen': nuevo_saldo_origen,
+                        'saldo_destino': nuevo_saldo_destino
+                    }),
+                    ('SALDO', {'cedula': cedula_origen, 'saldo_nuevo': nuevo_saldo_origen, 'saldo_anterior': saldo_origen}),
+                    ('SALDO', {
+                        'cedula': cedula_destino,
+                        'saldo_nuevo': nuevo_saldo_destino,
+                        'saldo_anterior': cliente_destino['saldo']
+                    }),
+                ]
+
+                # Ambos saldos, sus transacciones y los eventos en una sola transacción de BD
+                self.db_manager.registrar_movimientos([
+                    (cedula_origen, 'TRANSFERENCIA_ENVIADA', monto, saldo_origen, nuevo_saldo_origen),
+                    (cedula_destino, 'TRANSFERENCIA_RECIBIDA', monto, cliente_destino['saldo'], nuevo_saldo_destino),
+                ], eventos=self._eventos_outbox(eventos))
 
-                    logging.info(
-                        f"🔄 TRANSFERENCIA: ${monto:.2f} de {cedula_origen} a {cedula_destino} | "
-                        f"Cliente {client_id}"
-                    )
+                # Actualizar estadísticas
+                with self.stats_lock:
+                    self.stats['total_transacciones'] += 2
 
-                    return f"OK|Transferencia exitosa|{nuevo_saldo_origen:.2f}|{nuevo_saldo_destino:.2f}"
+                # Publicar a MQTT
+                self._publicar_eventos(eventos)
+
+                logging.info(
+                    f"🔄 TRANSFERENCIA: ${monto:.2f} de {cedula_origen} a {cedula_destino} | "
+                    f"Cliente {client_id}"
+                )
+
+                return f"OK|Transferencia exitosa|{nuevo_saldo_origen:.2f}|{nuevo_saldo_destino:.2f}"
 
         except Exception as e:
             logging.error(f"❌ Error en TRANSFERIR: {e}")
             return f"ERROR|{str(e)}"
 
-    def cmd_historial(self, cedula, client_id):
-        """Obtiene el historial de transacciones de un cliente"""
+    def _registrar_fase(self, id_transferencia, fases):
+        """Registra fases sin movimiento de saldo; responde lo ya registrado si otro llegó antes"""
+        previa = self.db_manager.registrar_fase_transferencia(id_transferencia, fases)
+        return fases[0][1] if previa is None else previa[1]
+
+    def cmd_transferir_fase(self, fase, cedula, contraparte, monto, id_transferencia, client_id,
+                            saldo_origen=None):
+        """
+        Una fase de una transferencia entre cédulas de servidores distintos
+
+        - DEBITO: descuenta de la origen (cedula); contraparte = destino
+        - CREDITO: acredita a la destino (cedula); contraparte = origen.
+          Completa la transferencia: emite el evento TRANSFERENCIA, con
+          saldo_origen tal como quedó tras el débito (o el de la BD si el
+          coordinador no lo envía)
+        - REVERSO: devuelve el débito a la origen si se aplicó, y si no, lo
+          cancela para que un DEBITO tardío con el mismo id se rechace
+
+        Cada fase responde lo mismo si se repite con el mismo id, aunque el
+        reintento llegue a otro servidor: las fases se registran en la BD
+        compartida (transferencias_fases) en la misma transacción que el
+        saldo y el historial.
+        """
+        if monto <= 0:
+            return "ERROR|El monto debe ser positivo"
+
+        with self.bloquear_cedulas(cedula):
+            try:
+                previa = self.db_manager.fase_transferencia(id_transferencia, fase)
+                if previa is not None:
+                    return previa
+
+                cliente = self.db_manager.consultar_cliente(cedula)
+                if not cliente:
+                    return self._registrar_fase(id_transferencia, [(
+                        fase, "ERROR|Cuenta destino no existe" if fase == 'CREDITO' else "ERROR|Cuenta origen no existe"
+                    )])
+                saldo_anterior = Decimal(str(cliente['saldo']))
+
+                if fase == 'DEBITO':
+                    if saldo_anterior < Decimal(str(monto)):
+                        return self._registrar_fase(
+                            id_transferencia, [(fase, "ERROR|Saldo insuficiente en cuenta origen")]
+                        )
+                    nuevo_saldo = saldo_anterior - Decimal(str(monto))
+                    tipo, mensaje = 'TRANSFERENCIA_ENVIADA', 'Débito de transferencia'
+                elif fase == 'CREDITO':
+                    nuevo_saldo = saldo_anterior + Decimal(str(monto))
+                    tipo, mensaje = 'TRANSFERENCIA_RECIBIDA', 'Crédito de transferencia'
+                else:
+                    # Registrar también el DEBITO como cancelado: un DEBITO tardío,
+                    # en cualquier servidor, choca con la clave y no se aplica
+                    revertida = f"OK|Transferencia revertida|{float(saldo_anterior):.2f}"
+                    previa = self.db_manager.registrar_fase_transferencia(
+                        id_transferencia, [(fase, revertida), ('DEBITO', "ERROR|Transferencia cancelada")]
+                    )
+                    if previa is None:
+                        return revertida
+                    fase_previa, respuesta = previa
+                    if fase_previa == fase:
+                        return respuesta
+                    if not respuesta.startswith('OK'):
+                        # El débito nunca se aplicó: no hay nada que devolver
+                        return self._registrar_fase(id_transferencia, [(fase, revertida)])
+                    nuevo_saldo = saldo_anterior + Decimal(str(monto))
+                    tipo, mensaje = 'TRANSFERENCIA_RECIBIDA', 'Transferencia revertida'
+
+                respuesta = f"OK|{mensaje}|{float(nuevo_saldo):.2f}"
+                eventos = [('SALDO', {
+                    'cedula': cedula,
+                    'saldo_nuevo': float(nuevo_saldo),
+                    'saldo_anterior': float(saldo_anterior)
+                })]
+                if fase == 'CREDITO':
+                    if saldo_origen is None:
+                        origen = self.db_manager.consultar_cliente(contraparte)
+                        saldo_origen = float(origen['saldo']) if origen else 0.0
+                    # Mismo evento que un TRANSFERIR entre cédulas del mismo dueño
+                    eventos.insert(0, ('TRANSFERENCIA', {
+                        'cedula_origen': contraparte,
+                        'cedula_destino': cedula,
+                        'monto': monto,
+                        'saldo_origen': saldo_origen,
+                        'saldo_destino': float(nuevo_saldo)
+                    }))
+
+                previa = self.db_manager.registrar_fase_transferencia(
+                    id_transferencia, [(fase, respuesta)],
+                    movimiento=(cedula, tipo, monto, saldo_anterior, nuevo_saldo),
+                    eventos=self._eventos_outbox(eventos)
+                )
+                if previa is not None:
+                    # Otro servidor registró esta fase primero: aquí no se aplicó nada
+                    return previa[1]
+
+                with self.stats_lock:
+                    self.stats['total_transacciones'] += 1
+
+                self._publicar_eventos(eventos)
+
+                logging.info(
+                    f"🔄 TRANSFERENCIA {fase} {id_transferencia}: ${monto:.2f} "
+                    f"{cedula} <-> {contraparte} | "
+                    f"Saldo: ${float(saldo_anterior):.2f} -> ${float(nuevo_saldo):.2f}"
+                )
+
+                return respuesta
+
+            except Exception as e:
+                logging.error(f"❌ Error en TRANSFERIR_{fase}: {e}")
+                return f"ERROR|{str(e)}"
+
+    def cmd_historial(self, cedula, client_id, desde_id=None):
+        """Obtiene el historial de transacciones de un cliente (opcionalmente desde un id)"""
         try:
-            transacciones = self.db_manager.obtener_historial(cedula, limite=10)
+            transacciones = self.db_manager.obtener_historial(cedula, limite=10, desde_id=desde_id)
 
             if not transacciones:
                 return "OK|Sin transacciones"
 
-            # Formato: OK|TIPO|MONTO|SALDO_FINAL|FECHA;TIPO|MONTO|SALDO_FINAL|FECHA;...
+            # Formato: OK|ID|TIPO|MONTO|SALDO_FINAL|FECHA|ID|TIPO|... (del más reciente al más antiguo)
             resultado = "OK"
             for tx in transacciones:
-                resultado += f"|{tx['tipo']}|{tx['monto']:.2f}|{tx['saldo_final']:.2f}|{tx['fecha']}"
+                resultado += f"|{tx['id']}|{tx['tipo']}|{tx['monto']:.2f}|{tx['saldo_final']:.2f}|{tx['fecha']}"
 
             return resultado
 
@@ -497,14 +773,72 @@ class SocketServer:
             logging.error(f"❌ Error en HISTORIAL: {e}")
             return f"ERROR|{str(e)}"
 
+    def cmd_summary(self, cedula, periodo, limite, client_id):
+        """Obtiene los totales diarios o mensuales de un cliente desde las tablas de resumen"""
+        if periodo not in ('DIARIO', 'MENSUAL'):
+            return "ERROR|Periodo inválido (use DIARIO o MENSUAL)"
+        if limite <= 0:
+            return "ERROR|El límite debe ser positivo"
+
+        try:
+            # Tope de periodos: acota el tamaño de la respuesta
+            periodos = self.db_manager.obtener_resumen(cedula, periodo, limite=min(limite, 60))
+
+            # Formato: OK|Resumen PERIODO|FECHA|DEPOSITOS|RETIROS|ENVIADAS|RECIBIDAS|NUM|...
+            resultado = f"OK|Resumen {periodo}"
+            for p in periodos:
+                resultado += (
+                    f"|{p['periodo']}|{p['total_depositos']:.2f}|{p['total_retiros']:.2f}"
+                    f"|{p['total_transferencias_enviadas']:.2f}|{p['total_transferencias_recibidas']:.2f}"
+                    f"|{p['num_transacciones']}"
+                )
+
+            return resultado
+
+        except Exception as e:
+            logging.error(f"❌ Error en SUMMARY: {e}")
+            return f"ERROR|{str(e)}"
+
+    def _datos_stats(self):
+        """Estadísticas publicables (llamar con stats_lock tomado)"""
+        datos = {
+            'clientes_conectados': self.stats['clientes_conectados'],
+            'total_transacciones': self.stats['total_transacciones'],
+            'ips_activas': len(self.stats['clientes_activos'])
+        }
+        if self.mqtt_publisher and self.mqtt_publisher.spool is not None:
+            # Profundidad y retraso del spool MQTT (mensajes aún sin reenviar)
+            spool = self.mqtt_publisher.spool.stats()
+            datos['mqtt_spool_pendientes'] = spool['pendientes']
+            datos['mqtt_spool_retraso_s'] = spool['antiguedad_s']
+        return datos
+
+    def _publicar_stats_al_cambiar(self, intervalo):
+        """Publica estadísticas a MQTT solo cuando cambian, sin esperar un STATS"""
+        ultimo = None
+        while self.running:
+            time.sleep(intervalo)
+            with self.stats_lock:
+                stats_data = self._datos_stats()
+            if stats_data != ultimo and self.mqtt_publisher and self.mqtt_publisher.connected:
+                self.mqtt_publisher.publish_stats(stats_data)
+                ultimo = stats_data
+
+    def _purgar_fases_transferencia(self, retencion_s, intervalo):
+        """Borra periódicamente las fases de transferencias terminadas hace más de retencion_s"""
+        while self.running:
+            time.sleep(intervalo)
+            try:
+                borradas = self.db_manager.purgar_fases_transferencia(retencion_s)
+                if borradas:
+                    logging.info(f"🧹 {borradas} fases de transferencias purgadas (más de {retencion_s:g}s)")
+            except Exception as e:
+                logging.error(f"❌ Error purgando fases de transferencias: {e}")
+
     def cmd_stats(self):
         """Retorna estadísticas del servidor"""
         with self.stats_lock:
-            stats_data = {
-                'clientes_conectados': self.stats['clientes_conectados'],
-                'total_transacciones': self.stats['total_transacciones'],
-                'ips_activas': len(self.stats['clientes_activos'])
-            }
+            stats_data = self._datos_stats()
             
             # 🆕 Publicar estadísticas a MQTT
             if self.mqtt_publisher and self.mqtt_publisher.connected:
@@ -552,6 +886,8 @@ if __name__ == "__main__":
     server_host = os.getenv('SERVER_HOST', '0.0.0.0')
     server_port = int(os.getenv('SERVER_PORT', 5000))
 
+    tracing.configurar('socket-server')
+
     # Crear e iniciar servidor
     server = SocketServer(server_host, server_port)
     server.initialize_database(db_config)
@@ -0,0 +1,45 @@
+"""
+Prueba del orden de SocketBalancer.send_batch con enrutamiento por cédula
+Levanta dos servidores socket locales sobre la misma BD en memoria y verifica
+que un BATCH con cédulas de dueños distintos se ejecuta en el orden pedido.
+
+    python test_balancer_batch.py      (o con pytest)
+"""
+
+from benchmark_regression import LocalServer
+from socket_balancer import SocketBalancer
+
+
+def _cedulas_de_duenos_distintos(balancer, cuentas):
+    """Un par (x, y) de cuentas cuyo dueño en el anillo es distinto"""
+    x = cuentas[0]
+    for y in cuentas[1:]:
+        if balancer._dueno(y) is not balancer._dueno(x):
+            return x, y
+    raise AssertionError("Todas las cuentas cayeron en el mismo servidor")
+
+
+def test_batch_respeta_el_orden_entre_duenos():
+    with LocalServer(50, saldo_inicial=0) as a, LocalServer(0) as b:
+        b.server.db_manager = a.db  # ambos servidores sobre la misma BD
+        balancer = SocketBalancer(
+            [(a.server.host, a.server.port), (b.server.host, b.server.port)],
+            enrutar_por_cedula=True, intervalo_salud=0, hedge_ms=0
+        )
+        try:
+            x, y = _cedulas_de_duenos_distintos(balancer, a.cuentas)
+
+            # El depósito debe aplicarse antes de la transferencia que lo usa
+            respuestas = balancer.send_batch([f"AUMENTAR {x} 100", f"TRANSFERIR {x} {y} 100"])
+
+            assert respuestas[0] == 'OK|Depósito exitoso|100.00', respuestas
+            assert respuestas[1].startswith('OK|Transferencia exitosa'), respuestas
+            assert a.db.consultar_cliente(x)['saldo'] == 0.0
+            assert a.db.consultar_cliente(y)['saldo'] == 100.0
+        finally:
+            balancer.close()
+
+
+if __name__ == "__main__":
+    test_batch_respeta_el_orden_entre_duenos()
+    print("✅ send_batch respeta el orden entre dueños")
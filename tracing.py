@@ -0,0 +1,317 @@
+"""
+Trazas Distribuidas - Sistema Bancario
+Sigue una petición desde el bridge hasta el servidor socket, la BD y MQTT
+
+- Contexto de traza W3C (traceparent: 00-<trace_id>-<span_id>-<flags>) en
+  contextvars: cada hilo o greenlet ve solo la petición que atiende
+- Propagación por el protocolo de socket con el prefijo
+  `TRACE <traceparent> <comando>`; en MQTT, el campo `traceparent` del payload
+- Muestreo en la raíz de la traza (TRACE_SAMPLE_RATE); los demás procesos
+  respetan la decisión que llega en el traceparent
+- Spans en un archivo local (TRACE_FILE), una línea JSON por span con el
+  esquema OTLP/JSON de OpenTelemetry (resourceSpans), legible por el
+  receptor otlpjsonfile del OpenTelemetry Collector
+- Sin TRACE_FILE el trazado está apagado: cada span es un context manager vacío
+"""
+
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+
+# Tipos de span de OpenTelemetry (SpanKind)
+TIPOS = {'INTERNAL': 1, 'SERVER': 2, 'CLIENT': 3, 'PRODUCER': 4, 'CONSUMER': 5}
+
+_actual = contextvars.ContextVar('span_actual', default=None)
+
+
+def _nuevo_id(bytes_):
+    return f"{random.getrandbits(bytes_ * 8):0{bytes_ * 2}x}"
+
+
+def _valor_otlp(valor):
+    if isinstance(valor, bool):
+        return {'boolValue': valor}
+    if isinstance(valor, int):
+        return {'intValue': str(valor)}
+    if isinstance(valor, float):
+        return {'doubleValue': valor}
+    return {'stringValue': str(valor)}
+
+
+def parsear_traceparent(texto):
+    """(trace_id, span_id, muestreado) o None si el traceparent no es válido"""
+    partes = texto.strip().split('-') if texto else ()
+    if len(partes) != 4 or len(partes[1]) != 32 or len(partes[2]) != 16:
+        return None
+    try:
+        int(partes[1], 16), int(partes[2], 16)
+        muestreado = bool(int(partes[3], 16) & 1)
+    except ValueError:
+        return None
+    if partes[1] == '0' * 32 or partes[2] == '0' * 16:
+        return None
+    return partes[1], partes[2], muestreado
+
+
+class _Contexto:
+    """Padre remoto: llegó en un traceparent, no se escribe en este proceso"""
+
+    __slots__ = ('trace_id', 'span_id', 'muestreado')
+
+    def __init__(self, trace_id, span_id, muestreado):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.muestreado = muestreado
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.muestreado else '00'}"
+
+
+class Span(_Contexto):
+    """Span en curso; los atributos se pueden agregar hasta que termina"""
+
+    __slots__ = ('padre_id', 'nombre', 'tipo', 'inicio_ns', 'atributos', 'error')
+
+    def __init__(self, nombre, tipo, padre, muestreo, atributos):
+        if padre is None:
+            super().__init__(_nuevo_id(16), _nuevo_id(8), random.random() < muestreo)
+            self.padre_id = None
+        else:
+            super().__init__(padre.trace_id, _nuevo_id(8), padre.muestreado)
+            self.padre_id = padre.span_id
+        self.nombre = nombre
+        self.tipo = tipo
+        self.atributos = atributos
+        self.error = None
+        self.inicio_ns = time.time_ns()
+
+    def set(self, clave, valor):
+        self.atributos[clave] = valor
+
+    def marcar_error(self, mensaje):
+        self.error = str(mensaje)
+
+
+class _SpanNulo:
+    """Span del trazado apagado: acepta todo y no registra nada"""
+
+    muestreado = False
+
+    def set(self, clave, valor):
+        pass
+
+    def marcar_error(self, mensaje):
+        pass
+
+
+_SPAN_NULO = _SpanNulo()
+
+
+class _SinTraza:
+    """Context manager reutilizable del trazado apagado"""
+
+    def __enter__(self):
+        return _SPAN_NULO
+
+    def __exit__(self, *exc):
+        return False
+
+
+_SIN_TRAZA = _SinTraza()
+
+
+class Tracer:
+    """Crea spans y los escribe como OTLP/JSON en un archivo (una línea por span)"""
+
+    def __init__(self, servicio, archivo=None, muestreo=0.1):
+        """
+        Args:
+            servicio: service.name del recurso (bridge, socket-server...)
+            archivo: ruta del archivo de spans; None apaga el trazado
+            muestreo: fracción de trazas nuevas que se registran (0 a 1)
+        """
+        self.servicio = servicio
+        self.muestreo = muestreo
+        self.archivo = archivo
+        self.lock = threading.Lock()
+        self.fd = None
+        self.metricas = {'spans_escritos': 0, 'trazas_iniciadas': 0, 'errores_escritura': 0}
+        self.recurso = {
+            'attributes': [
+                {'key': 'service.name', 'value': {'stringValue': servicio}},
+                {'key': 'process.pid', 'value': {'intValue': str(os.getpid())}},
+            ]
+        }
+        if archivo:
+            # O_APPEND: varios procesos pueden compartir el archivo sin mezclar líneas
+            self.fd = os.open(archivo, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    @property
+    def activo(self):
+        return self.fd is not None
+
+    def span(self, nombre, tipo='INTERNAL', **atributos):
+        """Span hijo del actual (o raíz de una traza nueva) mientras dura el bloque"""
+        if self.fd is None:
+            return _SIN_TRAZA
+        return self._span(nombre, tipo, atributos)
+
+    @contextmanager
+    def _span(self, nombre, tipo, atributos):
+        padre = _actual.get()
+        span = Span(nombre, tipo, padre, self.muestreo, atributos)
+        if padre is None:
+            with self.lock:
+                self.metricas['trazas_iniciadas'] += 1
+        token = _actual.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            if span.error is None:
+                span.marcar_error(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _actual.reset(token)
+            if span.muestreado:
+                self._escribir(span, time.time_ns())
+
+    def continuar(self, traceparent):
+        """Toma como padre un contexto remoto (traceparent) mientras dura el bloque"""
+        contexto = parsear_traceparent(traceparent) if self.fd is not None and traceparent else None
+        if contexto is None:
+            return _SIN_TRAZA
+        return self._continuar(contexto)
+
+    @contextmanager
+    def _continuar(self, contexto):
+        token = _actual.set(_Contexto(*contexto))
+        try:
+            yield
+        finally:
+            _actual.reset(token)
+
+    def _escribir(self, span, fin_ns):
+        registro = {
+            'traceId': span.trace_id,
+            'spanId': span.span_id,
+            'name': span.nombre,
+            'kind': TIPOS[span.tipo],
+            'startTimeUnixNano': str(span.inicio_ns),
+            'endTimeUnixNano': str(fin_ns),
+            'attributes': [{'key': k, 'value': _valor_otlp(v)} for k, v in span.atributos.items()],
+            'status': {'code': 2, 'message': span.error} if span.error is not None else {},
+        }
+        if span.padre_id:
+            registro['parentSpanId'] = span.padre_id
+        linea = json.dumps({
+            'resourceSpans': [{
+                'resource': self.recurso,
+                'scopeSpans': [{'scope': {'name': 'banco.tracing'}, 'spans': [registro]}],
+            }]
+        }, separators=(',', ':')) + '\n'
+
+        try:
+            # Una sola escritura por línea: con O_APPEND no se intercala con otras
+            os.write(self.fd, linea.encode('utf-8'))
+            with self.lock:
+                self.metricas['spans_escritos'] += 1
+        except OSError as e:
+            with self.lock:
+                self.metricas['errores_escritura'] += 1
+            logging.warning(f"⚠️ No se pudo escribir el span {span.nombre}: {e}")
+
+    def stats(self):
+        with self.lock:
+            return {
+                'activo': self.activo,
+                'servicio': self.servicio,
+                'archivo': self.archivo,
+                'muestreo': self.muestreo,
+                **self.metricas,
+            }
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+# Tracer del proceso: apagado hasta que se llame a configurar()
+_tracer = Tracer('sistema-bancario')
+
+
+def configurar(servicio, archivo=None, muestreo=None):
+    """
+    Configura el tracer del proceso (una vez, al arrancar)
+
+    Por defecto lee TRACE_FILE y TRACE_SAMPLE_RATE del entorno.
+    """
+    global _tracer
+    archivo = archivo if archivo is not None else os.getenv('TRACE_FILE') or None
+    muestreo = muestreo if muestreo is not None else float(os.getenv('TRACE_SAMPLE_RATE', 0.1))
+    _tracer.close()
+    _tracer = Tracer(servicio, archivo, min(max(muestreo, 0.0), 1.0))
+    if archivo:
+        logging.info(f"🧭 Trazas de {servicio} en {archivo} (muestreo {_tracer.muestreo:.0%})")
+    return _tracer
+
+
+def tracer():
+    return _tracer
+
+
+def span(nombre, tipo='INTERNAL', **atributos):
+    return _tracer.span(nombre, tipo, **atributos)
+
+
+def continuar(traceparent):
+    return _tracer.continuar(traceparent)
+
+
+def trazado(nombre, tipo='INTERNAL', **atributos):
+    """Decorador: la función se ejecuta dentro de un span"""
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if _tracer.fd is None:
+                return funcion(*args, **kwargs)
+            with _tracer.span(nombre, tipo, **atributos):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def traceparent_actual(solo_muestreado=False):
+    """traceparent del span en curso, o None si no hay traza"""
+    actual = _actual.get()
+    if actual is None or (solo_muestreado and not actual.muestreado):
+        return None
+    return actual.traceparent()
+
+
+def inyectar(comando):
+    """Comando de socket con el prefijo TRACE si hay una traza en curso"""
+    traceparent = traceparent_actual()
+    return f"TRACE {traceparent} {comando}" if traceparent else comando
+
+
+def extraer(mensaje):
+    """
+    Separa el prefijo TRACE de un comando de socket
+
+    Returns:
+        (traceparent o None, comando)
+    """
+    if not mensaje.startswith('TRACE '):
+        return None, mensaje
+    partes = mensaje.split(' ', 2)
+    if len(partes) < 3:
+        return None, ''
+    return partes[1], partes[2]